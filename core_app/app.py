@@ -1,8 +1,15 @@
 import os
+import hmac
+import time
+import asyncio
 import logging
+import threading
 import datetime
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException, Depends
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -22,6 +29,11 @@ load_dotenv(ENV_PATH)
 # 導入我們的問答系統
 ## 使用絕對導入，確保在各種執行環境下都能正常工作
 from core_app.main import TrendMicroQASystem
+from core_app.rag.processors.table_store import read_table_count
+from core_app.rag.tools.metrics import MetricsRegistry, MultiprocessMetrics, PrometheusExposition, PROMETHEUS_CONTENT_TYPE
+from core_app.rag.tools.tracing import configure_tracing, span, set_attributes
+from core_app.warmup import EXAMPLE_QUESTIONS, HotAnswerRefresher, StartupWarmer, create_hot_answer_store
+from core_app.profiling import HotPathSampler, ProfileCoordinator, DEFAULT_PROFILE_INTERVAL
 
 # 設定日誌
 logging.basicConfig(
@@ -48,12 +60,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 各端點的請求數與延遲（/metrics 以 Prometheus 格式輸出）
+http_metrics = MetricsRegistry()
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    """記錄各端點的延遲、狀態碼與進行中的請求數"""
+    http_metrics.increment("in_flight")
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 以路由樣板作為標籤，未匹配的路徑合併計算，避免標籤數量無限增長
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        http_metrics.observe(endpoint, time.perf_counter() - start_time)
+        http_metrics.increment(f"{status} {endpoint}")
+        http_metrics.increment("in_flight", -1)
+
 # Pydantic 模型定義
 class QuestionRequest(BaseModel):
     """Question request model"""
     question: str = Field(..., description="User question", min_length=1, max_length=500)
     filter_type: str = Field(default="all", description="Query type: all, text, table")
     k: int = Field(default=3, description="Number of results to return", ge=1, le=10)
+    latency_budget: Optional[float] = Field(
+        default=None, description="Seconds to wait for the LLM before returning the retrieval-only answer",
+        ge=0.1, le=60
+    )
     
     class Config:
         schema_extra = {
@@ -77,6 +114,11 @@ class QuestionResponse(BaseModel):
     filter_type: str = Field(default="all", description="Query type used")
     # 新增關鍵欄位
     generation_method: str = Field(default="unknown", description="Answer generation method")
+    prompt_tokens: int = Field(default=0, description="Estimated prompt tokens sent to the LLM")
+    context_stats: Dict[str, Any] = Field(default={}, description="Prompt context budget statistics")
+    cache_hit: bool = Field(default=False, description="Whether the answer was served from the answer cache")
+    llm_pending: bool = Field(default=False, description="Whether LLM generation is still running in the background")
+    timings_ms: Dict[str, float] = Field(default={}, description="Per-stage latency of this request in milliseconds")
     llm_available: bool = Field(default=False, description="Whether LLM is available")
     system_type: str = Field(default="unknown", description="System type identifier")
     
@@ -122,6 +164,12 @@ class HealthResponse(BaseModel):
 
 # 全域變數
 qa_system = None
+hot_answer_refresher = None
+startup_warmer = None
+profile_coordinator = None
+hot_path_sampler = None
+multiprocess_metrics = None
+_metrics_flush_stop = threading.Event()
 
 def get_qa_system() -> TrendMicroQASystem:
     """取得問答系統實例"""
@@ -139,6 +187,10 @@ def get_qa_system() -> TrendMicroQASystem:
 async def startup_event():
     """應用程式啟動事件"""
     logger.info("趨勢科技進階RAG API 啟動中...")
+    # 多 worker 時每個 worker 在 fork 後各自建立 span 匯出執行緒
+    configure_tracing()
+    start_profilers()
+    start_metrics_sharing()
     try:
         # 預先初始化進階RAG系統
         qa_system = get_qa_system()
@@ -147,10 +199,83 @@ async def startup_event():
         logger.info(f"✅ 系統類型: {stats.get('system_type', 'Unknown')}")
         logger.info(f"✅ 向量數量: {stats.get('vector_count', 0)}")
         logger.info(f"✅ 支援功能: {len(stats.get('capabilities', []))}項")
+        
+        def start_hot_answers():
+            # 熱門問題答案在背景預先計算（不延遲服務啟動）；
+            # 多 worker 時只由一個 worker 呼叫 LLM，其他 worker 載入共用目錄中的結果
+            if os.getenv("RAG_HOT_ANSWERS_ENABLED", "true").lower() == "true":
+                global hot_answer_refresher
+                hot_answer_refresher = HotAnswerRefresher(qa_system, store=create_hot_answer_store())
+                hot_answer_refresher.start()
+        
+        # 預熱嵌入模型與 FAISS（完成前 /health 回報 warming），結束後才開始預先計算熱門問題
+        if os.getenv("RAG_WARMUP_ENABLED", "true").lower() == "true":
+            global startup_warmer
+            startup_warmer = StartupWarmer(qa_system, on_ready=start_hot_answers)
+            startup_warmer.start()
+        else:
+            start_hot_answers()
     except Exception as e:
         logger.error(f"進階RAG API 啟動失敗: {str(e)}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """應用程式關閉事件"""
+    if hot_answer_refresher is not None:
+        hot_answer_refresher.stop()
+    if profile_coordinator is not None:
+        profile_coordinator.stop()
+    if hot_path_sampler is not None:
+        hot_path_sampler.stop()
+    if multiprocess_metrics is not None:
+        # 結束前寫入最後的計數，彙總的總數不會因 worker 重啟而倒退
+        _metrics_flush_stop.set()
+        try:
+            multiprocess_metrics.write(collect_local_metrics())
+        except OSError as e:
+            logger.error(f"❌ 寫入 worker 指標失敗: {e}")
+
+def start_metrics_sharing():
+    """多 worker 部署時定期將此 worker 的指標寫入共用目錄（RAG_METRICS_DIR），/metrics 回傳所有 worker 的彙總"""
+    global multiprocess_metrics
+    directory = os.getenv("RAG_METRICS_DIR", "").strip()
+    if not directory:
+        return
+    multiprocess_metrics = MultiprocessMetrics(directory)
+    interval = float(os.getenv("RAG_METRICS_FLUSH_SECONDS", "5"))
+
+    def flush():
+        while not _metrics_flush_stop.wait(interval):
+            try:
+                multiprocess_metrics.write(collect_local_metrics())
+            except Exception as e:
+                logger.error(f"❌ 寫入 worker 指標失敗: {e}")
+
+    threading.Thread(target=flush, daemon=True, name="metrics-flush").start()
+    logger.info(f"✅ 多 worker 指標彙總已啟用 ({directory}，每 {interval} 秒寫入)")
+
+def start_profilers():
+    """啟動剖析相關的背景執行緒（每個 worker 各自啟動）"""
+    global profile_coordinator, hot_path_sampler
+    # 設定管理 token 時才接受剖析請求
+    if os.getenv("RAG_ADMIN_TOKEN", "").strip():
+        profile_coordinator = ProfileCoordinator(
+            poll_interval=float(os.getenv("RAG_PROFILE_POLL_SECONDS", "1.0"))
+        )
+        profile_coordinator.start()
+    if os.getenv("RAG_HOT_PATH_SAMPLER_ENABLED", "false").lower() == "true":
+        hot_path_sampler = HotPathSampler(interval=float(os.getenv("RAG_HOT_PATH_SAMPLE_INTERVAL", "0.1")))
+        hot_path_sampler.start()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """驗證管理端點的 X-Admin-Token（未設定 RAG_ADMIN_TOKEN 時管理端點停用）"""
+    expected = os.getenv("RAG_ADMIN_TOKEN", "").strip()
+    if not expected:
+        raise HTTPException(status_code=404, detail="管理端點未啟用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="管理權限驗證失敗")
+
 @app.get("/", response_model=Dict[str, str])
 async def root():
     """Root endpoint - API Information"""
@@ -163,6 +288,7 @@ async def root():
         "health": "/health",
         "examples": "/examples",
         "stats": "/stats",
+        "metrics": "/metrics",
         "info": "/info"
     }
 
@@ -181,9 +307,13 @@ async def health_check():
         llm_available = False
         llm_model = "unknown"
         
-        # 檢查環境變數
+        # 檢查環境變數（本地生成後端不需要 API Key）
+        llm_backend = os.getenv("LLM_BACKEND", "gemini").strip().lower()
+        environment["llm_backend"] = llm_backend
         api_key = os.getenv("GOOGLE_API_KEY")
-        if api_key:
+        if llm_backend != "gemini":
+            environment["api_key"] = "Not required (local generator backend)"
+        elif api_key:
             masked_key = api_key[:4] + "*" * (len(api_key) - 8) + api_key[-4:] if len(api_key) > 8 else "****"
             environment["api_key"] = f"Configured ({masked_key})"
             components["api_key"] = "healthy"
@@ -244,6 +374,12 @@ async def health_check():
         # 檢查 API 服務
         components["api_server"] = "healthy"
         
+        # 檢查檢索路徑預熱
+        if startup_warmer is not None:
+            warmup_stats = startup_warmer.get_stats()
+            environment["warmup"] = warmup_stats["status"]
+            components["warmup"] = {"failed": "warning", "warming": "warming"}.get(warmup_stats["status"], "healthy")
+        
         # 檢查記憶體使用
         try:
             import psutil
@@ -270,7 +406,7 @@ async def health_check():
             status = "healthy"
             message = "All components are running normally"
         
-        return HealthResponse(
+        response = HealthResponse(
             status=status,
             message=message,
             version=os.getenv("API_VERSION", "2.0.0"),
@@ -282,6 +418,13 @@ async def health_check():
             llm_available=llm_available,
             llm_model=llm_model
         )
+        
+        # 預熱完成前回報 503，負載平衡器只將流量導向已預熱的實例
+        if startup_warmer is not None and not startup_warmer.is_ready:
+            response.status = "warming"
+            response.message = "Warming up embedding model and vector index"
+            return JSONResponse(status_code=503, content=jsonable_encoder(response))
+        return response
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail=f"Service error: {str(e)}")
@@ -294,17 +437,24 @@ async def ask_question(request: QuestionRequest, qa_system: TrendMicroQASystem =
     - **question**: User question
     - **filter_type**: Query type (all, text, table)
     - **k**: Number of results to return
+    - **latency_budget**: Optional seconds to wait for the LLM; on timeout a retrieval-only answer is returned
+      and generation continues in the background to fill the answer cache
     - **returns**: AI generated answer and related sources with detailed stats
     """
     try:
         logger.info(f"收到問題請求: {request.question} (類型: {request.filter_type}, 結果數: {request.k})")
         
-        # 執行問答
-        result = qa_system.ask_question(
-            question=request.question,
-            filter_type=request.filter_type,
-            k=request.k
-        )
+        with span("api.ask", rag_k=request.k, rag_filter_type=request.filter_type,
+                  rag_question_length=len(request.question), rag_latency_budget=request.latency_budget) as current:
+            # 執行問答（在執行緒池中執行，避免阻塞事件迴圈，並讓相同問題的並行請求得以合併；追蹤內容隨之傳入）
+            result = await run_in_threadpool(
+                qa_system.ask_question,
+                question=request.question,
+                filter_type=request.filter_type,
+                k=request.k,
+                latency_budget=request.latency_budget
+            )
+            set_attributes(current, rag_status=result.get("status"), rag_result_count=result.get("result_count", 0))
         
         # 檢查回應狀態
         if result.get("status") == "error":
@@ -334,25 +484,17 @@ async def ask_question(request: QuestionRequest, qa_system: TrendMicroQASystem =
 @app.get("/examples", response_model=List[str])
 async def get_example_questions():
     """Get example questions list for advanced RAG system"""
-    examples = [
-        "前10大風險事件有哪些？",
-        "最常見的安全威脅是什麼？",
-        "雲端應用程式的風險",
-        "risky cloud app access",
-        "統計資料和數據分析",
-        "安全政策建議",
-        "企業面臨的主要挑戰",
-        "如何防範網路攻擊？",
-        "Microsoft Entra ID 安全問題",
-        "spam protection policy"
-    ]
-    return examples
+    return EXAMPLE_QUESTIONS
 
 @app.get("/stats", response_model=Dict[str, Any])
 async def get_system_stats(qa_system: TrendMicroQASystem = Depends(get_qa_system)):
     """Get advanced RAG system statistics"""
     try:
         stats = qa_system.get_system_stats()
+        if startup_warmer is not None:
+            stats["warmup"] = startup_warmer.get_stats()
+        if hot_path_sampler is not None:
+            stats["hot_paths"] = hot_path_sampler.get_stats()
         return stats
     except Exception as e:
         logger.error(f"獲取系統統計失敗: {str(e)}")
@@ -361,18 +503,72 @@ async def get_system_stats(qa_system: TrendMicroQASystem = Depends(get_qa_system
 def get_dynamic_table_count():
     """動態獲取表格數量"""
     try:
-        from pathlib import Path
-        import json
-        
-        table_texts_file = Path(__file__).parent / "rag" / "data" / "processed" / "table_texts.json"
-        if table_texts_file.exists():
-            with open(table_texts_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('total_tables', 0)
+        return read_table_count(Path(__file__).parent / "rag" / "data" / "processed")
     except Exception:
         pass
     return 0
 
+def collect_local_metrics() -> PrometheusExposition:
+    """此 worker 的指標（HTTP、預熱、熱路徑取樣與問答系統）"""
+    exposition = PrometheusExposition()
+    http_counters = http_metrics.counters()
+    exposition.add("rag_http_requests_total", "counter", "HTTP 請求數（依端點與狀態碼）", [
+        ({"endpoint": name.split(" ", 1)[1], "status": name.split(" ", 1)[0]}, value)
+        for name, value in sorted(http_counters.items()) if name != "in_flight"
+    ])
+    exposition.histogram("rag_http_request_duration_seconds", "HTTP 請求延遲（依端點）",
+                         http_metrics.histograms(), label="endpoint")
+    exposition.gauge("rag_http_requests_in_flight", "處理中的 HTTP 請求數", http_counters.get("in_flight", 0))
+    exposition.gauge("rag_ready", "預熱完成且可服務（1 為就緒）",
+                     1 if qa_system is not None and (startup_warmer is None or startup_warmer.is_ready) else 0)
+
+    if hot_path_sampler is not None:
+        hot_paths = hot_path_sampler.get_stats()
+        exposition.add("rag_hot_path_samples_total", "counter", "常駐取樣歸屬到各熱路徑的次數", [
+            ({"category": category}, values["samples"]) for category, values in hot_paths["categories"].items()
+        ])
+
+    if qa_system is not None:
+        try:
+            # 計數器讀取只需取鎖複製，不需移到執行緒池
+            qa_system.write_prometheus_metrics(exposition)
+        except Exception as e:
+            logger.error(f"❌ 輸出 Prometheus 指標失敗: {str(e)}")
+    return exposition
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: request rate, latency per endpoint and pipeline stage, cache hit ratio, in-flight counts and index size"""
+    exposition = collect_local_metrics()
+    if multiprocess_metrics is not None:
+        # 多 worker 時回傳所有 worker 的彙總（計數器與直方圖相加，量測值加上 worker 標籤）
+        try:
+            exposition = await run_in_threadpool(multiprocess_metrics.collect, exposition)
+        except OSError as e:
+            logger.error(f"❌ 彙總 worker 指標失敗，只回傳此 worker 的指標: {e}")
+    return PlainTextResponse(exposition.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def profile_workers(seconds: float = Query(10.0, gt=0, le=120, description="Sampling duration in seconds"),
+                          interval: float = Query(DEFAULT_PROFILE_INTERVAL, ge=0.001, le=1.0,
+                                                  description="Sampling interval in seconds")):
+    """
+    Admin only (X-Admin-Token): sample the stacks of every API worker for N seconds and
+    return them merged in collapsed-stack format (open with flamegraph.pl or speedscope)
+    """
+    if profile_coordinator is None:
+        raise HTTPException(status_code=503, detail="剖析協調器未啟動")
+    
+    run_id = profile_coordinator.request(seconds, interval)
+    # 等待所有 worker 發現請求、取樣到截止時間並寫入結果
+    await asyncio.sleep(seconds + profile_coordinator.poll_interval + 1.0)
+    collapsed, workers = profile_coordinator.collect(run_id)
+    logger.info(f"✅ 剖析 {run_id} 完成: {workers} 個 worker 回報結果")
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="profile-{run_id}.collapsed"',
+        "X-Profile-Workers": str(workers)
+    })
+
 @app.get("/info", response_model=Dict[str, Any])
 async def get_system_info():
     """Get comprehensive system information"""
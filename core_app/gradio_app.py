@@ -4,15 +4,11 @@ import requests
 import threading
 import time
 
-API_URL = "http://localhost:8000/ask"
+from core_app.warmup import SUGGESTED_QUESTIONS
 
-# 建議問題清單
-SUGGESTED_QUESTIONS = [
-    "Trend Vision One CREM 解決方案的主要目標是什麼？",
-    "CREM 如何幫助安全團隊獲得更全面的風險視圖？",
-    "CREM 如何整合不同的安全領域？",
-    "CREM 如何利用「威脅情報」和「AI」來提供其宣稱的「無與倫比的風險情報優勢」？"
-]
+API_URL = "http://localhost:8000/ask"
+# 低於請求逾時，LLM 來不及完成時 API 先回傳檢索答案
+LATENCY_BUDGET_SECONDS = 12
 
 # 儲存對話歷史
 chat_history = []
@@ -72,7 +68,7 @@ def ask_ai(question, history, status_box):
 
     def fetch():
         try:
-            response = requests.post(API_URL, json={"question": question}, timeout=15)
+            response = requests.post(API_URL, json={"question": question, "latency_budget": LATENCY_BUDGET_SECONDS}, timeout=15)
             if response.status_code == 200:
                 data = response.json()
                 answer = data.get("answer", "[無回應]")
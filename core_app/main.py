@@ -1,20 +1,30 @@
 import os
+import re
+import time
+import random
+import copy
+import math
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 from pathlib import Path
 
-# LangChain 相關導入 - 重新加入LLM支援
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-
-# 添加RAG模組路徑
-import sys
-rag_dir = Path(__file__).parent / "rag"
-sys.path.append(str(rag_dir))
-
-# 導入現有的RAG系統
-from tools.unified_query_engine import UnifiedQueryEngine
+# 導入現有的RAG系統（LangChain、嵌入模型與 Gemini 用戶端在建立對應元件時才載入）
+from core_app.rag.tools.unified_query_engine import UnifiedQueryEngine, vector_store_version
+from core_app.rag.tools.table_query_engine import StructuredTableQueryEngine
+from core_app.rag.tools.context_builder import ContextBuilder
+from core_app.rag.tools.prompt_builder import CompiledPromptTemplate, GeminiPrefixCache
+from core_app.rag.tools.single_flight import SingleFlight
+from core_app.rag.tools.answer_cache import AnswerCache
+from core_app.rag.tools.metrics import MetricsRegistry, PrometheusExposition
+from core_app.rag.tools.tracing import span, set_attributes, bind_context
+from core_app.rag.tools.generator_backends import (
+    LocalStandInLLM, LlamaCppLLM, LLM_BACKENDS, GEMINI_BACKEND, LOCAL_STAND_IN_BACKEND, LLAMA_CPP_BACKEND
+)
+from core_app.rag.processors.sentence_chunker import estimate_tokens
+from core_app.rag.processors.table_store import read_table_count
 
 # 設定日誌
 logging.basicConfig(
@@ -23,25 +33,237 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class LLMGatewayError(Exception):
+    """LLM 閘道拒絕請求（斷路器開啟或排隊逾時），呼叫端應立即改用結構化回答"""
+    pass
+
+
+class LLMGateway:
+    """
+    LLM 呼叫閘道
+    
+    - 自適應並行上限：成功時緩慢提高，遇到 429 時減半（AIMD）
+    - 429/5xx 以隨機抖動的指數退避重試
+    - 連續失敗達門檻時開啟斷路器，開啟期間直接拒絕，冷卻後放行一個試探請求
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+    RETRYABLE_MARKERS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+    
+    def __init__(self, llm, max_concurrency: int = 4, min_concurrency: int = 1,
+                 max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0,
+                 queue_timeout: float = 10.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化 LLM 閘道
+        
+        Args:
+            llm: LangChain 聊天模型
+            max_concurrency: 並行呼叫上限
+            min_concurrency: 遇到限流時並行上限的下限
+            max_retries: 429/5xx 的最大重試次數
+            base_delay: 退避的基準秒數
+            max_delay: 單次退避的最大秒數
+            queue_timeout: 等待並行名額的最長秒數
+            failure_threshold: 開啟斷路器的連續失敗次數
+            reset_timeout: 斷路器開啟後多久放行試探請求（秒）
+        """
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self._condition = threading.Condition()
+        self._limit = float(max_concurrency)
+        self._active = 0
+        
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        
+        self.metrics = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "short_circuited": 0,
+            "queue_timeouts": 0,
+            "queue_wait_total_ms": 0.0,
+            "queue_wait_max_ms": 0.0,
+            "breaker_opened": 0
+        }
+    
+    def invoke(self, prompt: str, **kwargs: Any):
+        """
+        經由閘道呼叫 LLM
+        
+        Args:
+            prompt: 送入 LLM 的 prompt
+            **kwargs: 每次呼叫的 LLM 參數（例如 cached_content），不修改共用的 LLM 物件
+        
+        Raises:
+            LLMGatewayError: 斷路器開啟或等待並行名額逾時
+            Exception: 重試後仍失敗或不可重試的 LLM 錯誤
+        """
+        probe = self._before_call()
+        try:
+            self._acquire_slot()
+        except LLMGatewayError:
+            self._release_probe(probe)
+            raise
+        
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = self.llm.invoke(prompt, **kwargs)
+                except Exception as e:
+                    status = self._status_code(e)
+                    if status == 429:
+                        self._on_rate_limited()
+                    if not self._is_retryable(e, status) or attempt == self.max_retries:
+                        self._on_failure(probe)
+                        raise
+                    
+                    with self._condition:
+                        self.metrics["retries"] += 1
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                    logger.warning(f"LLM 呼叫失敗 ({status or type(e).__name__})，{delay:.2f} 秒後重試")
+                    time.sleep(delay)
+                else:
+                    self._on_success()
+                    return result
+        finally:
+            self._release_slot()
+    
+    def _before_call(self) -> bool:
+        """檢查斷路器，回傳此請求是否為半開狀態的試探請求"""
+        with self._condition:
+            self.metrics["calls"] += 1
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            
+            if self._state == self.CLOSED:
+                return False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            
+            self.metrics["short_circuited"] += 1
+            raise LLMGatewayError("LLM 斷路器開啟中")
+    
+    def _release_probe(self, probe: bool) -> None:
+        """試探請求未實際送出時釋放試探資格"""
+        if probe:
+            with self._condition:
+                self._probe_in_flight = False
+    
+    def _acquire_slot(self) -> None:
+        """等待並行名額"""
+        start = time.perf_counter()
+        with self._condition:
+            acquired = self._condition.wait_for(
+                lambda: self._active < max(self.min_concurrency, int(self._limit)),
+                timeout=self.queue_timeout
+            )
+            wait_ms = (time.perf_counter() - start) * 1000
+            self.metrics["queue_wait_total_ms"] += wait_ms
+            self.metrics["queue_wait_max_ms"] = max(self.metrics["queue_wait_max_ms"], wait_ms)
+            if not acquired:
+                self.metrics["queue_timeouts"] += 1
+                raise LLMGatewayError(f"等待 LLM 並行名額逾時 ({self.queue_timeout} 秒)")
+            self._active += 1
+    
+    def _release_slot(self) -> None:
+        """釋放並行名額"""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+    
+    def _on_success(self) -> None:
+        """成功時重置斷路器並緩慢提高並行上限"""
+        with self._condition:
+            self.metrics["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info("✅ LLM 斷路器關閉")
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+    
+    def _on_rate_limited(self) -> None:
+        """遇到 429 時將並行上限減半"""
+        with self._condition:
+            self.metrics["rate_limited"] += 1
+            self._limit = max(float(self.min_concurrency), self._limit / 2)
+    
+    def _on_failure(self, probe: bool) -> None:
+        """失敗時累計次數，達門檻（或試探失敗）時開啟斷路器"""
+        with self._condition:
+            self.metrics["failures"] += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if probe or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.metrics["breaker_opened"] += 1
+                    logger.error(f"❌ LLM 斷路器開啟 (連續失敗 {self._consecutive_failures} 次)，"
+                                f"{self.reset_timeout} 秒內直接使用結構化回答")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    @staticmethod
+    def _status_code(error: Exception) -> Optional[int]:
+        """取得錯誤的 HTTP 狀態碼（google.api_core 的 code 或 HTTP 回應的 status_code）"""
+        for attribute in ("code", "status_code"):
+            value = getattr(error, attribute, None)
+            if isinstance(value, int):
+                return int(value)
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status
+        match = re.search(r'\b(429|5\d\d)\b', str(error))
+        return int(match.group(1)) if match else None
+    
+    def _is_retryable(self, error: Exception, status: Optional[int]) -> bool:
+        """429 與 5xx 可重試"""
+        if status is not None:
+            return status in self.RETRYABLE_STATUS
+        message = str(error).upper()
+        return any(marker in message for marker in self.RETRYABLE_MARKERS)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取閘道統計資訊"""
+        with self._condition:
+            stats = dict(self.metrics)
+            stats["breaker_state"] = self._state
+            stats["concurrency_limit"] = max(self.min_concurrency, int(self._limit))
+            stats["in_flight"] = self._active
+            admitted = stats["calls"] - stats["short_circuited"]
+            stats["queue_wait_avg_ms"] = (stats["queue_wait_total_ms"] / admitted) if admitted else 0.0
+        return stats
+
+
 class TrendMicroQASystem:
     """趨勢科技資安報告智能問答系統（完整RAG + LLM模式）"""
     
-    # 動態 CREM Prompt 模板
-    ENHANCED_CREM_PROMPT_TEMPLATE = """
+    # CREM Prompt 模板：固定的指示前綴在前（可預先編譯、由 Gemini 快取），檢索結果與問題在後
+    ENHANCED_CREM_PROMPT_PREFIX = """
 你是一個趨勢科技資安技術專家，專門回答關於 CREM (Cyber Risk Exposure Management) 和網路安全的問題。
 
 系統資訊：您正在使用一個完整的知識庫系統，基於檢索到的相關資料進行分析。
 
-基於以下檢索到的相關資料，準確回答用戶的問題：
-
-=== 檢索結果 ({result_count}個結果) ===
-{context}
-
-=== 用戶問題 ===
-{question}
-
 === 回答指導原則 ===
-1. **充分利用檢索結果**: 基於提供的{result_count}個檢索結果進行全面分析
+1. **充分利用檢索結果**: 基於提供的所有檢索結果進行全面分析
 2. **數據洞察判斷**: 檢索結果中是否包含明確的數字、統計數據、百分比、排名、圖表數據等具體量化資訊
 3. **專業術語準確**: 正確使用 CREM、CRI、Trend Vision One 等專業術語
 4. **結構化回答**: 提供清晰的摘要和詳細說明
@@ -62,10 +284,22 @@ class TrendMicroQASystem:
 [注意：只有當檢索結果明確包含數字統計、百分比、排名、圖表、數據表格等量化資訊時，才寫出此部分。如果檢索結果主要是概念說明、功能描述、定義解釋等文字內容，請直接跳過此部分，不要寫「📊 數據洞察」標題]
 
 注意：不要在回答中包含資料來源部分，系統會自動添加完整的來源信息。
+"""
+
+    ENHANCED_CREM_PROMPT_BODY = """
+基於以下檢索到的相關資料，準確回答用戶的問題：
+
+=== 檢索結果 ({result_count}個結果) ===
+{context}
+
+=== 用戶問題 ===
+{question}
 
 請開始回答：
 """
 
+    ENHANCED_CREM_PROMPT_TEMPLATE = ENHANCED_CREM_PROMPT_PREFIX + ENHANCED_CREM_PROMPT_BODY
+
     def __init__(self):
         """初始化問答系統（整合現有RAG + LLM）"""
         # 載入環境變數
@@ -78,8 +312,37 @@ class TrendMicroQASystem:
         load_dotenv(config_path)
         load_dotenv(env_path)
         
-        # 驗證 API Key（可選）
-        self.llm_available = self._check_api_key()
+        # 生成後端：gemini（預設）、local_stub（決定性模擬生成器）、llama_cpp（本地模型）
+        self.llm_backend = os.getenv("LLM_BACKEND", GEMINI_BACKEND).strip().lower()
+        if self.llm_backend not in LLM_BACKENDS:
+            logger.warning(f"⚠️ 未知的 LLM_BACKEND: {self.llm_backend}，改用 {GEMINI_BACKEND}")
+            self.llm_backend = GEMINI_BACKEND
+        
+        # 驗證 API Key（可選，只有 Gemini 後端需要）
+        self.llm_available = self._check_api_key() if self.llm_backend == GEMINI_BACKEND else True
+        
+        # 相同問題的並行請求只生成一次
+        self.single_flight = SingleFlight()
+        
+        # 已生成回答的快取（含逾時降級後在背景完成的 LLM 回答）
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256")),
+            ttl_seconds=float(os.getenv("RAG_ANSWER_CACHE_TTL_SECONDS", "600"))
+        )
+        
+        # 延遲預算：LLM 未在預算內完成時先回傳結構化答案，生成在背景繼續
+        latency_budget = os.getenv("RAG_LATENCY_BUDGET_SECONDS", "").strip()
+        self.default_latency_budget = float(latency_budget) if latency_budget else None
+        self._generation_pool = self._create_generation_pool()
+        self._speculative_lock = threading.Lock()
+        self.speculative_stats = {
+            "deadline_fallbacks": 0,
+            "background_upgrades": 0,
+            "background_failures": 0
+        }
+        
+        # 請求層級的計數與階段延遲（detect_query_type、structured_table、retrieval、prompt_build、llm、total）
+        self.metrics = MetricsRegistry()
         
         # 初始化現有RAG系統
         self._initialize_rag_system()
@@ -88,6 +351,39 @@ class TrendMicroQASystem:
         if self.llm_available:
             self._initialize_llm()
     
+    @staticmethod
+    def _create_generation_pool() -> ThreadPoolExecutor:
+        """建立 LLM 生成用的執行緒池（逾時降級後生成在此繼續）"""
+        return ThreadPoolExecutor(
+            max_workers=int(os.getenv("LLM_BACKGROUND_WORKERS", "8")),
+            thread_name_prefix="llm-generation"
+        )
+    
+    def prepare_worker(self, intra_op_threads: int) -> None:
+        """
+        多 worker 部署時，在 fork 後的每個 worker 呼叫
+        
+        設定 torch 與 FAISS 的推論執行緒數（避免 N 個 worker 各自用滿所有核心），
+        並重建不能跨 fork 共用的資源：生成執行緒池與 Gemini 的 gRPC 連線
+        
+        Args:
+            intra_op_threads: 此 worker 的推論執行緒數
+        """
+        try:
+            import torch
+            torch.set_num_threads(intra_op_threads)
+        except ImportError:
+            pass
+        try:
+            import faiss
+            faiss.omp_set_num_threads(intra_op_threads)
+        except (ImportError, AttributeError):
+            pass
+        
+        self._generation_pool = self._create_generation_pool()
+        if self.llm_available:
+            self._initialize_llm()
+    
     def _check_api_key(self) -> bool:
         """檢查 Google API Key（非強制）"""
         api_key = os.getenv("GOOGLE_API_KEY")
@@ -122,6 +418,16 @@ class TrendMicroQASystem:
             stats = self.rag_engine.get_query_stats()
             self.vector_count = stats.get('vector_count', 0)
             
+            # 結構化表格查詢引擎（表格在第一次查詢時才載入）
+            self.table_engine = None
+            if os.getenv("STRUCTURED_TABLE_QUERY", "true").lower() == "true":
+                self.table_engine = StructuredTableQueryEngine(
+                    str(current_dir / "rag" / "data" / "processed")
+                )
+            
+            # Prompt 上下文建構器（去除重複內容並控制 token 預算）
+            self.context_builder = ContextBuilder()
+            
             # 動態獲取表格數量
             self.table_count = self._get_table_count()
             self.estimated_text_count = self.vector_count - self.table_count
@@ -137,68 +443,201 @@ class TrendMicroQASystem:
     def _get_table_count(self) -> int:
         """動態獲取表格數量"""
         try:
-            table_texts_file = Path(__file__).parent / "rag" / "data" / "processed" / "table_texts.json"
-            if table_texts_file.exists():
-                import json
-                with open(table_texts_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('total_tables', 0)
+            # 從 tables_manifest.json 讀取，不需解析整份表格文本
+            return read_table_count(Path(__file__).parent / "rag" / "data" / "processed")
         except Exception as e:
             logger.warning(f"無法讀取表格數量: {e}")
         return 0
     
     def _initialize_llm(self):
-        """初始化LLM（如果API Key可用）"""
+        """初始化LLM（Gemini 需 API Key；本地後端不需外部網路）"""
         try:
-            # 從環境變數取得模型設定
-            model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
-            temperature = float(os.getenv("GEMINI_TEMPERATURE", "0.05"))
-            max_tokens = int(os.getenv("GEMINI_MAX_TOKENS", "300"))
-            
-            logger.info(f"🤖 初始化 Gemini 模型: {model_name}")
-            logger.info(f"⚙️ 溫度: {temperature}, 最大 Token: {max_tokens}")
-            
-            self.llm = ChatGoogleGenerativeAI(
-                model=model_name,
-                google_api_key=os.getenv("GOOGLE_API_KEY"),
-                temperature=temperature,
-                max_output_tokens=max_tokens
+            self.llm, self.llm_model_name = self._create_llm()
+            
+            # LLM 閘道：並行上限、重試與斷路器
+            self.llm_gateway = LLMGateway(
+                self.llm,
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+                queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10")),
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
             )
             
-            # 建立 Prompt 模板
-            self.prompt_template = PromptTemplate(
-                template=self.ENHANCED_CREM_PROMPT_TEMPLATE,
-                input_variables=["context", "question", "result_count"]
+            # 建立預先編譯的 Prompt 模板（固定前綴只組成一次）
+            self.prompt_template = CompiledPromptTemplate(
+                self.ENHANCED_CREM_PROMPT_PREFIX,
+                self.ENHANCED_CREM_PROMPT_BODY
             )
             
-            logger.info("✅ LLM 初始化成功")
+            # Gemini context caching：前綴由伺服器端快取，每次請求只送動態本體
+            self.prompt_prefix_cache = None
+            if self.llm_backend == GEMINI_BACKEND and os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true":
+                self.prompt_prefix_cache = GeminiPrefixCache(
+                    self.llm_model_name,
+                    self.prompt_template.prefix,
+                    api_key=os.getenv("GOOGLE_API_KEY"),
+                    ttl_minutes=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", "60"))
+                )
+            
+            logger.info(f"✅ LLM 初始化成功 (Prompt 前綴約 {self.prompt_template.prefix_tokens} tokens)")
             
         except Exception as e:
             logger.error(f"LLM 初始化失敗: {str(e)}")
             self.llm_available = False
     
-    def ask_question(self, question: str, filter_type: str = "all", k: int = 5) -> Dict[str, Any]:
+    def _create_llm(self) -> Tuple[Any, str]:
+        """
+        依 LLM_BACKEND 建立生成器
+        
+        Returns:
+            (生成器, 模型名稱)；生成器皆提供 invoke(prompt, **kwargs) 介面
+        """
+        # 溫度與輸出長度由所有後端共用
+        temperature = float(os.getenv("GEMINI_TEMPERATURE", "0.05"))
+        max_tokens = int(os.getenv("GEMINI_MAX_TOKENS", "300"))
+        
+        if self.llm_backend == LOCAL_STAND_IN_BACKEND:
+            logger.info("🤖 初始化本地模擬生成器（離線壓測用）")
+            llm = LocalStandInLLM(
+                latency_median=float(os.getenv("LOCAL_LLM_LATENCY_MEDIAN_SECONDS", "0.8")),
+                latency_sigma=float(os.getenv("LOCAL_LLM_LATENCY_SIGMA", "0.4")),
+                tokens_per_second=float(os.getenv("LOCAL_LLM_TOKENS_PER_SECOND", "40")),
+                max_tokens=max_tokens,
+                seed=int(os.getenv("LOCAL_LLM_SEED", "0"))
+            )
+            return llm, LOCAL_STAND_IN_BACKEND
+        
+        if self.llm_backend == LLAMA_CPP_BACKEND:
+            model_path = os.getenv("LLAMA_CPP_MODEL_PATH", "")
+            threads = os.getenv("LLAMA_CPP_THREADS", "").strip()
+            logger.info(f"🤖 初始化本地 llama.cpp 模型: {model_path}")
+            llm = LlamaCppLLM(
+                model_path,
+                n_ctx=int(os.getenv("LLAMA_CPP_CONTEXT_LENGTH", "4096")),
+                n_threads=int(threads) if threads else None,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            return llm, Path(model_path).name
+        
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        
+        model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
+        logger.info(f"🤖 初始化 Gemini 模型: {model_name}")
+        logger.info(f"⚙️ 溫度: {temperature}, 最大 Token: {max_tokens}")
+        
+        llm = ChatGoogleGenerativeAI(
+            model=model_name,
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            # 重試與退避全部由 LLMGateway 處理（0 = 用戶端只嘗試一次），
+            # 避免閘道的每次嘗試又在用戶端內重試，單一請求重複打到 Gemini
+            max_retries=0,
+            timeout=float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+        )
+        return llm, model_name
+    
+    def ask_question(self, question: str, filter_type: str = "all", k: int = 5,
+                     latency_budget: Optional[float] = None) -> Dict[str, Any]:
         """
         回答問題（完整RAG + LLM模式）
         
+        已有快取回答時直接回傳；相同問題（正規化後）、類型與結果數量的並行請求會合併，
+        只執行一次檢索與生成
+        
         Args:
             question: 使用者問題
             filter_type: 查詢類型 ("all", "text", "table")  
             k: 返回結果數量
+            latency_budget: 延遲預算（秒），LLM 未在預算內完成時先回傳結構化答案，
+                預設讀取 RAG_LATENCY_BUDGET_SECONDS（未設定時等待 LLM 完成）
             
         Returns:
             包含答案和來源的字典
         """
+        start_time = time.perf_counter()
+        self.metrics.increment("requests")
+        with span("qa.ask_question", rag_k=k, rag_filter_type=filter_type,
+                  rag_latency_budget=latency_budget) as current:
+            key = self._request_key(question, filter_type, k)
+            response = self.answer_cache.get(key)
+            shared = False
+            if response is not None:
+                response["question"] = question
+                response["cache_hit"] = True
+                response["timings_ms"] = {}
+            else:
+                if latency_budget is None:
+                    latency_budget = self.default_latency_budget
+                deadline = time.monotonic() + latency_budget if latency_budget else None
+                
+                response, shared = self.single_flight.do(
+                    key, lambda: self._answer_question(question, filter_type, k, deadline=deadline, cache_key=key)
+                )
+                if shared:
+                    response["question"] = question
+            
+            elapsed = time.perf_counter() - start_time
+            self.metrics.observe("total", elapsed)
+            response.setdefault("timings_ms", {})["total"] = round(elapsed * 1000, 3)
+            set_attributes(
+                current,
+                rag_cache_hit=response.get("cache_hit", False),
+                rag_coalesced=shared,
+                rag_detected_filter=response.get("filter_type"),
+                rag_result_count=response.get("result_count", 0),
+                rag_generation_method=response.get("generation_method"),
+                llm_prompt_tokens=response.get("prompt_tokens")
+            )
+        return response
+    
+    @staticmethod
+    def _request_key(question: str, filter_type: str, k: int) -> tuple:
+        """
+        請求的合併與快取鍵值（問題去除前後空白、合併連續空白並轉小寫）
+        
+        >>> TrendMicroQASystem._request_key("  前10大 風險事件？ ", "all", 5)
+        ('前10大 風險事件？', 'all', 5)
+        """
+        return (re.sub(r'\s+', ' ', question.strip()).lower(), filter_type, k)
+    
+    def _answer_question(self, question: str, filter_type: str, k: int,
+                         deadline: Optional[float] = None, cache_key: Optional[tuple] = None,
+                         use_llm: bool = True) -> Dict[str, Any]:
+        """
+        執行檢索與答案生成（由 ask_question 合併並行請求後呼叫）
+        
+        Args:
+            deadline: LLM 生成的截止時間（time.monotonic()），None 表示等待完成
+            cache_key: 答案快取鍵值，LLM 回答（含背景完成的回答）會寫入快取
+            use_llm: False 時只回傳檢索結果的格式化答案
+        """
+        pending_generation: Optional[Future] = None
+        # 此請求各階段的耗時（毫秒），隨回答回傳
+        timings: Dict[str, float] = {}
         try:
             logger.info(f"收到問題: {question} (類型: {filter_type})")
             
+            with self.metrics.timer("detect_query_type", timings):
+                detected_filter = self._detect_query_type(question, filter_type)
+            
+            # 表格類問題先嘗試結構化表格查詢（排名、排序、篩選、彙總可直接查表，不需 LLM）
+            if detected_filter == "table":
+                with self.metrics.timer("structured_table", timings):
+                    structured_response = self._answer_with_structured_table(question, detected_filter)
+                if structured_response is not None:
+                    structured_response["timings_ms"] = timings
+                    return structured_response
+            
             # 步驟1: 使用現有RAG檢索
-            detected_filter = self._detect_query_type(question, filter_type)
-            results = self.rag_engine.query(
-                question=question,
-                k=k,
-                filter_type=detected_filter
-            )
+            with self.metrics.timer("retrieval", timings):
+                results = self.rag_engine.query(
+                    question=question,
+                    k=k,
+                    filter_type=detected_filter
+                )
             
             if not results:
                 return {
@@ -213,42 +652,61 @@ class TrendMicroQASystem:
                     "generation_method": "fallback",
                     "system_type": "TrendMicroQASystem",  # ✅ 新增 system_type
                     "llm_available": self.llm_available,   # ✅ 新增 llm_available
-                    "vector_db_size": self.vector_count
+                    "vector_db_size": self.vector_count,
+                    "timings_ms": timings
                 }
             
-            # 步驟2: 構建context
-            context_parts = []
-            text_count = 0
-            table_count = 0
-            
-            for i, result in enumerate(results):
-                if result.content_type == "table":
-                    table_count += 1
-                    context_parts.append(f"[表格資料 {i+1}] 來源: {result.source}\n{result.content}")
-                else:
-                    text_count += 1
-                    context_parts.append(f"[文本資料 {i+1}] 來源: {result.source}\n{result.content}")
-            
-            context = "\n\n".join(context_parts)
+            # 步驟2: 構建context（去除重疊與重複內容，並依相關度截取至 token 預算內）
+            text_count = sum(1 for result in results if result.content_type != "table")
+            table_count = len(results) - text_count
+            built_context = self.context_builder.build(results)
+            prompt_tokens = 0
             
             # 步驟3: LLM生成答案（如果可用）
-            if self.llm_available and hasattr(self, 'llm'):
+            if use_llm and self.llm_available and hasattr(self, 'llm'):
+                llm_start = time.perf_counter()
                 try:
-                    prompt = self.prompt_template.format(
-                        context=context, 
-                        question=question,
-                        result_count=len(results)
-                    )
-                    response = self.llm.invoke(prompt)
-                    answer = response.content if hasattr(response, 'content') else str(response)
+                    with self.metrics.timer("prompt_build", timings):
+                        prompt, cached_content = self._build_prompt(
+                            context=built_context.text, 
+                            question=question,
+                            result_count=len(built_context.passages)
+                        )
+                    prompt_tokens = estimate_tokens(prompt)
+                    logger.info(f"📏 Prompt 估算 {prompt_tokens} tokens "
+                               f"(上下文 {built_context.tokens}/{built_context.budget}, "
+                               f"使用 {len(built_context.passages)}/{len(results)} 個結果)")
+                    if deadline is None:
+                        answer = self._invoke_llm(prompt, cached_content)
+                    else:
+                        # 背景生成的 span 仍接在此請求之下
+                        pending_generation = self._generation_pool.submit(
+                            bind_context(self._invoke_llm), prompt, cached_content
+                        )
+                        answer = pending_generation.result(timeout=max(0.0, deadline - time.monotonic()))
                     generation_method = "llm_generated"
                     
                     logger.info("✅ LLM 答案生成成功")
                     
+                except FutureTimeoutError:
+                    logger.warning("⏱️ LLM 未在延遲預算內完成，先回傳格式化答案，生成在背景繼續")
+                    answer = self._generate_structured_answer(results, question)
+                    generation_method = "structured_deadline"
+                    with self._speculative_lock:
+                        self.speculative_stats["deadline_fallbacks"] += 1
+                    
+                except LLMGatewayError as gateway_error:
+                    logger.warning(f"LLM 閘道拒絕請求，直接使用格式化答案: {gateway_error}")
+                    answer = self._generate_structured_answer(results, question)
+                    generation_method = "fallback_structured"
+                    
                 except Exception as llm_error:
                     logger.error(f"LLM 生成失敗，回退到格式化答案: {llm_error}")
                     answer = self._generate_structured_answer(results, question)
                     generation_method = "fallback_structured"
+                
+                # 此請求等待 LLM 的時間（逾時降級時為等待到截止時間為止）
+                timings["llm"] = round((time.perf_counter() - llm_start) * 1000, 3)
             else:
                 # 使用結構化格式化答案
                 answer = self._generate_structured_answer(results, question)
@@ -291,11 +749,25 @@ class TrendMicroQASystem:
                 "table_results": table_count,
                 "filter_type": detected_filter,
                 "generation_method": generation_method,
+                "prompt_tokens": prompt_tokens,
+                "context_stats": built_context.to_stats(),
                 "system_type": "TrendMicroQASystem",
                 "llm_available": self.llm_available,
-                "vector_db_size": self.vector_count
+                "vector_db_size": self.vector_count,
+                "timings_ms": timings
             }
             
+            if generation_method == "structured_deadline":
+                response["llm_pending"] = True
+            if cache_key is not None and generation_method == "llm_generated":
+                self.answer_cache.set(cache_key, response)
+            elif cache_key is not None and generation_method == "structured_deadline":
+                # 背景生成完成後以 LLM 回答取代，寫入快取供下一位提問者使用
+                snapshot = copy.deepcopy(response)
+                pending_generation.add_done_callback(
+                    lambda future: self._store_background_answer(cache_key, snapshot, future)
+                )
+            
             logger.info(f"🔍 Debug: 響應中包含 {len(response.get('citations', []))} 個citations")
             logger.info(f"問題回答完成: 找到{len(results)}個結果 (文本:{text_count}, 表格:{table_count})")
             return response
@@ -317,6 +789,210 @@ class TrendMicroQASystem:
                 "vector_db_size": getattr(self, 'vector_count', 0)
             }
     
+    def warm_up(self, text_lengths: Tuple[int, ...] = (8, 64, 256),
+                queries: Tuple[str, ...] = ("CREM", "前10大風險事件有哪些？")) -> Dict[str, Any]:
+        """
+        預熱檢索路徑，避免部署後的第一個請求承擔延遲初始化
+        
+        以不同長度的文字編碼（PyTorch 延遲初始化與執行緒池啟動）並執行幾次各類型的檢索
+        （FAISS 索引載入記憶體、BM25、重排序模型與結構化表格載入）
+        
+        Args:
+            text_lengths: 預熱編碼的文字長度（詞數）
+            queries: 預熱檢索的問題
+            
+        Returns:
+            預熱統計（耗時、編碼與檢索次數）
+        """
+        start_time = time.perf_counter()
+        embeddings = self.rag_engine.embeddings
+        for length in text_lengths:
+            embeddings.embed_query(" ".join(["風險 risk"] * max(1, length // 2)))
+        embeddings.embed_documents(["CREM 風險評估"] * 4)
+        
+        searches = 0
+        for query in queries:
+            for filter_type in ("all", "text", "table"):
+                self.rag_engine.query(query, k=3, filter_type=filter_type)
+                searches += 1
+            self._answer_with_structured_table(query, "table")
+        
+        stats = {
+            "duration_seconds": round(time.perf_counter() - start_time, 3),
+            "encodes": len(text_lengths) + 1,
+            "searches": searches
+        }
+        logger.info(f"✅ 檢索路徑預熱完成: {stats}")
+        return stats
+    
+    def warm_hot_answers(self, questions: List[str], filter_type: str = "all", k: int = 3,
+                         include_llm: bool = True) -> int:
+        """
+        預先計算熱門問題的答案並寫入答案快取
+        
+        預先計算的答案不會過期，向量資料庫版本變更時由 reload_if_vector_store_changed 清除後重算；
+        LLM 失敗而降級的答案不寫入，避免熱門問題固定拿到格式化答案
+        
+        Args:
+            questions: 熱門問題
+            filter_type: 查詢類型（需與 API 請求相同才會命中快取）
+            k: 返回結果數量（需與 API 請求相同才會命中快取）
+            include_llm: 是否以 LLM 生成答案，False 時只預先計算檢索結果的格式化答案
+            
+        Returns:
+            寫入快取的答案數量
+        """
+        warmed = self.load_hot_answers(self.compute_hot_answers(questions, filter_type, k, include_llm))
+        logger.info(f"✅ 熱門問題預先計算完成: {warmed}/{len(questions)}")
+        return warmed
+    
+    def compute_hot_answers(self, questions: List[str], filter_type: str = "all", k: int = 3,
+                            include_llm: bool = True) -> Dict[tuple, Dict[str, Any]]:
+        """
+        計算熱門問題的答案（不寫入快取，多 worker 時由一個 worker 計算後分享給其他 worker）
+        
+        Returns:
+            快取鍵值 -> 回答（LLM 失敗而降級的答案不包含在內）
+        """
+        answers = {}
+        for question in questions:
+            response = self._answer_question(question, filter_type, k, use_llm=include_llm)
+            if response.get("status") != "success" or response.get("generation_method") == "fallback_structured":
+                logger.warning(f"熱門問題預先計算未完成，改由請求時生成: {question}")
+                continue
+            answers[self._request_key(question, filter_type, k)] = response
+        return answers
+    
+    def load_hot_answers(self, answers: Dict[tuple, Dict[str, Any]]) -> int:
+        """
+        將預先計算的答案以不過期的方式寫入答案快取
+        
+        Returns:
+            寫入快取的答案數量
+        """
+        for key, response in answers.items():
+            self.answer_cache.set(key, response, ttl_seconds=math.inf)
+        return len(answers)
+    
+    def reload_if_vector_store_changed(self) -> bool:
+        """
+        向量資料庫重建後重新載入並清除答案快取
+        
+        新索引載入到新的查詢引擎後才一次替換，進行中的查詢繼續使用舊引擎
+        
+        Returns:
+            是否已重新載入
+        """
+        version = vector_store_version(str(self.rag_engine.vector_dir))
+        if version is None or version == self.rag_engine.loaded_version:
+            return False
+        
+        logger.info("🔄 向量資料庫版本變更，重新載入索引")
+        engine = UnifiedQueryEngine(
+            str(self.rag_engine.vector_dir),
+            hybrid=self.rag_engine.hybrid,
+            reranker=self.rag_engine.reranker,
+            embeddings=self.rag_engine.embeddings,
+            metrics=self.rag_engine.metrics
+        )
+        if not engine.load_vector_db():
+            logger.error("❌ 重新載入向量資料庫失敗，繼續使用目前的索引")
+            return False
+        
+        self.rag_engine = engine
+        self.vector_count = engine.get_query_stats().get('vector_count', 0)
+        self.table_count = self._get_table_count()
+        self.estimated_text_count = self.vector_count - self.table_count
+        self.answer_cache.clear()
+        logger.info(f"✅ 向量資料庫已重新載入 (向量數: {self.vector_count})，答案快取已清除")
+        return True
+    
+    def _invoke_llm(self, prompt: str, cached_content: Optional[str] = None) -> str:
+        """經由 LLM 閘道生成答案文字"""
+        invoke_kwargs = {"cached_content": cached_content} if cached_content else {}
+        with span("llm.generate", llm_backend=getattr(self, 'llm_backend', None),
+                  llm_model=getattr(self, 'llm_model_name', None), llm_cached_prefix=bool(cached_content)) as current:
+            # 記錄完整生成時間（包含逾時降級後在背景完成的生成）
+            with self.metrics.timer("llm"):
+                response = self.llm_gateway.invoke(prompt, **invoke_kwargs)
+            answer = response.content if hasattr(response, 'content') else str(response)
+            # token 估算需掃描整個 prompt，只在 span 實際記錄時計算
+            if current.is_recording():
+                set_attributes(current, llm_prompt_tokens=estimate_tokens(prompt),
+                               llm_output_tokens=estimate_tokens(answer))
+        return answer
+    
+    def _store_background_answer(self, cache_key: tuple, response: Dict[str, Any], future: Future) -> None:
+        """背景 LLM 生成完成時，將升級後的回答寫入答案快取"""
+        try:
+            answer = future.result()
+        except Exception as e:
+            logger.warning(f"背景 LLM 生成失敗，保留格式化答案: {e}")
+            with self._speculative_lock:
+                self.speculative_stats["background_failures"] += 1
+            return
+        
+        response.update(answer=answer, generation_method="llm_generated", llm_pending=False)
+        self.answer_cache.set(cache_key, response)
+        with self._speculative_lock:
+            self.speculative_stats["background_upgrades"] += 1
+        logger.info("✅ 背景 LLM 生成完成，已寫入答案快取")
+    
+    def _build_prompt(self, **values: Any) -> Tuple[str, Optional[str]]:
+        """
+        產生送入 LLM 的 prompt
+        
+        前綴已由 Gemini 快取時只送動態本體，否則送完整 prompt。
+        快取名稱隨每次呼叫傳入，不修改共用的 LLM 物件（並行請求會互相覆蓋）
+        
+        Returns:
+            (prompt, 快取名稱)；未使用快取時快取名稱為 None
+        """
+        cached_content = self.prompt_prefix_cache.get() if self.prompt_prefix_cache else None
+        if cached_content:
+            return self.prompt_template.format_body(**values), cached_content
+        return self.prompt_template.format(**values), None
+    
+    def _answer_with_structured_table(self, question: str, detected_filter: str) -> Optional[Dict[str, Any]]:
+        """以結構化表格查詢回答問題，無法確定回答時回傳 None（改用RAG檢索）"""
+        if getattr(self, 'table_engine', None) is None:
+            return None
+        
+        try:
+            result = self.table_engine.answer(question)
+        except Exception as e:
+            logger.warning(f"結構化表格查詢失敗，改用RAG檢索: {e}")
+            return None
+        
+        if result is None:
+            return None
+        
+        table = result.table
+        source = f"{Path(table.source_file).name} 第{table.page_label}頁"
+        
+        return {
+            "question": question,
+            "answer": result.answer,
+            "sources": [f"[TABLE] {source} (結構化查詢)"],
+            "citations": [{
+                "rank": 1,
+                "source": source,
+                "content_type": "table",
+                "content": result.content,
+                "confidence": float(table.confidence)
+            }],
+            "status": "success",
+            "result_count": 1,
+            "text_results": 0,
+            "table_results": 1,
+            "filter_type": detected_filter,
+            "generation_method": "structured_table",
+            "system_type": "TrendMicroQASystem",
+            "llm_available": self.llm_available,
+            "vector_db_size": self.vector_count,
+            "structured_query": result.intent.to_dict()
+        }
+    
     def _detect_query_type(self, question: str, default_filter: str) -> str:
         """智能檢測查詢類型 - 優化版"""
         if default_filter != "all":
@@ -437,14 +1113,28 @@ class TrendMicroQASystem:
                 "text_results": stats.get('text_results', 0),
                 "table_results": stats.get('table_results', 0),
                 "last_query_time": stats.get('last_query_time'),
+                "requests": self.metrics.get("requests"),
+                "latency": self.metrics.latency_summary(),
+                "retrieval_latency": stats.get('latency', {}),
+                "lexical_only_hits": stats.get('lexical_only_hits', 0),
+                "reranker": stats.get('reranker'),
+                "structured_table_queries": self.table_engine.get_stats() if getattr(self, 'table_engine', None) else None,
+                "coalesced_requests": self.single_flight.get_stats(),
+                "answer_cache": self.answer_cache.get_stats(),
+                "speculative_generation": self._get_speculative_stats(),
+                "llm_gateway": self.llm_gateway.get_stats() if hasattr(self, 'llm_gateway') else None,
+                "context_max_tokens": self.context_builder.max_tokens,
                 "llm_available": self.llm_available,
-                "llm_model": os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite") if self.llm_available else "N/A",
+                "llm_backend": self.llm_backend,
+                "llm_model": getattr(self, 'llm_model_name', "N/A") if self.llm_available else "N/A",
+                "local_generator": self.llm.get_stats() if hasattr(getattr(self, 'llm', None), 'get_stats') else None,
                 "capabilities": [
                     f"{current_vector_count}個向量完整檢索 (~{self.estimated_text_count}文本 + {self.table_count}表格)",
-                    "Gemini LLM自然語言生成" if self.llm_available else "結構化格式回答",
+                    f"{getattr(self, 'llm_model_name', 'LLM')} 自然語言生成" if self.llm_available else "結構化格式回答",
                     "多語言支援(中文/英文)",
                     "智能查詢類型檢測",
                     "表格和文本混合查詢",
+                    "結構化表格查詢（排名、排序、篩選、彙總）",
                     "置信度評估",
                     "來源追蹤"
                 ]
@@ -465,6 +1155,75 @@ class TrendMicroQASystem:
                 "capabilities": []
             }
     
+    def _get_speculative_stats(self) -> Dict[str, Any]:
+        """獲取延遲預算降級與背景生成的統計"""
+        with self._speculative_lock:
+            stats = dict(self.speculative_stats)
+        stats["default_latency_budget"] = self.default_latency_budget
+        return stats
+
+    def write_prometheus_metrics(self, exposition: PrometheusExposition) -> None:
+        """
+        將問答系統的指標寫入 Prometheus 輸出（/metrics 端點使用）
+
+        Args:
+            exposition: Prometheus 文字格式建構器
+        """
+        exposition.counter("rag_requests_total", "ask_question 請求數", self.metrics.get("requests"))
+        exposition.histogram("rag_request_stage_duration_seconds",
+                             "問答各階段延遲（detect_query_type、structured_table、retrieval、prompt_build、llm、total）",
+                             self.metrics.histograms(), label="stage")
+
+        engine_metrics = self.rag_engine.metrics
+        exposition.histogram("rag_retrieval_stage_duration_seconds",
+                             "檢索各階段延遲（embed、search、filter、rerank、format、retrieval）",
+                             engine_metrics.histograms(), label="stage")
+        exposition.counter("rag_retrieval_queries_total", "向量檢索次數", engine_metrics.get("total_queries"))
+        exposition.add("rag_retrieval_results_total", "counter", "檢索結果數", [
+            ({"content_type": "text"}, engine_metrics.get("text_results")),
+            ({"content_type": "table"}, engine_metrics.get("table_results"))
+        ])
+        exposition.counter("rag_lexical_only_hits_total", "僅由 BM25 命中的結果數", engine_metrics.get("lexical_only_hits"))
+        exposition.counter("rag_reranked_queries_total", "經重排序的查詢數", engine_metrics.get("reranked_queries"))
+        exposition.gauge("rag_vector_count", "向量資料庫的向量數", self.vector_count)
+        exposition.gauge("rag_table_vectors", "表格向量數", self.table_count)
+
+        cache_stats = self.answer_cache.get_stats()
+        exposition.add("rag_answer_cache_lookups_total", "counter", "答案快取查詢次數", [
+            ({"result": "hit"}, cache_stats["hits"]),
+            ({"result": "miss"}, cache_stats["misses"])
+        ])
+        exposition.gauge("rag_answer_cache_hit_ratio", "答案快取命中率（0-1）", cache_stats["hit_rate"] / 100)
+        exposition.gauge("rag_answer_cache_entries", "答案快取項目數", cache_stats["size"])
+
+        flight_stats = self.single_flight.get_stats()
+        exposition.counter("rag_coalesced_requests_total", "合併到執行中請求的並行請求數", flight_stats["coalesced"])
+        exposition.gauge("rag_requests_in_flight", "執行中的檢索與生成（合併後）", flight_stats["in_flight"])
+
+        if self.table_engine is not None:
+            table_stats = self.table_engine.get_stats()
+            exposition.add("rag_structured_table_queries_total", "counter", "結構化表格查詢次數", [
+                ({"result": "attempted"}, table_stats["total_queries"]),
+                ({"result": "answered"}, table_stats["answered_queries"])
+            ])
+
+        speculative = self._get_speculative_stats()
+        exposition.counter("rag_deadline_fallbacks_total", "超過延遲預算改回傳格式化答案的次數",
+                           speculative["deadline_fallbacks"])
+
+        if hasattr(self, 'llm_gateway'):
+            gateway = self.llm_gateway.get_stats()
+            exposition.gauge("rag_llm_in_flight", "進行中的 LLM 呼叫", gateway["in_flight"])
+            exposition.gauge("rag_llm_concurrency_limit", "LLM 自適應並行上限", gateway["concurrency_limit"])
+            exposition.add("rag_llm_calls_total", "counter", "LLM 閘道呼叫結果", [
+                ({"result": "success"}, gateway["successes"]),
+                ({"result": "failure"}, gateway["failures"]),
+                ({"result": "rate_limited"}, gateway["rate_limited"]),
+                ({"result": "short_circuited"}, gateway["short_circuited"])
+            ])
+            exposition.gauge("rag_llm_breaker_open", "LLM 斷路器是否開啟（1 為開啟）",
+                             0 if gateway["breaker_state"] == LLMGateway.CLOSED else 1)
+    
     def test_system_integrity(self) -> Dict[str, Any]:
         """測試系統完整性"""
         try:
@@ -0,0 +1,278 @@
+"""
+正式環境取樣剖析
+以 sys._current_frames() 定期擷取所有執行緒的呼叫堆疊，不需重新部署或安裝外部剖析器：
+- SamplingProfiler：短時間高頻取樣，輸出 collapsed stack 格式（flamegraph.pl、speedscope 可直接開啟）
+- ProfileCoordinator：多 worker 部署時以共用目錄傳遞剖析請求，每個 worker 各自取樣後合併結果
+- HotPathSampler：常駐的低頻取樣，將 CPU 時間歸屬到 clean_text、嵌入計算與 FAISS 搜尋
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+DEFAULT_HOT_PATH_INTERVAL = 0.1
+DEFAULT_PROFILE_DIR = "logs/profiles"
+
+# 堆疊最內層為這些函數時視為閒置（等待鎖、佇列、I/O 或事件迴圈），不計入 CPU 取樣
+IDLE_FUNCTIONS = frozenset({
+    "wait", "wait_for", "_wait_for_tstate_lock", "acquire", "select", "poll",
+    "accept", "recv", "recv_into", "readline", "_worker"
+})
+
+# 熱路徑分類：(模組前綴, 函數名稱)，由最內層往外找到的第一個符合分類
+HOT_PATHS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "clean_text": ((), ("clean_text",)),
+    "embedding": (("sentence_transformers",), ("embed_query", "embed_documents", "_embed_query")),
+    "faiss_search": (("faiss",), ())
+}
+
+
+def _frame_label(frame) -> str:
+    """堆疊中單一框架的標籤（模組:函數）"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    """執行緒是否在等待（最內層框架為閒置函數）"""
+    return frame.f_code.co_name in IDLE_FUNCTIONS
+
+
+def _classify(frame) -> Optional[str]:
+    """
+    由最內層往外找出框架所屬的熱路徑分類
+
+    Returns:
+        分類名稱，不屬於任何熱路徑時回傳 None
+    """
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        function = frame.f_code.co_name
+        for category, (prefixes, functions) in HOT_PATHS.items():
+            if function in functions or any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes):
+                return category
+        frame = frame.f_back
+    return None
+
+
+def _active_frames(exclude: int) -> List[Tuple[str, Any]]:
+    """目前所有非閒置執行緒的 (執行緒名稱, 最內層框架)，略過取樣執行緒本身"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return [
+        (names.get(thread_id, str(thread_id)), frame)
+        for thread_id, frame in sys._current_frames().items()
+        if thread_id != exclude and not _is_idle(frame)
+    ]
+
+
+class SamplingProfiler:
+    """短時間高頻的堆疊取樣剖析器"""
+
+    def __init__(self, interval: float = DEFAULT_PROFILE_INTERVAL):
+        """
+        初始化剖析器
+
+        Args:
+            interval: 取樣間隔（秒）
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample_once(self) -> None:
+        """擷取一次所有非閒置執行緒的堆疊"""
+        for thread_name, frame in _active_frames(exclude=threading.get_ident()):
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            # collapsed stack 由外而內，以執行緒名稱為根
+            self.stacks[";".join([thread_name] + labels[::-1])] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "SamplingProfiler":
+        """在呼叫端執行緒取樣指定秒數"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample_once()
+            time.sleep(self.interval)
+        return self
+
+    def collapsed(self, prefix: str = "") -> str:
+        """
+        collapsed stack 格式（每行「框架;框架;... 次數」）
+
+        Args:
+            prefix: 加在每個堆疊前的根框架（例如 worker 識別）
+        """
+        lines = [f"{prefix}{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+class ProfileCoordinator:
+    """
+    以共用目錄協調多個 worker 的剖析
+
+    接到請求的 worker 寫入請求檔，每個 worker 的輪詢執行緒發現新請求後各自取樣到同一截止時間，
+    結果寫入 <run_id>-<pid>.collapsed，再由接到請求的 worker 合併
+    """
+
+    def __init__(self, profile_dir: Optional[str] = None, poll_interval: float = 1.0):
+        """
+        初始化協調器
+
+        Args:
+            profile_dir: 共用目錄（預設讀取 RAG_PROFILE_DIR）
+            poll_interval: 檢查新請求的間隔（秒）
+        """
+        self.profile_dir = Path(profile_dir or os.getenv("RAG_PROFILE_DIR", DEFAULT_PROFILE_DIR))
+        self.poll_interval = poll_interval
+        self._handled: set = set()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self, seconds: float, interval: float = DEFAULT_PROFILE_INTERVAL) -> str:
+        """
+        發出剖析請求
+
+        Returns:
+            剖析編號
+        """
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        run_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        request = {"deadline": time.time() + seconds, "interval": interval}
+        (self.profile_dir / f"{run_id}.request").write_text(json.dumps(request), encoding="utf-8")
+        return run_id
+
+    def poll_once(self) -> List[threading.Thread]:
+        """檢查未處理且未過期的請求，各以一個執行緒取樣"""
+        started = []
+        if not self.profile_dir.exists():
+            return started
+        for request_file in self.profile_dir.glob("*.request"):
+            run_id = request_file.stem
+            if run_id in self._handled:
+                continue
+            self._handled.add(run_id)
+            try:
+                request = json.loads(request_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            remaining = request["deadline"] - time.time()
+            if remaining <= 0:
+                continue
+            thread = threading.Thread(
+                target=self._profile, args=(run_id, remaining, request["interval"]),
+                daemon=True, name="profile-sampler"
+            )
+            thread.start()
+            started.append(thread)
+        return started
+
+    def _profile(self, run_id: str, seconds: float, interval: float) -> None:
+        """取樣並寫入此 worker 的結果"""
+        profiler = SamplingProfiler(interval=interval).run(seconds)
+        result_file = self.profile_dir / f"{run_id}-{os.getpid()}.collapsed"
+        result_file.write_text(profiler.collapsed(prefix=f"worker-{os.getpid()};"), encoding="utf-8")
+        logger.info(f"✅ 剖析 {run_id} 完成 ({profiler.samples} 次取樣)")
+
+    def collect(self, run_id: str) -> Tuple[str, int]:
+        """
+        合併各 worker 的結果並清除剖析檔案
+
+        Returns:
+            (合併後的 collapsed stack, 回報結果的 worker 數)
+        """
+        result_files = sorted(self.profile_dir.glob(f"{run_id}-*.collapsed"))
+        merged = "".join(result_file.read_text(encoding="utf-8") for result_file in result_files)
+        for path in result_files + [self.profile_dir / f"{run_id}.request"]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        return merged, len(result_files)
+
+    def start(self) -> None:
+        """在背景執行緒輪詢剖析請求"""
+        def loop():
+            while not self._stop_event.wait(self.poll_interval):
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    logger.error(f"❌ 剖析請求輪詢失敗: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="profile-coordinator")
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止輪詢"""
+        self._stop_event.set()
+
+
+class HotPathSampler:
+    """常駐低頻取樣，估計 clean_text、嵌入計算與 FAISS 搜尋佔用的 CPU 時間"""
+
+    def __init__(self, interval: float = DEFAULT_HOT_PATH_INTERVAL):
+        """
+        初始化取樣器
+
+        Args:
+            interval: 取樣間隔（秒），每次取樣代表 interval 秒的執行時間
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample_once(self) -> None:
+        """將每個非閒置執行緒的取樣歸屬到熱路徑分類（不屬於熱路徑時計入 other）"""
+        categories = [
+            _classify(frame) or "other"
+            for _, frame in _active_frames(exclude=threading.get_ident())
+        ]
+        with self._lock:
+            self.samples.update(categories)
+
+    def start(self) -> None:
+        """在背景執行緒持續取樣"""
+        def loop():
+            while not self._stop_event.wait(self.interval):
+                self.sample_once()
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="hot-path-sampler")
+        self._thread.start()
+        logger.info(f"✅ 熱路徑取樣已啟動 (間隔: {self.interval} 秒)")
+
+    def stop(self) -> None:
+        """停止取樣"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各分類的取樣數、估計 CPU 秒數與佔比"""
+        with self._lock:
+            samples = dict(self.samples)
+        total = sum(samples.values())
+        return {
+            "interval_seconds": self.interval,
+            "total_samples": total,
+            "categories": {
+                category: {
+                    "samples": samples.get(category, 0),
+                    "estimated_seconds": round(samples.get(category, 0) * self.interval, 3),
+                    "share": round(samples.get(category, 0) / total, 4) if total else 0.0
+                }
+                for category in list(HOT_PATHS) + ["other"]
+            }
+        }
@@ -1,10 +1,22 @@
 """
 RAG (Retrieval-Augmented Generation) 系統
 包含文檔處理、表格提取、向量化和知識庫管理功能
+
+處理器與工具在第一次存取時才匯入，匯入子模組（例如查詢引擎）不會載入整個系統
 """
 
-# 導入主要功能模組
-from .processors import *
-from .tools import *
+from . import processors, tools
+
+__version__ = "1.0.0"
+
+
+def __getattr__(name):
+    """轉交處理器與工具模組的匯出名稱"""
+    for package in (processors, tools):
+        if name in package._EXPORTS:
+            return getattr(package, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__version__ = "1.0.0"
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(processors._EXPORTS) | set(tools._EXPORTS))
@@ -5,7 +5,6 @@
 
 import sys
 import time
-import json
 from pathlib import Path
 
 # 確定正確的檔案路徑
@@ -13,19 +12,17 @@ SCRIPT_DIR = Path(__file__).parent
 RAG_DIR = SCRIPT_DIR
 VECTOR_DIR = RAG_DIR / "vector_store" / "crem_faiss_index"
 
-# 添加模組路徑
-sys.path.append(str(RAG_DIR))
+# 直接以腳本執行時加入專案根目錄，以套件路徑導入
+if __package__ in (None, ""):
+    sys.path.append(str(RAG_DIR.parent.parent))
 
-from tools.unified_query_engine import UnifiedQueryEngine
+from core_app.rag.tools.unified_query_engine import UnifiedQueryEngine
+from core_app.rag.processors.table_store import read_table_count
 
 def get_table_count() -> int:
     """動態獲取表格數量"""
     try:
-        table_texts_file = RAG_DIR / "data" / "processed" / "table_texts.json"
-        if table_texts_file.exists():
-            with open(table_texts_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('total_tables', 0)
+        return read_table_count(RAG_DIR / "data" / "processed")
     except Exception as e:
         print(f"⚠️  無法讀取表格數量: {e}")
     return 0
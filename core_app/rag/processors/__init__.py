@@ -1,16 +1,36 @@
 """
 RAG 系統處理器模組
 包含文本、PDF 和表格處理功能
+
+各處理器在第一次存取時才匯入（PDF 與表格提取套件較重，查詢服務不需要）
 """
 
-from .text_processor import CREMTextProcessor
-from .pdf_processor import CREMPDFProcessor, extract_pdf_text
-from .table_extractor import AdvancedTableExtractor, TableData
-
-__all__ = [
-    'CREMTextProcessor',
-    'CREMPDFProcessor', 
-    'extract_pdf_text',
-    'AdvancedTableExtractor',
-    'TableData'
-] 
\ No newline at end of file
+import importlib
+
+_EXPORTS = {
+    'CREMTextProcessor': '.text_processor',
+    'SentenceChunker': '.sentence_chunker',
+    'estimate_tokens': '.sentence_chunker',
+    'ChunkBudgetPlanner': '.token_budget',
+    'PageCache': '.page_cache',
+    'compute_page_hashes': '.page_cache',
+    'CREMPDFProcessor': '.pdf_processor',
+    'extract_pdf_text': '.pdf_processor',
+    'AdvancedTableExtractor': '.table_extractor',
+    'TableData': '.table_extractor'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    """第一次存取時匯入對應的處理器模組"""
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
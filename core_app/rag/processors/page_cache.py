@@ -0,0 +1,212 @@
+"""
+PDF 頁面快取
+以頁面內容串流的雜湊值為鍵，快取每一頁的提取結果（文本、表格），
+讓改版後的 PDF 只需重新處理實際變更的頁面
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 快取格式版本，提取邏輯改變時遞增即可讓舊快取失效
+CACHE_VERSION = 2
+
+# 資源物件中指回上層的鍵，納入雜湊會走訪整份文件
+_SKIPPED_RESOURCE_KEYS = frozenset({"Parent"})
+
+
+def _hash_parts(parts: List[bytes]) -> str:
+    """計算多個位元組片段的雜湊值"""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for part in parts:
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _resource_parts(obj: Any, parts: List[bytes], visiting: set) -> None:
+    """
+    將 PDF 物件（含間接參照指向的物件）依內容序列化為雜湊片段
+
+    字典依鍵排序、串流取解碼後的資料，間接參照以內容展開而非物件編號，
+    因此 Form XObject（遞迴包含其 /Resources）、圖片、字型檔與編碼的任何變更都會改變雜湊
+    """
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+    from pdfminer.psparser import PSLiteral
+
+    if isinstance(obj, PDFObjRef):
+        # 循環參照只記錄標記，避免無限遞迴
+        if obj.objid in visiting:
+            parts.append(b"<cycle>")
+            return
+        visiting.add(obj.objid)
+        _resource_parts(obj.resolve(), parts, visiting)
+        visiting.discard(obj.objid)
+    elif isinstance(obj, PDFStream):
+        _resource_parts(obj.attrs, parts, visiting)
+        try:
+            parts.append(obj.get_data())
+        except Exception:
+            parts.append(obj.rawdata or b"")
+    elif isinstance(obj, dict):
+        parts.append(b"<<")
+        for key in sorted(obj):
+            if key in _SKIPPED_RESOURCE_KEYS:
+                continue
+            parts.append(str(key).encode())
+            _resource_parts(obj[key], parts, visiting)
+        parts.append(b">>")
+    elif isinstance(obj, (list, tuple)):
+        parts.append(b"[")
+        for item in obj:
+            _resource_parts(item, parts, visiting)
+        parts.append(b"]")
+    elif isinstance(obj, PSLiteral):
+        parts.append(f"/{obj.name}".encode())
+    elif isinstance(obj, bytes):
+        parts.append(obj)
+    else:
+        parts.append(repr(obj).encode())
+
+
+def page_content_hash(page) -> str:
+    """
+    計算 pdfplumber 頁面的內容雜湊值
+
+    以頁面尺寸、解碼後的內容串流（繪製文字、線條的指令）與頁面資源計算；
+    資源包含 Form XObject（遞迴）、圖片與字型（含編碼、字型檔），
+    頁面以 /Fm0 Do 繪製的內容改變時雜湊也會改變。
+    與頁碼和檔案中的物件編號無關，因此頁面在改版後移動位置仍能命中快取。
+    無法讀取內容串流時退回以頁面文本計算。
+
+    Args:
+        page: pdfplumber 的 Page 物件
+
+    Returns:
+        str: 頁面雜湊值
+    """
+    parts = [repr(tuple(page.bbox)).encode()]
+    try:
+        from pdfminer.pdftypes import resolve1
+
+        contents = resolve1(page.page_obj.contents)
+        if not isinstance(contents, list):
+            contents = [contents]
+        for stream in contents:
+            stream = resolve1(stream)
+            if stream is not None:
+                parts.append(stream.get_data())
+        _resource_parts(page.page_obj.resources, parts, set())
+    except Exception as e:
+        logger.debug(f"無法讀取頁面內容串流，改用文本計算雜湊: {e}")
+        parts = parts[:1] + [(page.extract_text() or '').encode('utf-8')]
+    return _hash_parts(parts)
+
+
+def compute_page_hashes(pdf_path: Union[str, Path]) -> Optional[List[str]]:
+    """
+    計算 PDF 每一頁的內容雜湊值
+
+    Args:
+        pdf_path: PDF 檔案路徑
+
+    Returns:
+        依頁碼排列的雜湊值列表；pdfplumber 不可用或讀取失敗時回傳 None
+    """
+    try:
+        import pdfplumber
+    except ImportError:
+        logger.warning("❌ pdfplumber 不可用，無法計算頁面雜湊")
+        return None
+
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            return [page_content_hash(page) for page in pdf.pages]
+    except Exception as e:
+        logger.warning(f"計算頁面雜湊失敗: {e}")
+        return None
+
+
+class PageCache:
+    """頁面層級快取 - 依命名空間（text、tables 等）儲存各頁的提取結果"""
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        """
+        初始化頁面快取
+
+        Args:
+            cache_dir: 快取目錄
+        """
+        self.cache_dir = Path(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, namespace: str, page_hash: str) -> Path:
+        """快取項目的檔案路徑（以雜湊前兩碼分目錄，避免單一目錄檔案過多）"""
+        return self.cache_dir / namespace / page_hash[:2] / f"{page_hash}.json"
+
+    def get(self, namespace: str, page_hash: str) -> Optional[Any]:
+        """
+        讀取快取項目
+
+        Args:
+            namespace: 命名空間
+            page_hash: 頁面雜湊值
+
+        Returns:
+            快取的值，未命中時回傳 None
+        """
+        path = self._entry_path(namespace, page_hash)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)['value']
+            self.hits += 1
+            return value
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"快取項目損毀，將重新處理: {path} ({e})")
+            self.misses += 1
+            return None
+
+    def set(self, namespace: str, page_hash: str, value: Any) -> None:
+        """
+        寫入快取項目（先寫入暫存檔再替換，避免讀到寫到一半的檔案）
+
+        Args:
+            namespace: 命名空間
+            page_hash: 頁面雜湊值
+            value: 可 JSON 序列化的值
+        """
+        path = self._entry_path(namespace, page_hash)
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                # 表格儲存格可能是 numpy 數值等型別，無法序列化時轉為字串
+                json.dump({'value': value}, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"寫入頁面快取失敗: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取快取命中統計"""
+        total = self.hits + self.misses
+        return {
+            'cache_dir': str(self.cache_dir),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / total * 100) if total > 0 else 0
+        }
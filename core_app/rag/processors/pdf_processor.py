@@ -11,6 +11,8 @@ from typing import List, Optional, Dict, Any
 from pathlib import Path
 import os
 
+from .page_cache import PageCache, page_content_hash
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,17 +20,20 @@ logger = logging.getLogger(__name__)
 class CREMPDFProcessor:
     """CREM PDF 處理器 - 專門處理趨勢科技技術文檔"""
     
-    def __init__(self, pdf_path: str):
+    def __init__(self, pdf_path: str, page_cache: Optional[PageCache] = None):
         """
         初始化 PDF 處理器
         
         Args:
             pdf_path (str): PDF 文件路徑
+            page_cache (PageCache): 頁面快取，內容未變更的頁面直接使用快取文本
         """
         self.pdf_path = Path(pdf_path)
+        self.page_cache = page_cache
         self.text_content = []
         self.total_pages = 0
         self.extracted_pages = 0
+        self.cached_pages = 0
         
         # 驗證文件存在
         if not self.pdf_path.exists():
@@ -52,13 +57,9 @@ class CREMPDFProcessor:
                 
                 for page_num, page in enumerate(pdf.pages, 1):
                     try:
-                        # 提取頁面文本
-                        text = page.extract_text()
+                        cleaned_text = self._extract_page_text(page)
                         
-                        if text and text.strip():
-                            # 清理文本
-                            cleaned_text = self._clean_page_text(text)
-                            
+                        if cleaned_text is not None:
                             # 添加頁碼標記
                             page_marker = f"=== Page {page_num} ===\n"
                             page_content = page_marker + cleaned_text + "\n\n"
@@ -78,6 +79,8 @@ class CREMPDFProcessor:
             full_text = ''.join(self.text_content)
             
             logger.info(f"文本提取完成: {self.extracted_pages}/{self.total_pages} 頁成功")
+            if self.page_cache is not None:
+                logger.info(f"頁面快取命中: {self.cached_pages}/{self.total_pages} 頁")
             logger.info(f"總文本長度: {len(full_text)} 字符")
             
             return full_text
@@ -86,6 +89,33 @@ class CREMPDFProcessor:
             logger.error(f"PDF 文本提取失敗: {str(e)}")
             raise
     
+    def _extract_page_text(self, page) -> Optional[str]:
+        """
+        提取並清理單一頁面的文本，優先使用頁面快取
+        
+        Args:
+            page: pdfplumber 的 Page 物件
+            
+        Returns:
+            Optional[str]: 清理後的文本，頁面無文本時回傳 None
+        """
+        page_hash = None
+        if self.page_cache is not None:
+            page_hash = page_content_hash(page)
+            cached = self.page_cache.get('text', page_hash)
+            if cached is not None:
+                self.cached_pages += 1
+                return cached['text']
+        
+        # 提取頁面文本
+        text = page.extract_text()
+        cleaned_text = self._clean_page_text(text) if text and text.strip() else None
+        
+        if page_hash is not None:
+            self.page_cache.set('text', page_hash, {'text': cleaned_text})
+        
+        return cleaned_text
+    
     def _clean_page_text(self, text: str) -> str:
         """
         清理頁面文本
@@ -181,6 +211,7 @@ class CREMPDFProcessor:
             "total_pages": self.total_pages,
             "extracted_pages": self.extracted_pages,
             "success_rate": (self.extracted_pages / self.total_pages * 100) if self.total_pages > 0 else 0,
+            "cached_pages": self.cached_pages,
             "total_text_length": sum(len(text) for text in self.text_content)
         }
     
@@ -248,17 +279,18 @@ class CREMPDFProcessor:
             logger.error(f"保存提取結果失敗: {str(e)}")
             raise
 
-def extract_pdf_text(pdf_path: str) -> str:
+def extract_pdf_text(pdf_path: str, page_cache: Optional[PageCache] = None) -> str:
     """
     便捷函數：提取 PDF 文本
     
     Args:
         pdf_path (str): PDF 文件路徑
+        page_cache (PageCache): 頁面快取（可選）
         
     Returns:
         str: 提取的文本內容
     """
-    processor = CREMPDFProcessor(pdf_path)
+    processor = CREMPDFProcessor(pdf_path, page_cache=page_cache)
     return processor.extract_text()
 
 def comprehensive_validation(pdf_path: str, output_dir: str = None) -> Dict[str, Any]:
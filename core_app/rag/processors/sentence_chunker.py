@@ -0,0 +1,255 @@
+"""
+句子感知分塊器
+以單次線性掃描切分中英文句子，並依 token 數量打包成符合嵌入模型長度上限的分塊
+"""
+
+import re
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# paraphrase-multilingual-MiniLM-L12-v2 的 max_seq_length 為 128，需扣除 <s> 與 </s>
+DEFAULT_MAX_TOKENS = 126
+DEFAULT_OVERLAP_TOKENS = 16
+
+# 句子結尾：CJK 全形標點直接斷句；半形標點需後接空白或文本結尾，避免切斷 "3.5"、"e.g" 等
+_SENTENCE_PATTERN = re.compile(
+    r'.+?(?:[。！？；…]+[」』”’）)]*|[.!?;]+["\'”’)\]]*(?=\s|$)|$)',
+    re.DOTALL
+)
+
+# CJK 字元範圍（假名、中日韓統一表意文字、韓文音節、相容表意文字）
+_CJK_RANGE = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+
+# token 估算：CJK 字元各計 1，拉丁詞依長度估算 word-piece 數，其餘符號各計 1
+_TOKEN_PATTERN = re.compile(
+    r'[' + _CJK_RANGE + r']'
+    r'|[A-Za-z0-9]+'
+    r'|[^\sA-Za-z0-9]'
+)
+
+# 過長句子的次級切分點：單一 CJK 字元或連續的非空白片段
+_PIECE_PATTERN = re.compile(
+    r'[' + _CJK_RANGE + r']|[^\s' + _CJK_RANGE + r']+'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 數量（不需載入 tokenizer）
+
+    Args:
+        text (str): 文本內容
+
+    Returns:
+        int: 估算的 token 數量
+
+    >>> estimate_tokens("CREM 風險")
+    3
+    >>> estimate_tokens("")
+    0
+    """
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece.isascii() and piece.isalnum():
+            # 拉丁詞大約每 4 個字元一個 word-piece
+            count += (len(piece) + 3) // 4
+        else:
+            count += 1
+    return count
+
+
+@dataclass
+class TextChunk:
+    """分塊結果資料結構"""
+    content: str
+    start: int
+    end: int
+    token_count: int
+
+
+class SentenceChunker:
+    """句子感知分塊器 - 依 token 預算打包句子，時間複雜度與文本長度成線性"""
+
+    def __init__(self,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        """
+        初始化分塊器
+
+        Args:
+            max_tokens (int): 每個分塊的 token 上限
+            overlap_tokens (int): 相鄰分塊間重疊的 token 上限（以完整句子為單位）
+            token_counter: token 計算函數，預設使用 estimate_tokens
+        """
+        if max_tokens <= 0:
+            raise ValueError("max_tokens 必須大於 0")
+        if overlap_tokens < 0 or overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens 必須介於 0 與 max_tokens 之間")
+
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.token_counter = token_counter or estimate_tokens
+
+    def split_sentences(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        切分句子，回傳每個句子在原文中的 (start, end) 位置
+
+        Args:
+            text (str): 原始文本
+
+        Yields:
+            Tuple[int, int]: 句子的起訖位置（已去除前後空白）
+        """
+        for match in _SENTENCE_PATTERN.finditer(text):
+            start, end = match.span()
+            # 去除前後空白，但保留原文位置以便直接切片
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start < end:
+                yield start, end
+
+    def _split_long_sentence(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        """
+        將超過 token 上限的句子依詞或 CJK 字元切成較小片段
+
+        Yields:
+            Tuple[int, int, int]: (start, end, token_count)
+        """
+        piece_start = None
+        piece_end = start
+        piece_tokens = 0
+
+        for match in _PIECE_PATTERN.finditer(text, start, end):
+            tokens = self.token_counter(match.group())
+            if tokens > self.max_tokens:
+                # 單一片段（沒有空白的長字串）本身就超過上限，改以固定字元視窗切分
+                if piece_start is not None:
+                    yield piece_start, piece_end, piece_tokens
+                    piece_start = None
+                    piece_tokens = 0
+                yield from self._split_by_characters(text, match.start(), match.end())
+                continue
+            if piece_start is not None and piece_tokens + tokens > self.max_tokens:
+                yield piece_start, piece_end, piece_tokens
+                piece_start = None
+                piece_tokens = 0
+            if piece_start is None:
+                piece_start = match.start()
+            piece_end = match.end()
+            piece_tokens += tokens
+
+        if piece_start is not None:
+            yield piece_start, piece_end, piece_tokens
+
+    def _split_by_characters(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        """
+        以固定字元視窗切分無法依詞切開的片段，視窗大小依 token 數縮小直到符合上限
+
+        Yields:
+            Tuple[int, int, int]: (start, end, token_count)
+        """
+        # 拉丁字元約每 4 個字元一個 token，先以此估算視窗大小
+        window = self.max_tokens * 4
+        position = start
+        while position < end:
+            size = min(window, end - position)
+            tokens = self.token_counter(text[position:position + size])
+            while tokens > self.max_tokens and size > 1:
+                size = max(1, min(size - 1, size * self.max_tokens // tokens))
+                tokens = self.token_counter(text[position:position + size])
+            yield position, position + size, tokens
+            position += size
+
+    def _iter_units(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """產生可打包的句子單位 (start, end, token_count)"""
+        for start, end in self.split_sentences(text):
+            tokens = self.token_counter(text[start:end])
+            if tokens > self.max_tokens:
+                yield from self._split_long_sentence(text, start, end)
+            else:
+                yield start, end, tokens
+
+    def chunk(self, text: str) -> List[TextChunk]:
+        """
+        將文本切分為符合 token 預算的分塊
+
+        Args:
+            text (str): 清理後的文本
+
+        Returns:
+            List[TextChunk]: 分塊列表
+
+        >>> chunker = SentenceChunker(max_tokens=8, overlap_tokens=0)
+        >>> [c.content for c in chunker.chunk("第一句。第二句。第三句。")]
+        ['第一句。第二句。', '第三句。']
+        """
+        if not text:
+            return []
+
+        chunks: List[TextChunk] = []
+        window: Deque[Tuple[int, int, int]] = deque()
+        window_tokens = 0
+        # 視窗中尚未輸出過的句子數量，避免只有重疊句子時重複輸出
+        fresh_units = 0
+
+        def emit() -> None:
+            first_start = window[0][0]
+            last_end = window[-1][1]
+            chunks.append(TextChunk(
+                content=text[first_start:last_end],
+                start=first_start,
+                end=last_end,
+                token_count=window_tokens
+            ))
+
+        for unit in self._iter_units(text):
+            unit_tokens = unit[2]
+
+            if window and window_tokens + unit_tokens > self.max_tokens:
+                if fresh_units:
+                    emit()
+                fresh_units = 0
+                # 保留尾端句子作為下一個分塊的重疊內容
+                overlap_tokens = 0
+                keep = 0
+                for _, _, tokens in reversed(window):
+                    if overlap_tokens + tokens > self.overlap_tokens:
+                        break
+                    overlap_tokens += tokens
+                    keep += 1
+                while len(window) > keep:
+                    window_tokens -= window.popleft()[2]
+                # 重疊內容加上新句子仍超出預算時，捨棄更多重疊句子
+                while window and window_tokens + unit_tokens > self.max_tokens:
+                    window_tokens -= window.popleft()[2]
+
+            window.append(unit)
+            window_tokens += unit_tokens
+            fresh_units += 1
+
+        if window and fresh_units:
+            emit()
+
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        切分文本並僅回傳分塊內容
+
+        Args:
+            text (str): 清理後的文本
+
+        Returns:
+            List[str]: 分塊內容列表
+        """
+        return [chunk.content for chunk in self.chunk(text)]
@@ -5,13 +5,19 @@
 
 import re
 import json
+import time
 import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet
 from dataclasses import dataclass, asdict
 import pandas as pd
 from datetime import datetime
 
+from .page_cache import PageCache, compute_page_hashes
+from .table_store import TableStore, DEFAULT_DB_NAME
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,10 +35,73 @@ class TableData:
     extractor_method: str
     metadata: Dict[str, Any]
 
+# 各提取策略的預設逾時秒數（平行模式下從送出工作開始計算）
+DEFAULT_STRATEGY_TIMEOUTS = {
+    'camelot_lattice': 180.0,
+    'camelot_stream': 180.0,
+    'pdfplumber': 120.0,
+    'pymupdf': 60.0,
+    'tabula': 120.0
+}
+
+# 策略名稱與所需提取器的對應
+STRATEGY_EXTRACTORS = {
+    'camelot_lattice': 'camelot',
+    'camelot_stream': 'camelot',
+    'pdfplumber': 'pdfplumber',
+    'pymupdf': 'pymupdf',
+    'tabula': 'tabula'
+}
+
+# 頁面預篩門檻：符合任一條件即視為可能含有表格的頁面
+PRESCREEN_MIN_RULING_POSITIONS = 5  # 同一延伸範圍內的平行框線位置數（裝飾框與卡片版面只有 2-4 條）
+PRESCREEN_MIN_RULING_LENGTH = 30.0  # 框線最短長度（pt），排除圖示與裝飾線條
+PRESCREEN_RULING_TOLERANCE = 3.0   # 視為同一位置的距離（pt）
+PRESCREEN_MAX_RECT_RATIO = 0.5     # 面積超過頁面此比例的矩形視為背景
+PRESCREEN_MIN_TABLE_LINES = 3      # 符合 _is_table_line 的文字行數
+PRESCREEN_MIN_NUMERIC_DENSITY = 0.2  # 含數字的詞佔所有詞的比例
+PRESCREEN_MIN_TOKENS = 20          # 計算數字密度所需的最少詞數
+
+def _count_distinct_positions(positions: List[float],
+                              tolerance: float = PRESCREEN_RULING_TOLERANCE) -> int:
+    """
+    計算不同位置的數量，距離在容許範圍內的位置視為同一個
+    
+    >>> _count_distinct_positions([10.0, 11.5, 40.0, 70.2, 71.0])
+    3
+    """
+    count = 0
+    last = None
+    for position in sorted(positions):
+        if last is None or position - last > tolerance:
+            count += 1
+        last = position
+    return count
+
 class AdvancedTableExtractor:
     """進階表格提取器 - 混合策略"""
     
-    def __init__(self):
+    def __init__(self, parallel: bool = True, max_workers: Optional[int] = None,
+                 strategy_timeouts: Optional[Dict[str, float]] = None,
+                 prescreen: bool = True, page_cache: Optional[PageCache] = None):
+        """
+        初始化表格提取器
+        
+        Args:
+            parallel: 是否在程序池中同時執行各提取策略
+            max_workers: 程序池大小，預設為同時執行的策略數量
+            strategy_timeouts: 各策略的逾時秒數，覆寫 DEFAULT_STRATEGY_TIMEOUTS
+            prescreen: 是否先以 PyMuPDF 預篩頁面，只在可能含有表格的頁面執行提取
+            page_cache: 頁面快取，內容未變更的頁面直接使用快取的表格
+        """
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self.strategy_timeouts = {**DEFAULT_STRATEGY_TIMEOUTS, **(strategy_timeouts or {})}
+        self.strategy_timings: Dict[str, Dict[str, Any]] = {}
+        self.prescreen = prescreen
+        self.prescreen_stats: Dict[str, Any] = {}
+        self.page_cache = page_cache
+        self.cached_pages = 0
         self.available_extractors = self._check_available_extractors()
         logger.info(f"可用的提取器: {list(self.available_extractors.keys())}")
     
@@ -89,65 +158,392 @@ class AdvancedTableExtractor:
             提取的表格列表
         """
         logger.info(f"開始提取表格: {pdf_path}")
+        self.strategy_timings = {}
+        self.cached_pages = 0
         all_tables = []
         
-        # 策略 1: camelot (最準確的表格提取)
-        if self.available_extractors.get('camelot', False):
-            try:
-                tables = self._extract_with_camelot(pdf_path)
-                all_tables.extend(tables)
-                logger.info(f"Camelot 提取到 {len(tables)} 個表格")
-            except Exception as e:
-                logger.warning(f"Camelot 提取失敗: {e}")
+        # 預篩頁面：None 表示未預篩（處理所有頁面）
+        pages = self.prescreen_pages(pdf_path) if self.prescreen else None
+        if pages is not None and not pages:
+            logger.info("預篩後沒有可能含有表格的頁面，略過表格提取")
+            return []
+        
+        # 頁面快取：內容未變更的頁面直接使用快取的表格，只提取其餘頁面
+        cached_tables: List[TableData] = []
+        page_hashes: Dict[int, str] = {}
+        if self.page_cache is not None:
+            pages, cached_tables, page_hashes = self._apply_page_cache(pdf_path, pages)
+            if pages is not None and not pages:
+                logger.info(f"所有頁面皆命中快取，共 {len(cached_tables)} 個表格")
+                return cached_tables
+        
+        # 策略 1-3: camelot (最準確)、pdfplumber (平衡型)、PyMuPDF (快速文本基礎)，彼此獨立可同時執行
+        primary_strategies = [
+            strategy for strategy in ('camelot_lattice', 'camelot_stream', 'pdfplumber', 'pymupdf')
+            if self.available_extractors.get(STRATEGY_EXTRACTORS[strategy], False)
+        ]
+        for tables in self._run_strategies(primary_strategies, pdf_path, pages).values():
+            all_tables.extend(tables)
         
-        # 策略 2: pdfplumber (平衡型選擇)
-        if self.available_extractors.get('pdfplumber', False):
-            try:
-                tables = self._extract_with_pdfplumber(pdf_path)
-                all_tables.extend(tables)
-                logger.info(f"PDFPlumber 提取到 {len(tables)} 個表格")
-            except Exception as e:
-                logger.warning(f"PDFPlumber 提取失敗: {e}")
+        # 策略 4: tabula (備用方案，僅在前述策略結果不足時執行)
+        if self.available_extractors.get('tabula', False) and len(all_tables) + len(cached_tables) < 2:
+            all_tables.extend(self._run_strategies(['tabula'], pdf_path, pages).get('tabula', []))
+        
+        # 去重和合併
+        unique_tables = self._deduplicate_tables(all_tables)
+        # tabula 不提供頁碼資訊，執行過 tabula 時無法將結果歸屬到頁面；
+        # 有策略逾時或失敗時結果不完整，兩者都不寫入快取，下次重新提取
+        all_succeeded = all(
+            self.strategy_timings.get(strategy, {}).get('status') == 'success'
+            for strategy in primary_strategies
+        )
+        if page_hashes and all_succeeded and 'tabula' not in self.strategy_timings:
+            self._store_page_tables(unique_tables, page_hashes)
+        elif page_hashes and not all_succeeded:
+            logger.info("部分提取策略未成功完成，本次結果不寫入頁面快取")
+        
+        unique_tables = cached_tables + unique_tables
+        logger.info(f"最終提取到 {len(unique_tables)} 個獨特表格")
+        
+        return unique_tables
+    
+    def _apply_page_cache(self, pdf_path: str,
+                          pages: Optional[List[int]]) -> Tuple[Optional[List[int]], List[TableData], Dict[int, str]]:
+        """
+        查詢頁面快取
+        
+        Returns:
+            (需要提取的頁碼, 快取命中的表格, 需要提取的頁碼 -> 頁面雜湊值)
+        """
+        hashes = compute_page_hashes(pdf_path)
+        if hashes is None:
+            return pages, [], {}
+        
+        remaining = []
+        cached_tables = []
+        page_hashes = {}
+        for page in (pages if pages is not None else range(1, len(hashes) + 1)):
+            page_hash = hashes[page - 1]
+            cached = self.page_cache.get(self._cache_namespace(), page_hash)
+            if cached is None:
+                remaining.append(page)
+                page_hashes[page] = page_hash
+                continue
+            
+            self.cached_pages += 1
+            # 頁面可能在改版後移動位置，以目前的頁碼與檔案為準
+            cached_tables.extend(
+                TableData(**{**item, 'source_page': page, 'source_file': pdf_path})
+                for item in cached
+            )
+        
+        logger.info(f"頁面快取命中 {self.cached_pages} 頁，需提取 {len(remaining)} 頁")
+        return remaining, cached_tables, page_hashes
+    
+    def _cache_namespace(self) -> str:
+        """
+        表格快取的命名空間，包含可用的提取器
+        
+        安裝或移除提取器後結果會不同，以不同的命名空間讓舊快取不被使用
+        """
+        extractors = sorted(name for name, available in self.available_extractors.items() if available)
+        return f"tables_{'-'.join(extractors) or 'none'}"
+    
+    def _store_page_tables(self, tables: List[TableData], page_hashes: Dict[int, str]) -> None:
+        """將提取結果依頁面寫入快取（沒有表格的頁面也會記錄，避免重複提取）"""
+        tables_by_page: Dict[int, List[Dict[str, Any]]] = {}
+        for table in tables:
+            tables_by_page.setdefault(table.source_page, []).append(asdict(table))
+        
+        for page, page_hash in page_hashes.items():
+            self.page_cache.set(self._cache_namespace(), page_hash, tables_by_page.get(page, []))
+    
+    def prescreen_pages(self, pdf_path: str) -> Optional[List[int]]:
+        """
+        以 PyMuPDF 快速預篩可能含有表格的頁面
+        
+        依平行框線的位置數、符合表格行格式的文字行數與數字密度判斷，
+        不做任何表格結構解析，成本遠低於 camelot/pdfplumber/tabula 的逐頁分析
+        
+        Args:
+            pdf_path: PDF 檔案路徑
+            
+        Returns:
+            候選頁碼列表（從 1 開始）；無法預篩時回傳 None，表示處理所有頁面
+        """
+        if not self.available_extractors.get('pymupdf', False):
+            self.prescreen_stats = {'enabled': False, 'reason': 'PyMuPDF 不可用'}
+            return None
+        
+        import fitz
+        
+        start_time = time.perf_counter()
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            logger.warning(f"頁面預篩失敗，改為處理所有頁面: {e}")
+            self.prescreen_stats = {'enabled': False, 'reason': str(e)}
+            return None
+        
+        candidates = []
+        total_pages = len(doc)
+        try:
+            for page_num in range(total_pages):
+                try:
+                    if self._is_table_candidate_page(doc[page_num]):
+                        candidates.append(page_num + 1)
+                except Exception as e:
+                    # 無法判斷的頁面保守地視為候選頁
+                    logger.debug(f"第 {page_num+1} 頁預篩失敗: {e}")
+                    candidates.append(page_num + 1)
+        finally:
+            doc.close()
+        
+        elapsed = time.perf_counter() - start_time
+        self.prescreen_stats = {
+            'enabled': True,
+            'total_pages': total_pages,
+            'candidate_pages': candidates,
+            'skipped_pages': total_pages - len(candidates),
+            'elapsed_seconds': round(elapsed, 3)
+        }
+        logger.info(f"頁面預篩: {len(candidates)}/{total_pages} 頁可能含有表格 ({elapsed:.2f}s)")
+        return candidates
+    
+    def _is_table_candidate_page(self, page) -> bool:
+        """判斷單一頁面是否可能含有表格"""
+        # 有邊框的表格：同一延伸範圍內有多條平行的列線或欄線（裝飾框只有兩條）
+        if max(self._ruling_positions(page)) >= PRESCREEN_MIN_RULING_POSITIONS:
+            return True
+        
+        text = page.get_text()
+        
+        # 無邊框的表格：以多欄位分隔且含數字的文字行
+        table_lines = 0
+        for line in text.split('\n'):
+            line = line.strip()
+            if line and self._is_table_line(line):
+                table_lines += 1
+                if table_lines >= PRESCREEN_MIN_TABLE_LINES:
+                    return True
+        
+        # 數字密集的頁面（PyMuPDF 常將每個儲存格輸出為獨立行）
+        tokens = text.split()
+        if len(tokens) >= PRESCREEN_MIN_TOKENS:
+            numeric_tokens = sum(1 for token in tokens if re.search(r'\d', token))
+            if numeric_tokens / len(tokens) >= PRESCREEN_MIN_NUMERIC_DENSITY:
+                return True
+        
+        return False
+    
+    def _ruling_positions(self, page) -> Tuple[int, int]:
+        """
+        計算頁面框線的不同位置數
+        
+        直線與矩形邊框依方向分組，延伸範圍相同的框線視為同一個表格的列線或欄線
+        
+        Returns:
+            (單一延伸範圍內最多的水平框線位置數, 單一延伸範圍內最多的垂直框線位置數)
+        """
+        page_area = page.rect.width * page.rect.height
+        horizontal: Dict[Tuple[int, int], List[float]] = {}
+        vertical: Dict[Tuple[int, int], List[float]] = {}
+        
+        def add(groups, position: float, start: float, end: float) -> None:
+            if end - start < PRESCREEN_MIN_RULING_LENGTH:
+                return
+            extent = (round(start / PRESCREEN_RULING_TOLERANCE), round(end / PRESCREEN_RULING_TOLERANCE))
+            groups.setdefault(extent, []).append(position)
+        
+        for drawing in page.get_drawings():
+            for item in drawing.get('items', []):
+                if item[0] == 'l':
+                    p1, p2 = item[1], item[2]
+                    if abs(p1.y - p2.y) <= 1:
+                        add(horizontal, p1.y, min(p1.x, p2.x), max(p1.x, p2.x))
+                    elif abs(p1.x - p2.x) <= 1:
+                        add(vertical, p1.x, min(p1.y, p2.y), max(p1.y, p2.y))
+                elif item[0] == 're':
+                    rect = item[1]
+                    if rect.width * rect.height > page_area * PRESCREEN_MAX_RECT_RATIO:
+                        continue
+                    for y in (rect.y0, rect.y1):
+                        add(horizontal, y, rect.x0, rect.x1)
+                    for x in (rect.x0, rect.x1):
+                        add(vertical, x, rect.y0, rect.y1)
+        
+        def max_distinct(groups) -> int:
+            return max((_count_distinct_positions(positions) for positions in groups.values()), default=0)
+        
+        return max_distinct(horizontal), max_distinct(vertical)
+    
+    def _run_strategy(self, strategy: str, pdf_path: str,
+                      pages: Optional[List[int]] = None) -> Tuple[List[TableData], float]:
+        """
+        執行單一提取策略（可在子程序中執行）
+        
+        Args:
+            strategy: 策略名稱
+            pdf_path: PDF 檔案路徑
+            pages: 要處理的頁碼（從 1 開始），None 表示所有頁面
         
-        # 策略 3: PyMuPDF (快速文本基礎提取)
-        if self.available_extractors.get('pymupdf', False):
+        Returns:
+            (提取的表格, 執行秒數)
+        """
+        start_time = time.perf_counter()
+        
+        if strategy == 'camelot_lattice':
+            tables = self._extract_with_camelot(pdf_path, flavors=('lattice',), pages=pages)
+        elif strategy == 'camelot_stream':
+            tables = self._extract_with_camelot(pdf_path, flavors=('stream',), pages=pages)
+        elif strategy == 'pdfplumber':
+            tables = self._extract_with_pdfplumber(pdf_path, pages=pages)
+        elif strategy == 'pymupdf':
+            tables = self._extract_with_pymupdf(pdf_path, pages=pages)
+        elif strategy == 'tabula':
+            tables = self._extract_with_tabula(pdf_path, pages=pages)
+        else:
+            raise ValueError(f"未知的提取策略: {strategy}")
+        
+        return tables, time.perf_counter() - start_time
+    
+    def _run_strategies(self, strategies: List[str], pdf_path: str,
+                        pages: Optional[List[int]] = None) -> Dict[str, List[TableData]]:
+        """
+        執行多個提取策略並記錄各策略耗時
+        
+        Returns:
+            策略名稱 -> 提取的表格（依傳入順序，失敗或逾時的策略為空列表）
+        """
+        if not strategies:
+            return {}
+        
+        if self.parallel and len(strategies) > 1:
             try:
-                tables = self._extract_with_pymupdf(pdf_path)
-                all_tables.extend(tables)
-                logger.info(f"PyMuPDF 提取到 {len(tables)} 個表格")
-            except Exception as e:
-                logger.warning(f"PyMuPDF 提取失敗: {e}")
+                return self._run_strategies_parallel(strategies, pdf_path, pages)
+            except (OSError, NotImplementedError) as e:
+                # 程序池無法建立（例如受限環境）時退回循序執行
+                logger.warning(f"平行提取失敗，改為循序執行: {e}")
         
-        # 策略 4: tabula (備用方案)
-        if self.available_extractors.get('tabula', False) and len(all_tables) < 2:
+        return self._run_strategies_sequential(strategies, pdf_path, pages)
+    
+    def _run_strategies_sequential(self, strategies: List[str], pdf_path: str,
+                                   pages: Optional[List[int]] = None) -> Dict[str, List[TableData]]:
+        """在目前程序中依序執行提取策略"""
+        results = {}
+        for strategy in strategies:
             try:
-                tables = self._extract_with_tabula(pdf_path)
-                all_tables.extend(tables)
-                logger.info(f"Tabula 提取到 {len(tables)} 個表格")
+                tables, elapsed = self._run_strategy(strategy, pdf_path, pages)
+                self._record_strategy(strategy, 'success', elapsed, len(tables))
+                results[strategy] = tables
             except Exception as e:
-                logger.warning(f"Tabula 提取失敗: {e}")
+                self._record_strategy(strategy, 'failed', None, 0, str(e))
+                results[strategy] = []
+        return results
+    
+    def _run_strategies_parallel(self, strategies: List[str], pdf_path: str,
+                                 pages: Optional[List[int]] = None,
+                                 retry_broken: bool = True) -> Dict[str, List[TableData]]:
+        """
+        在程序池中同時執行提取策略，逾時的策略會被放棄並終止其子程序
         
-        # 去重和合併
-        unique_tables = self._deduplicate_tables(all_tables)
-        logger.info(f"最終提取到 {len(unique_tables)} 個獨特表格")
+        子程序異常結束（原生程式庫 segfault、OOM）導致程序池損毀時，尚未取得結果的策略
+        各自在新的程序池重試一次；重試仍損毀則記錄為失敗。不在目前程序中重跑，
+        避免由輸入造成的崩潰拖垮整個處理流程
         
-        return unique_tables
+        Args:
+            retry_broken: 程序池損毀時是否重試尚未取得結果的策略
+        """
+        results = {}
+        timed_out = False
+        broken = False
+        workers = min(len(strategies), self.max_workers or len(strategies))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        
+        try:
+            submitted_at = time.perf_counter()
+            futures = {
+                strategy: executor.submit(self._run_strategy, strategy, pdf_path, pages)
+                for strategy in strategies
+            }
+            
+            for strategy, future in futures.items():
+                deadline = submitted_at + self.strategy_timeouts.get(strategy, 120.0)
+                try:
+                    tables, elapsed = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                    self._record_strategy(strategy, 'success', elapsed, len(tables))
+                    results[strategy] = tables
+                except BrokenProcessPool as e:
+                    logger.warning(f"程序池已損毀（子程序異常結束）: {e}")
+                    broken = True
+                    break
+                except FutureTimeoutError:
+                    timed_out = True
+                    future.cancel()
+                    self._record_strategy(strategy, 'timeout', time.perf_counter() - submitted_at, 0)
+                    results[strategy] = []
+                except Exception as e:
+                    self._record_strategy(strategy, 'failed', None, 0, str(e))
+                    results[strategy] = []
+        finally:
+            if timed_out:
+                # ProcessPoolExecutor 無法中斷執行中的工作，直接終止殘留的子程序
+                processes = list((getattr(executor, '_processes', None) or {}).values())
+                executor.shutdown(wait=False, cancel_futures=True)
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+            else:
+                executor.shutdown(wait=not broken, cancel_futures=broken)
+        
+        if broken:
+            pending = [strategy for strategy in strategies if strategy not in results]
+            for strategy in pending:
+                if retry_broken:
+                    # 每個策略使用獨立的程序池，確定性崩潰的策略不會再拖累其他策略
+                    logger.info(f"在新的程序池重試 {strategy}")
+                    results.update(self._run_strategies_parallel([strategy], pdf_path, pages, retry_broken=False))
+                else:
+                    self._record_strategy(strategy, 'failed', None, 0, "子程序異常結束")
+                    results[strategy] = []
+            # 依傳入順序回傳
+            results = {strategy: results[strategy] for strategy in strategies}
+        
+        return results
     
-    def _extract_with_camelot(self, pdf_path: str) -> List[TableData]:
+    def _record_strategy(self, strategy: str, status: str, elapsed: Optional[float],
+                         table_count: int, error: Optional[str] = None) -> None:
+        """記錄單一策略的執行結果與耗時"""
+        self.strategy_timings[strategy] = {
+            'status': status,
+            'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+            'tables': table_count
+        }
+        if error:
+            self.strategy_timings[strategy]['error'] = error
+        
+        if status == 'success':
+            logger.info(f"{strategy} 提取到 {table_count} 個表格 ({elapsed:.2f}s)")
+        elif status == 'timeout':
+            logger.warning(f"{strategy} 提取逾時 ({self.strategy_timeouts.get(strategy)}s)，已略過")
+        else:
+            logger.warning(f"{strategy} 提取失敗: {error}")
+    
+    def _extract_with_camelot(self, pdf_path: str, flavors: Tuple[str, ...] = ('lattice', 'stream'),
+                              pages: Optional[List[int]] = None) -> List[TableData]:
         """使用 camelot 提取表格"""
         import camelot
         
-        # 嘗試不同的提取策略
-        strategies = [
-            {'flavor': 'lattice'},  # 有邊框的表格
-            {'flavor': 'stream'},   # 無邊框的表格
-        ]
+        page_spec = ','.join(str(page) for page in pages) if pages else 'all'
+        
+        # 嘗試不同的提取策略：lattice 適用有邊框的表格，stream 適用無邊框的表格
+        strategies = [{'flavor': flavor} for flavor in flavors]
         
         all_tables = []
         
         for strategy in strategies:
             try:
-                tables = camelot.read_pdf(pdf_path, pages='all', **strategy)
+                tables = camelot.read_pdf(pdf_path, pages=page_spec, **strategy)
                 
                 for i, table in enumerate(tables):
                     if table.accuracy > 0.5:  # 只保留準確度較高的表格
@@ -180,15 +576,18 @@ class AdvancedTableExtractor:
         
         return all_tables
     
-    def _extract_with_pdfplumber(self, pdf_path: str) -> List[TableData]:
+    def _extract_with_pdfplumber(self, pdf_path: str, pages: Optional[List[int]] = None) -> List[TableData]:
         """使用 pdfplumber 提取表格"""
         import pdfplumber
         
         tables = []
         
         with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
+            page_nums = [page - 1 for page in pages] if pages else range(len(pdf.pages))
+            for page_num in page_nums:
                 try:
+                    page = pdf.pages[page_num]
+                    
                     # 提取表格
                     page_tables = page.extract_tables()
                     
@@ -220,14 +619,15 @@ class AdvancedTableExtractor:
         
         return tables
     
-    def _extract_with_pymupdf(self, pdf_path: str) -> List[TableData]:
+    def _extract_with_pymupdf(self, pdf_path: str, pages: Optional[List[int]] = None) -> List[TableData]:
         """使用 PyMuPDF 提取表格"""
         import fitz
         
         tables = []
         doc = fitz.open(pdf_path)
         
-        for page_num in range(len(doc)):
+        page_nums = [page - 1 for page in pages] if pages else range(len(doc))
+        for page_num in page_nums:
             try:
                 page = doc[page_num]
                 text = page.get_text()
@@ -260,15 +660,15 @@ class AdvancedTableExtractor:
         doc.close()
         return tables
     
-    def _extract_with_tabula(self, pdf_path: str) -> List[TableData]:
+    def _extract_with_tabula(self, pdf_path: str, pages: Optional[List[int]] = None) -> List[TableData]:
         """使用 tabula 提取表格"""
         import tabula
         
         tables = []
         
         try:
-            # 提取所有表格
-            dfs = tabula.read_pdf(pdf_path, pages='all', multiple_tables=True)
+            # 提取所有表格（有預篩結果時只處理候選頁面）
+            dfs = tabula.read_pdf(pdf_path, pages=pages or 'all', multiple_tables=True)
             
             for i, df in enumerate(dfs):
                 if len(df) > 1:
@@ -462,71 +862,114 @@ class AdvancedTableExtractor:
         return False
     
     def _deduplicate_tables(self, tables: List[TableData]) -> List[TableData]:
-        """去除重複表格"""
-        unique_tables = []
+        """
+        去除重複表格
+        
+        以 (頁碼, 列數, 欄數) 建立索引，每個表格只與同一索引桶內的表格比較，
+        並預先計算標題與首列的詞集合；重複時保留信心度最高的版本
+        """
+        unique_tables: List[TableData] = []
+        signatures: List[Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]] = []
+        buckets: Dict[Tuple[int, int, int], List[int]] = {}
         
         for table in tables:
-            if not self._is_duplicate_table(table, unique_tables):
+            signature = self._table_signature(table)
+            bucket = buckets.setdefault(self._table_dedup_key(table), [])
+            
+            match = None
+            for index in bucket:
+                if self._signature_similarity(signature, signatures[index]) > 0.8:
+                    match = index
+                    break
+            
+            if match is None:
+                bucket.append(len(unique_tables))
                 unique_tables.append(table)
+                signatures.append(signature)
+                continue
+            
+            existing = unique_tables[match]
+            # 各提取器的信心度尺度不同，正規化後才比較；同分時保留先提取的版本
+            if self._normalized_confidence(table) > self._normalized_confidence(existing):
+                self._merge_duplicate(table, existing)
+                unique_tables[match] = table
+                signatures[match] = signature
+                logger.debug(f"以 {table.title} 取代重複表格: {existing.title}")
             else:
+                self._merge_duplicate(existing, table)
                 logger.debug(f"移除重複表格: {table.title}")
         
         return unique_tables
     
-    def _is_duplicate_table(self, table: TableData, existing_tables: List[TableData]) -> bool:
-        """檢查是否為重複表格"""
-        for existing in existing_tables:
-            # 檢查頁面和大小
-            if (table.source_page == existing.source_page and
-                len(table.rows) == len(existing.rows) and
-                len(table.headers) == len(existing.headers)):
-                
-                # 檢查內容相似度
-                if self._calculate_table_similarity(table, existing) > 0.8:
-                    return True
-        
-        return False
+    def _table_dedup_key(self, table: TableData) -> Tuple[int, int, int]:
+        """重複表格必須位於同一頁且形狀相同"""
+        return (table.source_page, len(table.rows), len(table.headers))
+    
+    def _table_signature(self, table: TableData) -> Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]:
+        """預先計算標題與第一行資料的詞集合"""
+        header_tokens = self._text_tokens(' '.join(str(cell) for cell in table.headers))
+        row_tokens = self._text_tokens(' '.join(str(cell) for cell in table.rows[0])) if table.rows else None
+        return header_tokens, row_tokens
+    
+    def _signature_similarity(self, signature1, signature2) -> float:
+        """以預先計算的詞集合計算表格相似度（標題與第一行資料的平均）"""
+        header_similarity = self._token_similarity(signature1[0], signature2[0])
+        row_similarity = self._token_similarity(signature1[1], signature2[1])
+        return (header_similarity + row_similarity) / 2
+    
+    def _normalized_confidence(self, table: TableData) -> float:
+        """將信心度正規化為 0-1（camelot 的 accuracy 為 0-100）"""
+        confidence = float(table.confidence or 0.0)
+        return confidence / 100.0 if confidence > 1.0 else confidence
+    
+    def _merge_duplicate(self, kept: TableData, dropped: TableData) -> None:
+        """在保留的表格中記錄被合併的重複版本"""
+        merged_from = kept.metadata.setdefault('merged_from', [])
+        merged_from.append({
+            'title': dropped.title,
+            'extractor_method': dropped.extractor_method,
+            'confidence': dropped.confidence
+        })
+        merged_from.extend(dropped.metadata.pop('merged_from', []))
     
     def _calculate_table_similarity(self, table1: TableData, table2: TableData) -> float:
         """計算表格相似度"""
-        # 比較標題
-        header_similarity = self._calculate_text_similarity(
-            ' '.join(table1.headers), 
-            ' '.join(table2.headers)
-        )
-        
-        # 比較第一行資料
-        if table1.rows and table2.rows:
-            row_similarity = self._calculate_text_similarity(
-                ' '.join(table1.rows[0]), 
-                ' '.join(table2.rows[0])
-            )
-        else:
-            row_similarity = 0.0
-        
-        return (header_similarity + row_similarity) / 2
+        return self._signature_similarity(self._table_signature(table1), self._table_signature(table2))
     
-    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
-        """計算文本相似度"""
-        if not text1 or not text2:
+    def _text_tokens(self, text: str) -> Optional[FrozenSet[str]]:
+        """將文本轉換為小寫詞集合，空文本回傳 None"""
+        if not text:
+            return None
+        return frozenset(text.lower().split())
+    
+    def _token_similarity(self, tokens1: Optional[FrozenSet[str]], tokens2: Optional[FrozenSet[str]]) -> float:
+        """計算兩個詞集合的 Jaccard 相似度"""
+        if tokens1 is None or tokens2 is None:
             return 0.0
         
-        # 簡單的字符相似度計算
-        set1 = set(text1.lower().split())
-        set2 = set(text2.lower().split())
-        
-        if not set1 and not set2:
+        if not tokens1 and not tokens2:
             return 1.0
-        elif not set1 or not set2:
+        elif not tokens1 or not tokens2:
             return 0.0
         
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
+        intersection = len(tokens1 & tokens2)
+        union = len(tokens1 | tokens2)
         
         return intersection / union if union > 0 else 0.0
     
-    def save_tables_to_json(self, tables: List[TableData], output_path: str) -> None:
-        """將表格儲存為 JSON 格式"""
+    def _calculate_text_similarity(self, text1: str, text2: str) -> float:
+        """計算文本相似度"""
+        return self._token_similarity(self._text_tokens(text1), self._text_tokens(text2))
+    
+    def save_tables_to_json(self, tables: List[TableData], output_path: str, write_store: bool = True) -> None:
+        """
+        將表格儲存為 JSON 格式
+        
+        Args:
+            tables: 表格列表
+            output_path: JSON 輸出路徑
+            write_store: 是否同時寫入同目錄的 SQLite 表格儲存庫（供後續流程逐筆讀取）
+        """
         tables_data = [asdict(table) for table in tables]
         
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -534,9 +977,12 @@ class AdvancedTableExtractor:
                 'extraction_date': datetime.now().isoformat(),
                 'total_tables': len(tables),
                 'tables': tables_data
-            }, f, indent=2, ensure_ascii=False)
+            }, f, ensure_ascii=False, separators=(',', ':'))
         
         logger.info(f"表格資料已儲存到: {output_path}")
+        
+        if write_store:
+            TableStore(Path(output_path).with_name(DEFAULT_DB_NAME)).replace_extracted_tables(tables_data)
     
     def generate_extraction_report(self, tables: List[TableData]) -> Dict[str, Any]:
         """生成提取報告"""
@@ -550,7 +996,10 @@ class AdvancedTableExtractor:
                 'low (<0.5)': 0
             },
             'pages_with_tables': set(),
-            'average_confidence': 0.0
+            'average_confidence': 0.0,
+            'strategy_timings': {name: dict(timing) for name, timing in self.strategy_timings.items()},
+            'prescreen': dict(self.prescreen_stats),
+            'cached_pages': self.cached_pages
         }
         
         total_confidence = 0.0
@@ -608,6 +1057,8 @@ def test_table_extractor():
         logger.info(f"提取方法: {report['extraction_methods']}")
         logger.info(f"表格類型: {report['table_types']}")
         logger.info(f"平均信心度: {report['average_confidence']:.2f}")
+        logger.info(f"策略耗時: {report['strategy_timings']}")
+        logger.info(f"頁面預篩: {report['prescreen']}")
         
         # 儲存結果
         extractor.save_tables_to_json(tables, "../data/processed/extracted_tables.json")
@@ -0,0 +1,385 @@
+"""
+表格儲存庫
+以 SQLite 儲存提取的表格與表格文本，並以小型 manifest 記錄數量，
+讓查詢表格數量不需解析整份 JSON，載入表格時也能逐筆讀取
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_NAME = "tables.db"
+MANIFEST_NAME = "tables_manifest.json"
+# 舊版流程輸出的表格文本 JSON（manifest 不存在時用來計算數量）
+LEGACY_TABLE_TEXTS_NAME = "table_texts.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extracted_tables (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    source_file TEXT,
+    source_page INTEGER,
+    table_type TEXT,
+    confidence REAL,
+    extractor_method TEXT,
+    headers TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_texts (
+    id INTEGER PRIMARY KEY,
+    table_id TEXT NOT NULL UNIQUE,
+    parent_table_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_table_texts_parent ON table_texts(parent_table_id);
+"""
+
+
+def _dumps(value: Any) -> str:
+    """精簡的 JSON 序列化（不縮排、保留中文）"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def read_manifest(data_dir: Union[str, Path]) -> Dict[str, Any]:
+    """
+    讀取表格 manifest
+
+    Args:
+        data_dir: 資料目錄（data/processed）
+
+    Returns:
+        manifest 內容，不存在或無法讀取時回傳空字典
+    """
+    manifest_path = Path(data_dir) / MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"無法讀取表格 manifest: {e}")
+        return {}
+
+
+def update_manifest(data_dir: Union[str, Path], **fields: Any) -> Dict[str, Any]:
+    """
+    更新表格 manifest（合併既有欄位，先寫入暫存檔再替換）
+
+    Args:
+        data_dir: 資料目錄
+        **fields: 要更新的欄位
+
+    Returns:
+        更新後的 manifest
+    """
+    data_dir = Path(data_dir)
+    manifest = read_manifest(data_dir)
+    manifest.update(fields)
+    manifest["updated_at"] = datetime.now().isoformat()
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=data_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, data_dir / MANIFEST_NAME)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return manifest
+
+
+def table_texts_signature(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    表格文本 JSON 的檔案簽章（名稱、大小、修改時間、內容雜湊），記錄在 manifest 中用來偵測過期
+
+    Args:
+        path: 表格文本 JSON 路徑
+
+    Returns:
+        簽章欄位，檔案不存在時回傳空字典
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return {}
+    return {
+        "table_texts_source": path.name,
+        "table_texts_size": stat.st_size,
+        "table_texts_mtime_ns": stat.st_mtime_ns,
+        "table_texts_sha256": _file_digest(str(path), stat.st_size, stat.st_mtime_ns)
+    }
+
+
+@lru_cache(maxsize=16)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    """檔案內容的 SHA-256（以大小與修改時間為快取鍵，同一檔案只計算一次）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _manifest_is_current(data_dir: Path, manifest: Dict[str, Any]) -> bool:
+    """manifest 是否與目錄中的表格文本 JSON 一致（JSON 不存在時以 manifest 為準）"""
+    path = data_dir / manifest.get("table_texts_source", LEGACY_TABLE_TEXTS_NAME)
+    try:
+        stat = path.stat()
+    except OSError:
+        return True
+    if manifest.get("table_texts_size") != stat.st_size:
+        return False
+    if manifest.get("table_texts_mtime_ns") == stat.st_mtime_ns:
+        return True
+    # git checkout 或複製後修改時間會改變，改以內容雜湊確認（不解析 JSON）
+    expected = manifest.get("table_texts_sha256")
+    try:
+        return expected is not None and expected == _file_digest(str(path), stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return False
+
+
+def read_table_count(data_dir: Union[str, Path]) -> int:
+    """
+    讀取表格數量
+
+    優先讀取 manifest；manifest 不存在，或表格文本 JSON 在 manifest 之後被改寫時，
+    改為解析 table_texts.json。此函數只讀取，manifest 由儲存流程寫入
+
+    Args:
+        data_dir: 資料目錄（data/processed）
+
+    Returns:
+        int: 來源表格數量，無法取得時回傳 0
+    """
+    data_dir = Path(data_dir)
+    manifest = read_manifest(data_dir)
+    if "total_tables" in manifest and _manifest_is_current(data_dir, manifest):
+        return int(manifest["total_tables"])
+
+    legacy_path = data_dir / manifest.get("table_texts_source", LEGACY_TABLE_TEXTS_NAME)
+    if not legacy_path.exists():
+        return 0
+
+    if manifest:
+        logger.info(f"表格 manifest 已過期，改為讀取: {legacy_path.name}")
+    try:
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"無法讀取表格數量: {e}")
+        return 0
+
+    return data.get("total_tables", 0)
+
+
+class TableStore:
+    """表格儲存庫 - 以 SQLite 儲存表格與表格文本"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        """
+        初始化表格儲存庫
+
+        Args:
+            db_path: SQLite 資料庫路徑（manifest 會寫在同一目錄）
+        """
+        self.db_path = Path(db_path)
+
+    @property
+    def data_dir(self) -> Path:
+        """資料庫所在目錄"""
+        return self.db_path.parent
+
+    def exists(self) -> bool:
+        """資料庫檔案是否存在"""
+        return self.db_path.exists()
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立連線並確保資料表存在"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path))
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def replace_extracted_tables(self, tables: Iterable[Dict[str, Any]]) -> int:
+        """
+        以新的提取結果取代資料庫中的表格
+
+        Args:
+            tables: 表格字典（TableData 的欄位）
+
+        Returns:
+            int: 寫入的表格數量
+        """
+        rows = (
+            (
+                table.get("title", ""),
+                table.get("source_file"),
+                table.get("source_page"),
+                table.get("table_type"),
+                table.get("confidence"),
+                table.get("extractor_method"),
+                _dumps(table.get("headers", [])),
+                _dumps(table.get("rows", [])),
+                _dumps(table.get("metadata", {}))
+            )
+            for table in tables
+        )
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM extracted_tables")
+                conn.executemany(
+                    "INSERT INTO extracted_tables (title, source_file, source_page, table_type, "
+                    "confidence, extractor_method, headers, rows, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                count = conn.execute("SELECT COUNT(*) FROM extracted_tables").fetchone()[0]
+        finally:
+            conn.close()
+
+        update_manifest(self.data_dir, total_extracted_tables=count, store=self.db_path.name)
+        logger.info(f"✅ 已寫入 {count} 個表格到: {self.db_path}")
+        return count
+
+    def replace_table_texts(self, table_texts: Iterable[Dict[str, Any]],
+                            manifest_fields: Optional[Dict[str, Any]] = None) -> int:
+        """
+        以新的轉換結果取代資料庫中的表格文本
+
+        Args:
+            table_texts: 含 table_id、content、metadata 的字典
+            manifest_fields: 一併寫入 manifest 的欄位（例如表格文本 JSON 的簽章）
+
+        Returns:
+            int: 寫入的文本數量
+        """
+        rows = (
+            (
+                item["table_id"],
+                item["metadata"].get("parent_table_id", item["table_id"]),
+                item["content"],
+                _dumps(item["metadata"])
+            )
+            for item in table_texts
+        )
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM table_texts")
+                conn.executemany(
+                    "INSERT INTO table_texts (table_id, parent_table_id, content, metadata) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                total_documents, total_tables = conn.execute(
+                    "SELECT COUNT(*), COUNT(DISTINCT parent_table_id) FROM table_texts"
+                ).fetchone()
+        finally:
+            conn.close()
+
+        update_manifest(
+            self.data_dir,
+            total_tables=total_tables,
+            total_documents=total_documents,
+            store=self.db_path.name,
+            **(manifest_fields or {})
+        )
+        logger.info(f"✅ 已寫入 {total_documents} 個表格文本（{total_tables} 個表格）到: {self.db_path}")
+        return total_documents
+
+    def _iter_rows(self, query: str, batch_size: int) -> Iterator[tuple]:
+        """逐批讀取查詢結果，避免一次載入所有資料"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(query)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            conn.close()
+
+    def iter_extracted_tables(self, batch_size: int = 256) -> Iterator[Dict[str, Any]]:
+        """
+        逐筆讀取提取的表格
+
+        Yields:
+            Dict[str, Any]: 與 extracted_tables.json 中相同格式的表格字典
+        """
+        query = ("SELECT title, headers, rows, source_page, source_file, table_type, "
+                 "confidence, extractor_method, metadata FROM extracted_tables ORDER BY id")
+        for title, headers, rows, page, source, table_type, confidence, method, metadata in self._iter_rows(query, batch_size):
+            yield {
+                "title": title,
+                "headers": json.loads(headers),
+                "rows": json.loads(rows),
+                "source_page": page,
+                "source_file": source,
+                "table_type": table_type,
+                "confidence": confidence,
+                "extractor_method": method,
+                "metadata": json.loads(metadata)
+            }
+
+    def iter_table_texts(self, batch_size: int = 256) -> Iterator[Dict[str, Any]]:
+        """
+        逐筆讀取表格文本
+
+        Yields:
+            Dict[str, Any]: 與 table_texts.json 中相同格式的表格文本字典
+        """
+        query = "SELECT table_id, content, metadata FROM table_texts ORDER BY id"
+        for table_id, content, metadata in self._iter_rows(query, batch_size):
+            yield {
+                "table_id": table_id,
+                "content": content,
+                "metadata": json.loads(metadata)
+            }
+
+    def get_table_text(self, table_id: str) -> Optional[Dict[str, Any]]:
+        """依 table_id 讀取單一表格文本"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT table_id, content, metadata FROM table_texts WHERE table_id = ?", (table_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return {"table_id": row[0], "content": row[1], "metadata": json.loads(row[2])}
+
+    def count_extracted_tables(self) -> int:
+        """提取的表格數量"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM extracted_tables").fetchone()[0]
+        finally:
+            conn.close()
+
+    def count_table_texts(self) -> int:
+        """表格文本數量"""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM table_texts").fetchone()[0]
+        finally:
+            conn.close()
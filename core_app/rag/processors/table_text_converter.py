@@ -3,13 +3,17 @@
 將提取的表格資料轉換為可向量化的文本格式，用於RAG查詢
 """
 
+import os
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 
+from .token_budget import ChunkBudgetPlanner
+from .table_store import TableStore, DEFAULT_DB_NAME, table_texts_signature
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,14 +25,38 @@ class TableTextData:
     content: str
     metadata: Dict[str, Any]
 
+# 表格分塊模式，預設以摘要 + 列群組切分大型表格
+DEFAULT_TABLE_CHUNK_MODE = "rows"
+
 class TableTextConverter:
     """表格轉文本轉換器"""
     
-    def __init__(self):
+    CHUNK_MODES = ("table", "rows")
+    
+    def __init__(self, budget_planner: Optional[ChunkBudgetPlanner] = None,
+                 chunk_mode: str = "table", rows_per_chunk: Optional[int] = None):
+        """
+        初始化轉換器
+        
+        Args:
+            budget_planner: 分塊預算規劃器，設定後超出嵌入長度的表格文本會被拆成多個部分
+            chunk_mode: "table" 每個表格一份文本；"rows" 每個表格一份摘要加上多份列群組文本
+            rows_per_chunk: "rows" 模式下每個列群組的列數上限，未設定時僅依 token 預算分組
+        """
+        if chunk_mode not in self.CHUNK_MODES:
+            raise ValueError(f"不支援的分塊模式: {chunk_mode}")
+        if chunk_mode == "rows" and rows_per_chunk is None and budget_planner is None:
+            rows_per_chunk = 10
+        
+        self.budget_planner = budget_planner
+        self.chunk_mode = chunk_mode
+        self.rows_per_chunk = rows_per_chunk
         self.conversion_stats = {
             "total_tables": 0,
             "converted_tables": 0,
-            "total_text_length": 0
+            "total_text_length": 0,
+            "split_tables": 0,
+            "total_documents": 0
         }
     
     def convert_table_to_text(self, table_data: Dict[str, Any]) -> str:
@@ -56,53 +84,221 @@ class TableTextConverter:
         True
         """
         try:
-            # 基本資訊
-            title = table_data.get("title", "未命名表格")
-            table_type = table_data.get("table_type", "一般")
-            page = table_data.get("source_page", "未知")
+            header_lines, row_lines, keyword_line = self._build_text_sections(table_data)
+            return "\n".join(header_lines + row_lines + [keyword_line])
             
-            # 建構文本描述
-            text_parts = [
-                f"表格標題: {title}",
-                f"表格類型: {table_type}",
-                f"來源頁面: 第{page}頁",
-                f"資料提取方法: {table_data.get('extractor_method', '未知')}",
-                f"信心度: {table_data.get('confidence', 0):.1f}%"
-            ]
+        except Exception as e:
+            logger.warning(f"轉換表格失敗: {e}")
+            return f"表格: {table_data.get('title', '轉換失敗')}"
+    
+    def _build_text_sections(self, table_data: Dict[str, Any]) -> Tuple[List[str], List[str], str]:
+        """
+        建構表格文本的各個區段
+        
+        Args:
+            table_data: 表格資料字典
             
-            # 表格內容
-            headers = table_data.get("headers", [])
-            rows = table_data.get("rows", [])
+        Returns:
+            (標頭行, 內容行, 關鍵字行)
+        """
+        # 基本資訊
+        title = table_data.get("title", "未命名表格")
+        table_type = table_data.get("table_type", "一般")
+        page = table_data.get("source_page", "未知")
+        
+        # 建構文本描述
+        header_lines = [
+            f"表格標題: {title}",
+            f"表格類型: {table_type}",
+            f"來源頁面: 第{page}頁",
+            f"資料提取方法: {table_data.get('extractor_method', '未知')}",
+            f"信心度: {table_data.get('confidence', 0):.1f}%"
+        ]
+        
+        # 表格內容
+        headers = table_data.get("headers", [])
+        rows = table_data.get("rows", [])
+        
+        if headers:
+            header_lines.append(self._format_columns(headers))
+        
+        # 轉換表格內容為可搜尋的文本
+        row_lines = []
+        if rows:
+            row_lines.append("表格內容:")
+            for row in rows:
+                row_text = self._format_row(headers, row)
+                if row_text:
+                    row_lines.append(f"  {row_text}")
+        
+        # 額外的搜尋關鍵字（基於表格類型）
+        keyword_line = self._generate_search_keywords(table_data)
+        
+        return header_lines, row_lines, keyword_line
+    
+    def _format_columns(self, headers: List[Any]) -> str:
+        """格式化表格欄位行"""
+        return f"表格欄位: {', '.join(str(h) for h in headers if h)}"
+    
+    def _format_row(self, headers: List[Any], row: List[Any]) -> str:
+        """將單列資料格式化為欄位-值文本"""
+        if len(row) >= len(headers):
+            # 建立欄位-值對應
+            row_text = []
+            for j, cell in enumerate(row):
+                if j < len(headers) and headers[j] and cell:
+                    row_text.append(f"{headers[j]}: {cell}")
+            return ', '.join(row_text)
+        # 簡單連接
+        return ', '.join(str(cell) for cell in row if cell)
+    
+    def split_table_text(self, table_data: Dict[str, Any]) -> List[str]:
+        """
+        將表格轉換為符合嵌入 token 預算的一或多段文本
+        
+        Args:
+            table_data: 表格資料字典
             
-            if headers:
-                text_parts.append(f"表格欄位: {', '.join(str(h) for h in headers if h)}")
+        Returns:
+            文本區段列表；未設定預算規劃器或未超出預算時只有一段
+        """
+        text = self.convert_table_to_text(table_data)
+        if self.budget_planner is None or self.budget_planner.fits(text):
+            return [text]
+        
+        try:
+            header_lines, row_lines, keyword_line = self._build_text_sections(table_data)
+        except Exception as e:
+            logger.warning(f"拆分表格失敗: {e}")
+            return [text]
+        
+        # 後續區段只保留標題與欄位，讓每一段都能獨立理解又不浪費 token
+        continuation_header = [header_lines[0]]
+        headers = table_data.get("headers", [])
+        if headers:
+            continuation_header.append(self._format_columns(headers))
+        
+        body_lines = [line for line in row_lines if line != "表格內容:"]
+        if keyword_line:
+            body_lines.append(keyword_line)
+        
+        return self.budget_planner.pack_lines(
+            body_lines,
+            first_header=header_lines,
+            continuation_header=continuation_header
+        )
+    
+    def convert_table_to_row_chunks(self, table_data: Dict[str, Any],
+                                    base_id: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        將表格轉換為一份摘要文本加上多份列群組文本
+        
+        Args:
+            table_data: 表格資料字典
+            base_id: 表格識別碼，列群組識別碼以此為前綴
             
-            # 轉換表格內容為可搜尋的文本
-            if rows:
-                text_parts.append("表格內容:")
-                for i, row in enumerate(rows):
-                    if len(row) >= len(headers):
-                        # 建立欄位-值對應
-                        row_text = []
-                        for j, cell in enumerate(row):
-                            if j < len(headers) and headers[j] and cell:
-                                row_text.append(f"{headers[j]}: {cell}")
-                        if row_text:
-                            text_parts.append(f"  {', '.join(row_text)}")
-                    else:
-                        # 簡單連接
-                        row_text = ', '.join(str(cell) for cell in row if cell)
-                        if row_text:
-                            text_parts.append(f"  {row_text}")
+        Returns:
+            (文本識別碼, 文本內容, 分塊元資料) 列表，第一份為表格摘要
+        
+        >>> converter = TableTextConverter(chunk_mode="rows", rows_per_chunk=2)
+        >>> table = {
+        ...     "title": "Test_Table",
+        ...     "headers": ["名稱", "數值"],
+        ...     "rows": [["項目A", "100"], ["項目B", "200"], ["項目C", "300"]]
+        ... }
+        >>> chunks = converter.convert_table_to_row_chunks(table, "table_1")
+        >>> [chunk_id for chunk_id, _, _ in chunks]
+        ['table_1_summary', 'table_1_rows1-2', 'table_1_rows3-3']
+        >>> "名稱: 項目C, 數值: 300" in chunks[2][1]
+        True
+        """
+        header_lines, _, keyword_line = self._build_text_sections(table_data)
+        title = table_data.get("title", "未命名表格")
+        headers = table_data.get("headers", [])
+        rows = table_data.get("rows", [])
+        total_rows = len(rows)
+        
+        # 摘要文本：表格基本資訊、欄位、列數與關鍵字，用於回答「有哪些表格/欄位」類問題
+        summary_lines = header_lines + [f"資料列數: {total_rows}"]
+        chunks = [(f"{base_id}_summary", self._fit_summary(summary_lines, keyword_line), {
+            "chunk_kind": "table_summary",
+            "total_rows": total_rows
+        })]
+        
+        columns_line = self._format_columns(headers) if headers else None
+        
+        def group_text(start: int, end: int, row_lines: List[str]) -> str:
+            lines = [f"表格標題: {title}（第{start}-{end}列，共{total_rows}列）"]
+            if columns_line:
+                lines.append(columns_line)
+            return "\n".join(lines + row_lines)
+        
+        def flush(start: int, end: int, row_lines: List[str]) -> None:
+            chunks.append((f"{base_id}_rows{start}-{end}", group_text(start, end, row_lines), {
+                "chunk_kind": "table_rows",
+                "row_start": start,
+                "row_end": end,
+                "total_rows": total_rows
+            }))
+        
+        group_lines: List[str] = []
+        group_start = None
+        group_end = None
+        
+        for row_number, row in enumerate(rows, start=1):
+            row_text = self._format_row(headers, row)
+            if not row_text:
+                continue
+            line = f"  {row_text}"
             
-            # 額外的搜尋關鍵字（基於表格類型）
-            text_parts.append(self._generate_search_keywords(table_data))
+            if group_lines:
+                reached_row_limit = (
+                    self.rows_per_chunk is not None and len(group_lines) >= self.rows_per_chunk
+                )
+                over_budget = (
+                    self.budget_planner is not None and
+                    not self.budget_planner.fits(group_text(group_start, row_number, group_lines + [line]))
+                )
+                if reached_row_limit or over_budget:
+                    flush(group_start, group_end, group_lines)
+                    group_lines = []
             
-            return "\n".join(text_parts)
+            if not group_lines:
+                group_start = row_number
+            group_lines.append(line)
+            group_end = row_number
+        
+        if group_lines:
+            flush(group_start, group_end, group_lines)
+        
+        return chunks
+    
+    def _fit_summary(self, summary_lines: List[str], keyword_line: str) -> str:
+        """
+        組合摘要文本，超出嵌入預算時從尾端逐一移除關鍵字
+        
+        Args:
+            summary_lines: 摘要的基本資訊行
+            keyword_line: 搜尋關鍵字行（可為空字串）
             
-        except Exception as e:
-            logger.warning(f"轉換表格失敗: {e}")
-            return f"表格: {table_data.get('title', '轉換失敗')}"
+        Returns:
+            摘要文本；基本資訊行本身超出預算時只保留基本資訊
+        """
+        summary = "\n".join(summary_lines)
+        if not keyword_line:
+            return summary
+        
+        prefix, _, keyword_text = keyword_line.partition(": ")
+        keywords = keyword_text.split(", ")
+        while keywords:
+            text = "\n".join(summary_lines + [f"{prefix}: {', '.join(keywords)}"])
+            if self.budget_planner is None or self.budget_planner.fits(text):
+                return text
+            keywords.pop()
+        
+        if not self.budget_planner.fits(summary):
+            logger.warning(f"表格摘要超出嵌入預算: {summary_lines[0]}")
+        return summary
     
     def _generate_search_keywords(self, table_data: Dict[str, Any]) -> str:
         """
@@ -150,7 +346,7 @@ class TableTextConverter:
         將表格JSON檔案轉換為文本資料
         
         Args:
-            json_path: 表格JSON檔案路徑
+            json_path: 表格JSON檔案或 SQLite 表格儲存庫（.db）路徑
             output_path: 輸出檔案路徑（可選）
             
         Returns:
@@ -159,61 +355,119 @@ class TableTextConverter:
         logger.info(f"開始轉換表格JSON: {json_path}")
         
         # 讀取表格資料
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if Path(json_path).suffix == ".db":
+            # 從表格儲存庫逐筆讀取，數量由資料庫計算，不需一次載入所有表格
+            store = TableStore(json_path)
+            total_tables = store.count_extracted_tables()
+            tables = store.iter_extracted_tables()
+        else:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            tables = data.get("tables", [])
+            total_tables = len(tables)
         
-        tables = data.get("tables", [])
-        self.conversion_stats["total_tables"] = len(tables)
+        self.conversion_stats["total_tables"] = total_tables
         
         converted_tables = []
         
         for i, table in enumerate(tables):
             try:
-                # 轉換為文本
-                text_content = self.convert_table_to_text(table)
+                base_id = f"table_{i+1}_{table.get('title', 'unknown')}"
                 
-                # 建立文本資料物件
-                table_text = TableTextData(
-                    table_id=f"table_{i+1}_{table.get('title', 'unknown')}",
-                    content=text_content,
-                    metadata={
-                        "original_table_data": table,
-                        "source_page": table.get("source_page"),
-                        "source_file": table.get("source_file"),
-                        "table_type": table.get("table_type"),
-                        "confidence": table.get("confidence"),
-                        "extractor_method": table.get("extractor_method"),
-                        "conversion_date": datetime.now().isoformat()
-                    }
-                )
+                if self.chunk_mode == "rows":
+                    # 摘要 + 列群組
+                    chunks = self.convert_table_to_row_chunks(table, base_id)
+                else:
+                    # 轉換為文本（超出嵌入預算時拆為多段）
+                    text_parts = self.split_table_text(table)
+                    chunks = [
+                        (
+                            base_id if len(text_parts) == 1 else f"{base_id}_part{part_index+1}",
+                            text_content,
+                            {
+                                "chunk_kind": "table",
+                                "part_index": part_index + 1,
+                                "part_count": len(text_parts)
+                            }
+                        )
+                        for part_index, text_content in enumerate(text_parts)
+                    ]
+                
+                for chunk_index, (chunk_id, text_content, chunk_metadata) in enumerate(chunks):
+                    # 原始表格只附在第一個區段，其餘區段以 parent_table_id 參照，避免每段重複整份表格
+                    original_table = {"original_table_data": table} if chunk_index == 0 else {}
+                    # 建立文本資料物件
+                    table_text = TableTextData(
+                        table_id=chunk_id,
+                        content=text_content,
+                        metadata={
+                            **original_table,
+                            "source_page": table.get("source_page"),
+                            "source_file": table.get("source_file"),
+                            "table_type": table.get("table_type"),
+                            "confidence": table.get("confidence"),
+                            "extractor_method": table.get("extractor_method"),
+                            "conversion_date": datetime.now().isoformat(),
+                            "table_index": i + 1,
+                            "parent_table_id": base_id,
+                            "token_count": (
+                                self.budget_planner.count_tokens(text_content)
+                                if self.budget_planner else None
+                            ),
+                            **chunk_metadata
+                        }
+                    )
+                    converted_tables.append(table_text)
+                    self.conversion_stats["total_text_length"] += len(text_content)
                 
-                converted_tables.append(table_text)
                 self.conversion_stats["converted_tables"] += 1
-                self.conversion_stats["total_text_length"] += len(text_content)
+                self.conversion_stats["total_documents"] += len(chunks)
+                if len(chunks) > 1:
+                    self.conversion_stats["split_tables"] += 1
                 
             except Exception as e:
                 logger.warning(f"轉換第{i+1}個表格失敗: {e}")
         
+        # 檢查轉換結果是否都落在嵌入預算內
+        if self.budget_planner is not None:
+            budget_report = self.budget_planner.plan(
+                (table.content for table in converted_tables),
+                (table.metadata.get("token_count") for table in converted_tables)
+            )
+            self.conversion_stats["budget_report"] = budget_report.to_dict()
+            if budget_report.over_budget_texts:
+                logger.warning(f"❌ {budget_report.over_budget_texts} 個表格文本超出嵌入預算 "
+                               f"(將截斷 {budget_report.truncated_tokens} tokens)")
+        
         # 儲存結果
         if output_path:
             self.save_converted_tables(converted_tables, output_path)
         
         logger.info(f"轉換完成: {self.conversion_stats['converted_tables']}/{self.conversion_stats['total_tables']} 個表格")
         logger.info(f"總文本長度: {self.conversion_stats['total_text_length']} 字元")
+        if self.conversion_stats["split_tables"]:
+            logger.info(f"拆分為多份文本的表格: {self.conversion_stats['split_tables']} 個 "
+                        f"(共 {self.conversion_stats['total_documents']} 個文本區段)")
         
         return converted_tables
     
-    def save_converted_tables(self, converted_tables: List[TableTextData], output_path: str) -> None:
+    def save_converted_tables(self, converted_tables: List[TableTextData], output_path: str,
+                              write_store: bool = True) -> None:
         """
         儲存轉換後的表格文本
         
         Args:
             converted_tables: 轉換後的表格文本列表
             output_path: 輸出檔案路徑
+            write_store: 是否同時寫入同目錄的 SQLite 表格儲存庫並更新 manifest
         """
+        # 同一表格可能拆成多段，表格數以來源表格計算
+        table_indexes = {table.metadata.get("table_index", table.table_id) for table in converted_tables}
+        
         output_data = {
             "conversion_date": datetime.now().isoformat(),
-            "total_tables": len(converted_tables),
+            "total_tables": len(table_indexes),
+            "total_documents": len(converted_tables),
             "conversion_stats": self.conversion_stats,
             "table_texts": [
                 {
@@ -227,9 +481,17 @@ class TableTextConverter:
         
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
+            # 不縮排：JSON 僅供匯出與相容，讀取端使用 SQLite 儲存庫與 manifest
+            json.dump(output_data, f, ensure_ascii=False, separators=(',', ':'))
         
         logger.info(f"表格文本已儲存到: {output_path}")
+        
+        if write_store:
+            # manifest 記錄 JSON 的簽章，之後 JSON 被單獨改寫時讀取端可偵測 manifest 已過期
+            TableStore(Path(output_path).with_name(DEFAULT_DB_NAME)).replace_table_texts(
+                output_data["table_texts"],
+                manifest_fields=table_texts_signature(output_path)
+            )
     
     def get_conversion_stats(self) -> Dict[str, Any]:
         """獲取轉換統計資訊"""
@@ -238,7 +500,10 @@ class TableTextConverter:
 
 def convert_tables_to_text_demo():
     """Demo函數：轉換表格為文本"""
-    converter = TableTextConverter()
+    converter = TableTextConverter(
+        budget_planner=ChunkBudgetPlanner(),
+        chunk_mode=os.getenv("RAG_TABLE_CHUNK_MODE", DEFAULT_TABLE_CHUNK_MODE)
+    )
     
     # 輸入和輸出路徑
     json_path = "data/processed/extracted_tables.json"
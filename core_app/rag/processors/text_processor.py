@@ -8,9 +8,11 @@ import json
 import logging
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+from .sentence_chunker import DEFAULT_OVERLAP_TOKENS
+from .token_budget import ChunkBudgetPlanner
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,8 +20,15 @@ logger = logging.getLogger(__name__)
 class CREMTextProcessor:
     """CREM 文本處理器 - 專門處理趨勢科技技術文檔"""
     
-    def __init__(self):
-        """初始化文本處理器"""
+    def __init__(self, budget_planner: Optional[ChunkBudgetPlanner] = None,
+                 overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+        """
+        初始化文本處理器
+        
+        Args:
+            budget_planner: 分塊預算規劃器，預設依嵌入模型 tokenizer 建立
+            overlap_tokens (int): 相鄰分塊的重疊 token 數
+        """
         self.technical_terms = [
             "CREM", "CRI", "Cyber Risk", "Risk Management", "AI", "Machine Learning",
             "XDR", "EDR", "SAE", "Trend Vision One", "Exposure Management",
@@ -27,12 +36,9 @@ class CREMTextProcessor:
             "Vulnerability Management", "Compliance", "Governance", "Automation"
         ]
         
-        # 初始化文本分割器
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=512,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
-        )
+        # 初始化句子感知分塊器（以嵌入模型 tokenizer 計算長度，避免超出上限被截斷）
+        self.budget_planner = budget_planner or ChunkBudgetPlanner()
+        self.text_splitter = self.budget_planner.make_chunker(overlap_tokens)
         
         logger.info("初始化 CREM 文本處理器")
     
@@ -180,20 +186,21 @@ class CREMTextProcessor:
         logger.info("開始文本分塊...")
         
         try:
-            # 使用 LangChain 的文本分割器
-            chunks = self.text_splitter.split_text(text)
+            # 使用句子感知分塊器
+            chunks = self.text_splitter.chunk(text)
             
             # 轉換為 Document 對象
             documents = []
             for i, chunk in enumerate(chunks):
-                if chunk.strip():  # 只保留非空塊
+                if chunk.content.strip():  # 只保留非空塊
                     doc = Document(
-                        page_content=chunk.strip(),
+                        page_content=chunk.content.strip(),
                         metadata={
                             "chunk_id": i,
                             "source": "sb-crem.pdf",
-                            "chunk_size": len(chunk),
-                            "technical_terms": self._extract_technical_terms(chunk)
+                            "chunk_size": len(chunk.content),
+                            "token_count": chunk.token_count,
+                            "technical_terms": self._extract_technical_terms(chunk.content)
                         }
                     )
                     documents.append(doc)
@@ -251,6 +258,14 @@ class CREMTextProcessor:
             "large": sum(1 for chunk in chunks if len(chunk.page_content) > 800)
         }
         
+        # 檢查超出嵌入模型長度、會在嵌入時被截斷的分塊
+        # 已記錄於元資料的 token 數直接沿用，缺少時才重新計算
+        budget_report = self.budget_planner.plan(
+            (chunk.page_content for chunk in chunks),
+            (chunk.metadata.get("token_count") for chunk in chunks)
+        )
+        over_budget_chunks = budget_report.over_budget_texts
+        
         # 計算品質分數
         score = 100
         
@@ -268,6 +283,10 @@ class CREMTextProcessor:
         if size_distribution["small"] > total_chunks * 0.3:
             score -= 10
         
+        # 檢查是否有分塊會被截斷
+        if over_budget_chunks:
+            score -= 15
+        
         return {
             "quality_score": max(0, score),
             "total_chunks": total_chunks,
@@ -275,6 +294,9 @@ class CREMTextProcessor:
             "average_length": avg_length,
             "technical_terms_count": technical_terms_count,
             "size_distribution": size_distribution,
+            "token_budget": self.budget_planner.budget,
+            "over_budget_chunks": over_budget_chunks,
+            "budget_report": budget_report.to_dict(),
             "issues": []
         }
     
@@ -0,0 +1,217 @@
+"""
+分塊預算規劃器
+使用嵌入模型的 tokenizer 計算 token 數量，讓文本分塊與表格文本都落在模型可嵌入的長度內
+"""
+
+import os
+import logging
+from functools import lru_cache
+from itertools import repeat
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from .sentence_chunker import SentenceChunker, estimate_tokens, DEFAULT_OVERLAP_TOKENS
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# sentence-transformers 對此模型設定的 max_seq_length，超過的 token 在嵌入時會被直接截斷
+DEFAULT_MAX_SEQ_LENGTH = 128
+
+
+@lru_cache(maxsize=4)
+def _load_tokenizer(model_name: str) -> Optional[Any]:
+    """載入並快取嵌入模型的 tokenizer，無法載入時回傳 None"""
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        logger.warning("❌ transformers 不可用，改用估算方式計算 token")
+        return None
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        logger.info(f"✅ 載入 tokenizer: {model_name}")
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"載入 tokenizer 失敗，改用估算方式計算 token: {e}")
+        return None
+
+
+@dataclass
+class BudgetReport:
+    """分塊預算檢查結果"""
+    total_texts: int
+    over_budget_texts: int
+    total_tokens: int
+    truncated_tokens: int
+    budget: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為可序列化的字典"""
+        return {
+            "total_texts": self.total_texts,
+            "over_budget_texts": self.over_budget_texts,
+            "total_tokens": self.total_tokens,
+            "truncated_tokens": self.truncated_tokens,
+            "budget": self.budget
+        }
+
+
+class ChunkBudgetPlanner:
+    """分塊預算規劃器 - 以嵌入模型的 tokenizer 規劃分塊大小"""
+
+    def __init__(self,
+                 model_name: Optional[str] = None,
+                 max_seq_length: int = DEFAULT_MAX_SEQ_LENGTH,
+                 use_tokenizer: bool = True):
+        """
+        初始化規劃器
+
+        Args:
+            model_name: 嵌入模型名稱，預設讀取 RAG_EMBEDDING_MODEL
+            max_seq_length: 嵌入模型的最大序列長度
+            use_tokenizer: 是否載入模型 tokenizer（False 時使用估算）
+        """
+        self.model_name = model_name or os.getenv("RAG_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.max_seq_length = max_seq_length
+        self.tokenizer = _load_tokenizer(self.model_name) if use_tokenizer else None
+
+        # 嵌入時 tokenizer 會自動加入特殊 token（如 <s>、</s>），需從預算中扣除
+        if self.tokenizer is not None:
+            self.special_tokens = self.tokenizer.num_special_tokens_to_add()
+        else:
+            self.special_tokens = 2
+
+    @property
+    def budget(self) -> int:
+        """單一分塊可用的 token 數量"""
+        return self.max_seq_length - self.special_tokens
+
+    def count_tokens(self, text: str) -> int:
+        """
+        計算文本的 token 數量（不含特殊 token）
+
+        Args:
+            text (str): 文本內容
+
+        Returns:
+            int: token 數量
+        """
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False, verbose=False))
+
+    def fits(self, text: str) -> bool:
+        """檢查文本是否可以完整嵌入"""
+        return self.count_tokens(text) <= self.budget
+
+    def make_chunker(self, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> SentenceChunker:
+        """
+        建立以模型 tokenizer 計算長度的句子分塊器
+
+        Args:
+            overlap_tokens (int): 相鄰分塊的重疊 token 數
+
+        Returns:
+            SentenceChunker: 分塊器
+        """
+        return SentenceChunker(
+            max_tokens=self.budget,
+            overlap_tokens=overlap_tokens,
+            token_counter=self.count_tokens
+        )
+
+    def pack_lines(self,
+                   lines: List[str],
+                   first_header: List[str],
+                   continuation_header: Optional[List[str]] = None) -> List[str]:
+        """
+        將多行內容打包為多個符合預算的區塊，每個區塊都帶有標頭
+
+        Args:
+            lines: 要打包的內容行（例如表格的每一列）
+            first_header: 第一個區塊的標頭行
+            continuation_header: 後續區塊的標頭行，預設與第一個相同
+
+        Returns:
+            List[str]: 打包後的文本區塊
+        """
+        if continuation_header is None:
+            continuation_header = first_header
+
+        parts: List[str] = []
+        header = first_header
+        header_tokens = self.count_tokens("\n".join(header))
+        current: List[str] = []
+        current_tokens = header_tokens
+
+        for line in lines:
+            line_tokens = self.count_tokens(line) + 1  # 換行符號
+            available = self.budget - header_tokens
+
+            # 單行即超過預算時，先以句子分塊器切開
+            if line_tokens > available and available > DEFAULT_OVERLAP_TOKENS:
+                pieces = SentenceChunker(
+                    max_tokens=available - 1,
+                    overlap_tokens=0,
+                    token_counter=self.count_tokens
+                ).split_text(line)
+            else:
+                pieces = [line]
+
+            for piece in pieces:
+                piece_tokens = self.count_tokens(piece) + 1
+                if current and current_tokens + piece_tokens > self.budget:
+                    parts.append("\n".join(header + current))
+                    header = continuation_header
+                    header_tokens = self.count_tokens("\n".join(header))
+                    current = []
+                    current_tokens = header_tokens
+                current.append(piece)
+                current_tokens += piece_tokens
+
+        if current or not parts:
+            parts.append("\n".join(header + current))
+
+        return parts
+
+    def plan(self,
+             texts: Iterable[str],
+             token_counts: Optional[Iterable[Optional[int]]] = None) -> BudgetReport:
+        """
+        檢查一批文本的 token 預算使用情況
+
+        Args:
+            texts: 文本列表
+            token_counts: 與 texts 對應的已知 token 數，None 的項目才重新計算
+
+        Returns:
+            BudgetReport: 超出預算的數量與會被截斷的 token 數
+        """
+        total_texts = 0
+        over_budget = 0
+        total_tokens = 0
+        truncated_tokens = 0
+
+        if token_counts is None:
+            token_counts = repeat(None)
+
+        for text, known_tokens in zip(texts, token_counts):
+            tokens = known_tokens if known_tokens is not None else self.count_tokens(text)
+            total_texts += 1
+            total_tokens += tokens
+            if tokens > self.budget:
+                over_budget += 1
+                truncated_tokens += tokens - self.budget
+
+        return BudgetReport(
+            total_texts=total_texts,
+            over_budget_texts=over_budget,
+            total_tokens=total_tokens,
+            truncated_tokens=truncated_tokens,
+            budget=self.budget
+        )
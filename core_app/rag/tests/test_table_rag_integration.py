@@ -8,12 +8,12 @@ import unittest
 import logging
 from pathlib import Path
 
-# 添加模組路徑
-sys.path.append(str(Path(__file__).parent.parent))
+# 添加專案根目錄（以套件路徑導入）
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
-from processors.table_text_converter import TableTextConverter
-from tools.table_vector_integrator import TableVectorIntegrator 
-from tools.unified_query_engine import UnifiedQueryEngine
+from core_app.rag.processors.table_text_converter import TableTextConverter
+from core_app.rag.tools.table_vector_integrator import TableVectorIntegrator
+from core_app.rag.tools.unified_query_engine import UnifiedQueryEngine
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -1,11 +1,31 @@
 """
 RAG 系統工具模組
 包含知識庫更新和管理工具
+
+各工具在第一次存取時才匯入（知識庫建置工具會載入 LangChain 與嵌入模型）
 """
 
-from .incremental_updater import IncrementalRAGUpdater
-from .crem_knowledge import *
+import importlib
+
+_EXPORTS = {
+    'IncrementalRAGUpdater': '.incremental_updater',
+    'CREMKnowledgeBaseBuilder': '.crem_knowledge',
+    'build_and_save_knowledge_base': '.crem_knowledge'
+}
 
 __all__ = [
     'IncrementalRAGUpdater',
-] 
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    """第一次存取時匯入對應的工具模組"""
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,110 @@
+"""
+答案快取
+以 TTL + LRU 保存已生成的完整回答，相同問題在有效期間內直接回傳；
+逾時降級的請求在背景完成 LLM 生成後也寫入此快取，供下一位提問者使用
+"""
+
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 600.0
+
+
+class AnswerCache:
+    """執行緒安全的 TTL + LRU 答案快取"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """
+        初始化答案快取
+
+        Args:
+            max_entries: 最多保存的回答數量，超過時淘汰最久未使用的項目
+            ttl_seconds: 回答的有效秒數
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted": 0,
+            "stores": 0
+        }
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        取得快取的回答
+
+        Args:
+            key: 快取鍵值
+
+        Returns:
+            回答的深複製（呼叫端可自由修改），未命中或已過期時回傳 None
+
+        >>> cache = AnswerCache(max_entries=2)
+        >>> cache.set("q", {"answer": "CREM"})
+        >>> cache.get("q")["answer"], cache.get("missing")
+        ('CREM', None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Dict[str, Any], ttl_seconds: Optional[float] = None) -> None:
+        """
+        寫入回答（保存深複製，之後修改原物件不影響快取）
+
+        Args:
+            key: 快取鍵值
+            value: 回答
+            ttl_seconds: 此項目的有效秒數，預設使用快取設定
+        """
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        snapshot = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, snapshot)
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self) -> None:
+        """清除所有回答"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取快取統計資訊"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+            stats["ttl_seconds"] = self.ttl_seconds
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] / lookups * 100) if lookups > 0 else 0
+        return stats
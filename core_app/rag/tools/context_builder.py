@@ -0,0 +1,205 @@
+"""
+Prompt 上下文建構器
+將檢索結果依相關度組成送入 LLM 的上下文：估算 token 數量、去除相鄰分塊的重疊文字
+與不同提取器產生的重複表格，並在 token 預算內依相關度截取
+"""
+
+import os
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..processors.sentence_chunker import estimate_tokens
+from .lexical_index import tokenize
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_MAX_TOKENS = 2000
+# 相鄰分塊的重疊文字（分塊重疊約 16 tokens 的完整句子）至少需達此長度才去除，避免誤刪常見短詞
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 200
+# 同頁表格的詞彙相似度達此門檻時視為不同提取器產生的重複表格
+DUPLICATE_TABLE_SIMILARITY = 0.8
+# 超出預算時，剩餘預算至少需達此數量才截斷加入最後一段，否則直接捨棄
+MIN_PARTIAL_TOKENS = 48
+
+
+@dataclass
+class ContextPassage:
+    """上下文中的單一段落"""
+    rank: int  # 檢索結果中的原始排名
+    content_type: str
+    source: str
+    content: str
+    source_page: Optional[Any] = None
+    tokens: int = 0
+
+
+@dataclass
+class BuiltContext:
+    """建構完成的上下文"""
+    text: str
+    passages: List[ContextPassage]
+    tokens: int
+    budget: int
+    dropped: Dict[str, int] = field(default_factory=dict)
+    overlap_chars_removed: int = 0
+
+    def to_stats(self) -> Dict[str, Any]:
+        """轉換為回應中使用的統計字典"""
+        return {
+            "context_tokens": self.tokens,
+            "context_budget": self.budget,
+            "passages_used": len(self.passages),
+            "dropped": dict(self.dropped),
+            "overlap_chars_removed": self.overlap_chars_removed
+        }
+
+
+def overlap_length(left: str, right: str, min_overlap: int = MIN_OVERLAP_CHARS,
+                   max_overlap: int = MAX_OVERLAP_CHARS) -> int:
+    """
+    計算 left 結尾與 right 開頭重疊的字元數
+
+    >>> overlap_length("風險事件包含登入異常與惡意連線", "登入異常與惡意連線，以及弱認證", min_overlap=4)
+    9
+    >>> overlap_length("abc", "xyz")
+    0
+    """
+    longest = min(len(left), len(right), max_overlap)
+    for length in range(longest, min_overlap - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def _token_similarity(left: str, right: str) -> float:
+    """兩段文字索引詞集合的 Jaccard 相似度"""
+    left_terms, right_terms = set(tokenize(left)), set(tokenize(right))
+    if not left_terms or not right_terms:
+        return 0.0
+    return len(left_terms & right_terms) / len(left_terms | right_terms)
+
+
+class ContextBuilder:
+    """Prompt 上下文建構器"""
+
+    def __init__(self, max_tokens: Optional[int] = None, min_overlap: int = MIN_OVERLAP_CHARS):
+        """
+        初始化上下文建構器
+
+        Args:
+            max_tokens: 上下文 token 預算（預設讀取 RAG_CONTEXT_MAX_TOKENS）
+            min_overlap: 去除重疊文字的最小長度
+        """
+        self.max_tokens = max_tokens or int(os.getenv("RAG_CONTEXT_MAX_TOKENS", DEFAULT_CONTEXT_MAX_TOKENS))
+        self.min_overlap = min_overlap
+
+    def build(self, results: Sequence[Any]) -> BuiltContext:
+        """
+        建構上下文
+
+        Args:
+            results: 依相關度排序的 QueryResult 列表（有 full_content 時使用完整內容，
+                而非截斷後的顯示內容）
+
+        Returns:
+            BuiltContext: 上下文文本、使用的段落與統計
+        """
+        passages: List[ContextPassage] = []
+        dropped = {"duplicate_table": 0, "duplicate_text": 0, "over_budget": 0}
+        overlap_removed = 0
+        used_tokens = 0
+
+        for rank, result in enumerate(results, 1):
+            content = (getattr(result, "full_content", None) or result.content).strip()
+
+            if result.content_type == "table":
+                if self._is_duplicate_table(result, passages):
+                    dropped["duplicate_table"] += 1
+                    continue
+            else:
+                content, removed = self._strip_overlap(content, passages)
+                overlap_removed += removed
+                if not content or any(content in passage.content for passage in passages):
+                    dropped["duplicate_text"] += 1
+                    continue
+
+            passage = ContextPassage(rank, result.content_type, str(result.source), content,
+                                     source_page=result.metadata.get("source_page"))
+            passage.tokens = estimate_tokens(self._format_passage(passage, len(passages) + 1))
+
+            remaining = self.max_tokens - used_tokens
+            if passage.tokens > remaining:
+                # 第一段（最相關）一定截斷加入；之後的段落只有剩餘預算足夠時才截斷加入
+                if remaining < MIN_PARTIAL_TOKENS or (passages and remaining < passage.tokens // 2):
+                    dropped["over_budget"] += 1
+                    continue
+                passage = self._truncate_passage(passage, len(passages) + 1, remaining)
+
+            passages.append(passage)
+            used_tokens += passage.tokens
+
+        text = "\n\n".join(self._format_passage(passage, i) for i, passage in enumerate(passages, 1))
+        return BuiltContext(
+            text=text,
+            passages=passages,
+            tokens=used_tokens,
+            budget=self.max_tokens,
+            dropped={reason: count for reason, count in dropped.items() if count},
+            overlap_chars_removed=overlap_removed
+        )
+
+    def _format_passage(self, passage: ContextPassage, number: int) -> str:
+        """格式化單一段落（與原本 ask_question 的上下文格式相同）"""
+        label = "表格資料" if passage.content_type == "table" else "文本資料"
+        return f"[{label} {number}] 來源: {passage.source}\n{passage.content}"
+
+    def _strip_overlap(self, content: str, passages: List[ContextPassage]) -> Tuple[str, int]:
+        """去除與已選段落重疊的開頭或結尾文字，回傳 (內容, 去除的字元數)"""
+        removed = 0
+        for passage in passages:
+            if passage.content_type == "table":
+                continue
+            head = overlap_length(passage.content, content, self.min_overlap)
+            if head:
+                content = content[head:].lstrip()
+                removed += head
+            tail = overlap_length(content, passage.content, self.min_overlap)
+            if tail:
+                content = content[:-tail].rstrip()
+                removed += tail
+        return content, removed
+
+    def _is_duplicate_table(self, result: Any, passages: List[ContextPassage]) -> bool:
+        """同一頁面已有內容幾乎相同的表格（不同提取器的結果）時視為重複"""
+        page = result.metadata.get("source_page")
+        for passage in passages:
+            if passage.content_type != "table":
+                continue
+            if page != passage.source_page:
+                continue
+            content = getattr(result, "full_content", None) or result.content
+            if _token_similarity(content, passage.content) >= DUPLICATE_TABLE_SIMILARITY:
+                return True
+        return False
+
+    def _truncate_passage(self, passage: ContextPassage, number: int, budget: int) -> ContextPassage:
+        """將段落截斷至 token 預算內（以二分搜尋找出最長的前綴）"""
+        def truncated_to(length: int) -> ContextPassage:
+            return ContextPassage(passage.rank, passage.content_type, passage.source,
+                                  passage.content[:length].rstrip() + "...", passage.source_page)
+
+        low, high = 0, len(passage.content)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(self._format_passage(truncated_to(middle), number)) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+
+        truncated = truncated_to(low)
+        truncated.tokens = estimate_tokens(self._format_passage(truncated, number))
+        return truncated
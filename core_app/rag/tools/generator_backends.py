@@ -0,0 +1,187 @@
+"""
+本地答案生成後端
+提供與 ChatGoogleGenerativeAI 相同 invoke 介面的替代生成器，
+讓壓力測試與離線（無外部網路）的測試環境也能跑完整的檢索 + 生成流程：
+- LocalStandInLLM：決定性的模擬生成器，依設定的延遲分佈與 token 速率等待後回傳摘錄式答案
+- LlamaCppLLM：以 llama-cpp-python 載入本地 GGUF 模型生成答案（選用套件）
+"""
+
+import re
+import math
+import time
+import zlib
+import random
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from ..processors.sentence_chunker import estimate_tokens
+
+if TYPE_CHECKING:
+    from langchain_core.messages import AIMessage
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 支援的生成後端（LLM_BACKEND）
+GEMINI_BACKEND = "gemini"
+LOCAL_STAND_IN_BACKEND = "local_stub"
+LLAMA_CPP_BACKEND = "llama_cpp"
+LLM_BACKENDS = (GEMINI_BACKEND, LOCAL_STAND_IN_BACKEND, LLAMA_CPP_BACKEND)
+
+# 模擬生成器從 prompt 摘錄檢索結果的區段標記（對應 TrendMicroQASystem 的 Prompt 本體）
+CONTEXT_SECTION_PATTERN = re.compile(r"=== 檢索結果[^\n]*===\n(.*?)\n=== 用戶問題 ===", re.DOTALL)
+
+
+def _extract_context(prompt: str) -> str:
+    """
+    取出 prompt 中的檢索結果區段，找不到區段標記時回傳整個 prompt
+
+    >>> _extract_context("指示\\n=== 檢索結果 (1個結果) ===\\nCREM 概述\\n=== 用戶問題 ===\\nCREM？")
+    'CREM 概述'
+    """
+    match = CONTEXT_SECTION_PATTERN.search(prompt)
+    return (match.group(1) if match else prompt).strip()
+
+
+def _message(content: str) -> "AIMessage":
+    """建立與 ChatGoogleGenerativeAI 相同型別的回應訊息（第一次生成時才載入 langchain_core）"""
+    from langchain_core.messages import AIMessage
+    return AIMessage(content=content)
+
+
+class LocalStandInLLM:
+    """
+    決定性的本地模擬生成器
+
+    首個 token 延遲取自對數常態分佈（中位數 latency_median、形狀 latency_sigma），
+    再依 tokens_per_second 加上輸出 token 的生成時間。亂數以 seed 與 prompt 內容決定，
+    相同 prompt 每次得到相同的答案與延遲，方便比較不同設定下的壓測結果
+    """
+
+    def __init__(self, latency_median: float = 0.8, latency_sigma: float = 0.4,
+                 tokens_per_second: float = 40.0, max_tokens: int = 300, seed: int = 0,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        初始化模擬生成器
+
+        Args:
+            latency_median: 首個 token 延遲的中位數（秒）
+            latency_sigma: 首個 token 延遲的對數常態分佈形狀參數（0 表示固定延遲）
+            tokens_per_second: 輸出 token 速率（0 表示不模擬生成時間）
+            max_tokens: 最大輸出 token 數
+            seed: 亂數種子
+            sleep: 等待函式（測試時可替換）
+        """
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.max_tokens = max_tokens
+        self.seed = seed
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "output_tokens": 0,
+            "simulated_seconds": 0.0
+        }
+
+    def _compose_answer(self, prompt: str) -> str:
+        """以檢索結果的開頭組成摘錄式答案，長度不超過 max_tokens"""
+        lines = [line.strip() for line in _extract_context(prompt).splitlines() if line.strip()]
+        answer = "**📋 摘要**\n"
+        for line in lines:
+            candidate = f"{answer}{line}\n"
+            if estimate_tokens(candidate) > self.max_tokens:
+                break
+            answer = candidate
+        return answer.strip()
+
+    def simulated_latency(self, prompt: str, output_tokens: int) -> float:
+        """
+        計算 prompt 的模擬延遲（秒）
+
+        >>> llm = LocalStandInLLM(latency_median=0.5, latency_sigma=0, tokens_per_second=100)
+        >>> llm.simulated_latency("CREM", 50)
+        1.0
+        """
+        rng = random.Random(self.seed * 1_000_003 + zlib.crc32(prompt.encode("utf-8")))
+        first_token = self.latency_median * math.exp(rng.gauss(0.0, self.latency_sigma)) if self.latency_sigma > 0 \
+            else self.latency_median
+        generation = output_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        return first_token + generation
+
+    def invoke(self, prompt: str, **kwargs: Any) -> "AIMessage":
+        """
+        生成答案（忽略 Gemini 專用參數，例如 cached_content）
+
+        Args:
+            prompt: 完整 prompt
+
+        Returns:
+            與 ChatGoogleGenerativeAI 相同的訊息物件
+        """
+        answer = self._compose_answer(str(prompt))
+        output_tokens = estimate_tokens(answer)
+        latency = self.simulated_latency(str(prompt), output_tokens)
+        self._sleep(latency)
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["output_tokens"] += output_tokens
+            self.stats["simulated_seconds"] += latency
+        return _message(answer)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取模擬生成統計"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["backend"] = LOCAL_STAND_IN_BACKEND
+        stats["average_latency"] = (stats["simulated_seconds"] / stats["calls"]) if stats["calls"] > 0 else 0
+        return stats
+
+
+class LlamaCppLLM:
+    """以 llama-cpp-python 在本機執行 GGUF 模型的生成器"""
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: Optional[int] = None,
+                 max_tokens: int = 300, temperature: float = 0.05):
+        """
+        載入本地模型
+
+        Args:
+            model_path: GGUF 模型檔路徑
+            n_ctx: 上下文長度（需容納完整 prompt 與輸出）
+            n_threads: 推論執行緒數，None 表示由 llama.cpp 決定
+            max_tokens: 最大輸出 token 數
+            temperature: 取樣溫度
+
+        Raises:
+            ImportError: 未安裝 llama-cpp-python 時
+            FileNotFoundError: 模型檔不存在時
+        """
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise ImportError("使用 llama_cpp 後端需安裝 llama-cpp-python: pip install llama-cpp-python") from e
+
+        if not Path(model_path).exists():
+            raise FileNotFoundError(f"本地模型檔不存在: {model_path}")
+
+        self.model_path = model_path
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self._model = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        # llama.cpp 的模型狀態不可並行存取，推論一次只執行一個
+        self._lock = threading.Lock()
+        logger.info(f"✅ 本地模型載入成功: {model_path}")
+
+    def invoke(self, prompt: str, **kwargs: Any) -> "AIMessage":
+        """生成答案（忽略 Gemini 專用參數，例如 cached_content）"""
+        with self._lock:
+            completion = self._model.create_completion(
+                str(prompt), max_tokens=self.max_tokens, temperature=self.temperature
+            )
+        return _message(completion["choices"][0]["text"].strip())
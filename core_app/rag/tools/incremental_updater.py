@@ -16,13 +16,9 @@ from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 
-# 修改這裡：使用系統路徑導入
-import sys
-from pathlib import Path
-sys.path.append(str(Path(__file__).parent.parent))
-
-from processors.text_processor import CREMTextProcessor
-from processors.pdf_processor import extract_pdf_text  # 使用函數而不是類別
+from ..processors.text_processor import CREMTextProcessor
+from ..processors.pdf_processor import extract_pdf_text  # 使用函數而不是類別
+from ..processors.page_cache import PageCache
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -47,13 +43,30 @@ class IncrementalRAGUpdater:
         self.data_dir = Path(data_dir)
         self.vector_dir = Path(vector_dir)
         self.metadata_file = self.data_dir / "processed_files.json"
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+        self.cache_dir = self.data_dir / "cache"
+        # 頁面快取：改版後的 PDF 只重新提取內容有變更的頁面
+        self.page_cache = PageCache(self.cache_dir / "pages")
+        self.embeddings = self._build_embeddings(
+            "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
         )
         self.text_processor = CREMTextProcessor()
         # 移除 self.pdf_processor，我們會直接使用函數
         self.processed_files: Dict[str, FileMetadata] = self._load_processed_files()
     
+    def _build_embeddings(self, model_name: str):
+        """建立嵌入模型，並以分塊內容雜湊快取文件嵌入（未變更的分塊不需重新計算）"""
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        try:
+            from langchain.embeddings import CacheBackedEmbeddings
+            from langchain.storage import LocalFileStore
+        except ImportError:
+            logger.warning("❌ CacheBackedEmbeddings 不可用，不快取分塊嵌入")
+            return embeddings
+        
+        store = LocalFileStore(str(self.cache_dir / "embeddings"))
+        # 以模型名稱作為命名空間，更換模型時不會誤用舊的嵌入
+        return CacheBackedEmbeddings.from_bytes_store(embeddings, store, namespace=model_name)
+    
     def _load_processed_files(self) -> Dict[str, FileMetadata]:
         """載入已處理文件的元資料"""
         if self.metadata_file.exists():
@@ -169,7 +182,7 @@ class IncrementalRAGUpdater:
         if file_path.suffix.lower() == '.pdf':
             # 處理 PDF 文件 - 使用函數而不是類別
             try:
-                extracted_text = extract_pdf_text(str(file_path))
+                extracted_text = extract_pdf_text(str(file_path), page_cache=self.page_cache)
                 cleaned_text = self.text_processor.clean_text(extracted_text)
                 chunks = self.text_processor.chunk_text(cleaned_text)
             except Exception as e:
@@ -312,7 +325,8 @@ class IncrementalRAGUpdater:
             "total_files": len(self.processed_files),
             "vector_count": vector_db.index.ntotal if vector_db else 0,
             "vector_dim": vector_db.index.d if vector_db else 0,
-            "file_changes": file_changes
+            "file_changes": file_changes,
+            "page_cache": self.page_cache.get_stats()
         }
         
         logger.info(f"增量更新完成: {stats}")
@@ -0,0 +1,412 @@
+"""
+查詢指標登錄
+以單一鎖保護的計數器與延遲直方圖取代各元件中以 += 直接修改的統計字典，
+在執行緒池中並行處理請求時計數不會遺失，並記錄各階段（嵌入、搜尋、格式化、LLM、總計）的延遲分佈；
+PrometheusExposition 將指標輸出為 Prometheus 文字格式，供 /metrics 端點抓取；
+多 worker 部署時由 MultiprocessMetrics 經共用目錄彙總各 worker 的指標
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 延遲直方圖的桶上限（秒），涵蓋毫秒級的嵌入與搜尋到數十秒的 LLM 生成
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Prometheus 文字格式的 Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class LatencyHistogram:
+    """固定桶的延遲直方圖（非執行緒安全，由 MetricsRegistry 的鎖保護）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # 最後一個桶收集超過最大上限的觀測值
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """記錄一次觀測值"""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def copy(self) -> "LatencyHistogram":
+        """複製目前的狀態"""
+        histogram = LatencyHistogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        histogram.max = self.max
+        return histogram
+
+    def quantile(self, q: float) -> float:
+        """
+        以桶內線性內插估計分位數（秒）
+
+        >>> histogram = LatencyHistogram(buckets=(0.1, 0.2, 0.4))
+        >>> for seconds in (0.05, 0.15, 0.15, 0.3):
+        ...     histogram.observe(seconds)
+        >>> round(histogram.quantile(0.5), 3)
+        0.15
+        >>> histogram.quantile(1.0)
+        0.3
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                # 超過最大上限的桶與最後一個有資料的桶以實際最大值為上限
+                upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """延遲摘要（毫秒）"""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+
+class MetricsRegistry:
+    """
+    執行緒安全的指標登錄（計數器、最新值與各階段延遲直方圖）
+
+    所有更新都在同一把鎖內完成，臨界區只有幾個加法，不會成為並行瓶頸
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        """
+        初始化指標登錄
+
+        Args:
+            buckets: 延遲直方圖的桶上限（秒）
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._values: Dict[str, Any] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        """
+        累加計數器
+
+        >>> metrics = MetricsRegistry()
+        >>> metrics.increment("total_queries")
+        >>> metrics.increment("text_results", 3)
+        >>> metrics.get("total_queries"), metrics.get("text_results"), metrics.get("missing")
+        (1, 3, 0)
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name: str, value: Any) -> None:
+        """設定最新值（例如最後查詢時間）"""
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str, default: Any = 0) -> Any:
+        """讀取計數器或最新值"""
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._values.get(name, default)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """記錄階段延遲（秒）"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+        """
+        計時區塊並記錄到階段延遲直方圖（區塊拋出例外時同樣記錄）
+
+        Args:
+            stage: 階段名稱
+            timings: 單次請求的階段耗時字典（毫秒），提供時一併寫入
+
+        >>> metrics = MetricsRegistry()
+        >>> timings = {}
+        >>> with metrics.timer("embed", timings):
+        ...     pass
+        >>> metrics.histogram("embed").count, "embed" in timings
+        (1, True)
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.observe(stage, elapsed)
+            if timings is not None:
+                timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        """取得階段延遲直方圖的複本（尚無觀測值時為空直方圖）"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            return histogram.copy() if histogram is not None else LatencyHistogram(self.buckets)
+
+    def counters(self) -> Dict[str, Any]:
+        """計數器與最新值的複本"""
+        with self._lock:
+            return {**self._counters, **self._values}
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        """所有階段延遲直方圖的複本"""
+        with self._lock:
+            return {stage: histogram.copy() for stage, histogram in self._histograms.items()}
+
+    def latency_summary(self) -> Dict[str, Dict[str, Any]]:
+        """各階段的延遲摘要（毫秒）"""
+        return {stage: histogram.summary() for stage, histogram in self.histograms().items()}
+
+    def reset(self) -> None:
+        """清除所有指標"""
+        with self._lock:
+            self._counters.clear()
+            self._values.clear()
+            self._histograms.clear()
+
+
+def _format_value(value: float) -> str:
+    """
+    Prometheus 樣本值格式
+
+    >>> _format_value(3), _format_value(0.25), _format_value(float("inf"))
+    ('3', '0.25', '+Inf')
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """
+    Prometheus 標籤格式（跳脫反斜線、引號與換行）
+
+    >>> _format_labels({"endpoint": "/ask", "status": "200"})
+    '{endpoint="/ask",status="200"}'
+    >>> _format_labels({})
+    ''
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class PrometheusExposition:
+    """
+    Prometheus 文字格式（0.0.4）輸出建構器
+
+    >>> exposition = PrometheusExposition()
+    >>> exposition.gauge("rag_vector_count", "向量數", 42)
+    >>> print(exposition.render(), end="")
+    # HELP rag_vector_count 向量數
+    # TYPE rag_vector_count gauge
+    rag_vector_count 42
+    """
+
+    def __init__(self):
+        # 指標名稱 -> {"type", "help", "samples": [[名稱後綴, 標籤, 數值], ...]}
+        self._families: Dict[str, Dict[str, Any]] = {}
+
+    def _family(self, name: str, metric_type: str, help_text: str) -> List[list]:
+        """取得（或建立）指標家族的樣本列表"""
+        family = self._families.setdefault(name, {"type": metric_type, "help": help_text, "samples": []})
+        return family["samples"]
+
+    def add(self, name: str, metric_type: str, help_text: str,
+            samples: Iterable[Tuple[Dict[str, str], float]]) -> None:
+        """
+        加入一個指標家族
+
+        Args:
+            name: 指標名稱
+            metric_type: counter 或 gauge
+            help_text: 說明
+            samples: (標籤, 數值) 列表
+        """
+        family = self._family(name, metric_type, help_text)
+        for labels, value in samples:
+            family.append(["", dict(labels), value])
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """加入單一樣本的計數器"""
+        self.add(name, "counter", help_text, [(labels or {}, value)])
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """加入單一樣本的量測值"""
+        self.add(name, "gauge", help_text, [(labels or {}, value)])
+
+    def histogram(self, name: str, help_text: str, histograms: Dict[str, LatencyHistogram], label: str) -> None:
+        """
+        加入延遲直方圖家族（桶為累計計數，單位為秒）
+
+        Args:
+            name: 指標名稱（建議以 _seconds 結尾）
+            help_text: 說明
+            histograms: 標籤值 -> 直方圖
+            label: 區分各直方圖的標籤名稱
+        """
+        family = self._family(name, "histogram", help_text)
+        for label_value, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for upper, bucket_count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += bucket_count
+                family.append(["_bucket", {label: label_value, "le": _format_value(upper)}, cumulative])
+            family.append(["_sum", {label: label_value}, histogram.sum])
+            family.append(["_count", {label: label_value}, histogram.count])
+
+    def render(self) -> str:
+        """輸出完整的文字格式內容"""
+        lines = []
+        for name, family in self._families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for suffix, labels, value in family["samples"]:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """可 JSON 序列化的內容（多 worker 彙總時寫入共用目錄）"""
+        return self._families
+
+    @classmethod
+    def merge(cls, snapshots: Dict[str, Dict[str, Dict[str, Any]]],
+              live_workers: Iterable[str]) -> "PrometheusExposition":
+        """
+        彙總多個 worker 的指標
+
+        計數器與直方圖以相同名稱與標籤相加（已結束的 worker 最後一次的數值仍計入，總數不會倒退）；
+        量測值只保留存活的 worker，並加上 worker 標籤
+
+        Args:
+            snapshots: worker 識別 -> snapshot()
+            live_workers: 存活的 worker 識別
+
+        >>> first, second = PrometheusExposition(), PrometheusExposition()
+        >>> first.counter("rag_requests_total", "請求數", 3)
+        >>> second.counter("rag_requests_total", "請求數", 4)
+        >>> merged = PrometheusExposition.merge({"1": first.snapshot(), "2": second.snapshot()}, ["1", "2"])
+        >>> [line for line in merged.render().splitlines() if not line.startswith("#")]
+        ['rag_requests_total 7']
+        """
+        live_workers = set(live_workers)
+        merged = cls()
+        totals: Dict[Tuple[str, str, Tuple[Tuple[str, str], ...]], list] = {}
+        for worker, families in sorted(snapshots.items()):
+            for name, family in families.items():
+                samples = merged._family(name, family["type"], family["help"])
+                for suffix, labels, value in family["samples"]:
+                    if family["type"] == "gauge":
+                        if worker in live_workers:
+                            samples.append([suffix, {**labels, "worker": worker}, value])
+                        continue
+                    key = (name, suffix, tuple(sorted(labels.items())))
+                    if key in totals:
+                        totals[key][2] += value
+                    else:
+                        totals[key] = [suffix, dict(labels), value]
+                        samples.append(totals[key])
+        return merged
+
+
+class MultiprocessMetrics:
+    """
+    多 worker 部署時彙總 /metrics
+
+    每個 worker 定期（以及被抓取時）將自己的指標寫入共用目錄的 <pid>.json，
+    被抓取的 worker 讀取目錄中所有檔案並彙總，任何一次抓取都得到全部 worker 的總數
+    """
+
+    def __init__(self, directory: str, worker_id: Optional[str] = None):
+        """
+        初始化彙總
+
+        Args:
+            directory: 所有 worker 都能讀寫的目錄（每次部署使用新目錄，避免沿用上次部署的計數）
+            worker_id: 此 worker 的識別，預設為 pid
+        """
+        self.directory = Path(directory)
+        self.worker_id = worker_id or str(os.getpid())
+
+    def write(self, exposition: PrometheusExposition) -> None:
+        """寫入此 worker 的指標（先寫入暫存檔再替換，讀取端不會讀到寫到一半的檔案）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(exposition.snapshot(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.directory / f"{self.worker_id}.json")
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def collect(self, exposition: PrometheusExposition) -> PrometheusExposition:
+        """
+        寫入此 worker 最新的指標後彙總所有 worker
+
+        Args:
+            exposition: 此 worker 目前的指標
+
+        Returns:
+            彙總後的指標
+        """
+        self.write(exposition)
+        snapshots = {}
+        for path in self.directory.glob("*.json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshots[path.stem] = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"讀取 worker 指標失敗: {path} ({e})")
+        live_workers = [worker for worker in snapshots if worker == self.worker_id or _process_alive(worker)]
+        return PrometheusExposition.merge(snapshots, live_workers)
+
+
+def _process_alive(worker_id: str) -> bool:
+    """以 pid 判斷 worker 是否仍在執行"""
+    try:
+        os.kill(int(worker_id), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
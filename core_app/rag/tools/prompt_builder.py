@@ -0,0 +1,138 @@
+"""
+預先編譯的 Prompt 模板
+將固定的指示前綴在啟動時組成一次，每次請求只以 str.format 填入動態部分；
+Gemini 支援 context caching 時，前綴可改由伺服器端快取，不需隨每次請求重送
+"""
+
+import time
+import string
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from ..processors.sentence_chunker import estimate_tokens
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 快取到期前多久就重新建立，避免請求送出時剛好過期
+CACHE_REFRESH_MARGIN_SECONDS = 60
+
+
+def _template_fields(template: str) -> List[str]:
+    """
+    取得模板中的欄位名稱（依出現順序，不重複）
+
+    >>> _template_fields("{context}\\n{question}\\n{context}")
+    ['context', 'question']
+    """
+    fields = []
+    for _, field_name, _, _ in string.Formatter().parse(template):
+        if field_name and field_name not in fields:
+            fields.append(field_name)
+    return fields
+
+
+class CompiledPromptTemplate:
+    """預先編譯的 Prompt 模板（固定前綴 + 動態本體）"""
+
+    def __init__(self, prefix: str, body: str):
+        """
+        初始化模板
+
+        Args:
+            prefix: 固定的指示前綴（不可包含欄位）
+            body: 含 {欄位} 的動態本體
+
+        Raises:
+            ValueError: 前綴包含欄位時
+        """
+        prefix_fields = _template_fields(prefix)
+        if prefix_fields:
+            raise ValueError(f"Prompt 前綴不可包含欄位: {prefix_fields}")
+
+        # 前綴不經過 format，需先將 {{ }} 還原
+        self.prefix = prefix.replace("{{", "{").replace("}}", "}")
+        self.body = body
+        self.input_variables = _template_fields(body)
+        self.prefix_tokens = estimate_tokens(self.prefix)
+
+    def format_body(self, **values: Any) -> str:
+        """只填入動態本體（前綴已由伺服器端快取時使用）"""
+        return self.body.format(**values)
+
+    def format(self, **values: Any) -> str:
+        """
+        產生完整的 prompt
+
+        >>> template = CompiledPromptTemplate("你是資安專家。\\n", "問題: {question}")
+        >>> template.format(question="CRI 是什麼？")
+        '你是資安專家。\\n問題: CRI 是什麼？'
+        """
+        return self.prefix + self.body.format(**values)
+
+
+class GeminiPrefixCache:
+    """以 Gemini context caching 快取 prompt 前綴（失敗時停用，改送完整 prompt）"""
+
+    def __init__(self, model_name: str, prefix: str, api_key: Optional[str] = None,
+                 ttl_minutes: int = 60):
+        """
+        初始化前綴快取
+
+        Args:
+            model_name: Gemini 模型名稱
+            prefix: 要快取的 prompt 前綴（作為 system instruction）
+            api_key: Google API Key
+            ttl_minutes: 快取存活時間（分鐘）
+        """
+        self.model_name = model_name
+        self.prefix = prefix
+        self.api_key = api_key
+        self.ttl_minutes = ttl_minutes
+
+        self.name: Optional[str] = None
+        self.expires_at = 0.0
+        self.disabled = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[str]:
+        """
+        取得有效的快取名稱，快取不存在或即將過期時重新建立
+
+        Returns:
+            快取名稱（cached_content），無法使用時回傳 None
+        """
+        if self.disabled:
+            return None
+        if self.name and time.time() < self.expires_at - CACHE_REFRESH_MARGIN_SECONDS:
+            return self.name
+
+        with self._lock:
+            if not self.disabled and not (self.name and time.time() < self.expires_at - CACHE_REFRESH_MARGIN_SECONDS):
+                self._create()
+        return None if self.disabled else self.name
+
+    def _create(self) -> None:
+        """建立伺服器端快取"""
+        try:
+            import google.generativeai as genai
+            from google.generativeai import caching
+
+            if self.api_key:
+                genai.configure(api_key=self.api_key)
+            cache = caching.CachedContent.create(
+                model=f"models/{self.model_name}",
+                system_instruction=self.prefix,
+                ttl=timedelta(minutes=self.ttl_minutes)
+            )
+            self.name = cache.name
+            self.expires_at = time.time() + self.ttl_minutes * 60
+            logger.info(f"✅ Prompt 前綴已快取: {self.name} (TTL {self.ttl_minutes} 分鐘)")
+        except Exception as e:
+            # 模型不支援、前綴低於最小快取 token 數或套件缺少時，改送完整 prompt
+            logger.warning(f"Prompt 前綴快取建立失敗，改送完整 prompt: {e}")
+            self.name = None
+            self.disabled = True
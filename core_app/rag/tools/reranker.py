@@ -0,0 +1,124 @@
+"""
+交叉編碼器重排序
+以小型多語言 cross-encoder 對檢索候選一次批次評分，只保留最相關的少數段落，
+減少送入 LLM 的 prompt token 數量與生成延遲
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import MetricsRegistry
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 多語言（含中文）的 MiniLM cross-encoder，CPU 上每批次約數十毫秒
+DEFAULT_RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+DEFAULT_RERANK_TOP_N = 3
+
+
+class CrossEncoderReranker:
+    """交叉編碼器重排序器（模型在第一次使用時才載入）"""
+
+    def __init__(self, model_name: Optional[str] = None, top_n: Optional[int] = None,
+                 batch_size: int = 16, max_length: int = 256, device: str = "cpu"):
+        """
+        初始化重排序器
+
+        Args:
+            model_name: cross-encoder 模型名稱（預設讀取 RAG_RERANK_MODEL）
+            top_n: 重排序後保留的結果數量（預設讀取 RAG_RERANK_TOP_N）
+            batch_size: 批次推論大小
+            max_length: 查詢與段落合併後的最大 token 長度
+            device: 推論裝置
+        """
+        self.model_name = model_name or os.getenv("RAG_RERANK_MODEL", DEFAULT_RERANK_MODEL)
+        self.top_n = top_n or int(os.getenv("RAG_RERANK_TOP_N", DEFAULT_RERANK_TOP_N))
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device = device
+
+        self._model = None
+        self._load_failed = False
+        self._lock = threading.Lock()
+        # 多個請求可能同時重排序，計數與延遲記錄在執行緒安全的指標登錄
+        self.metrics = MetricsRegistry()
+
+    def _load_model(self):
+        """載入 cross-encoder 模型，失敗時記錄並停用重排序"""
+        if self._model is not None or self._load_failed:
+            return self._model
+
+        with self._lock:
+            if self._model is None and not self._load_failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(
+                        self.model_name, max_length=self.max_length, device=self.device
+                    )
+                    logger.info(f"✅ 重排序模型載入成功: {self.model_name}")
+                except Exception as e:
+                    logger.warning(f"重排序模型載入失敗，停用重排序: {e}")
+                    self._load_failed = True
+        return self._model
+
+    def score(self, query: str, passages: Sequence[str]) -> List[float]:
+        """
+        以單次批次推論計算每個段落與查詢的相關分數
+
+        Args:
+            query: 查詢問題
+            passages: 候選段落
+
+        Returns:
+            與 passages 順序相同的分數列表（模型不可用時回傳空列表）
+        """
+        model = self._load_model()
+        if model is None or not passages:
+            return []
+
+        with self.metrics.timer("predict"):
+            scores = model.predict(
+                [(query, passage) for passage in passages],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+
+        self.metrics.increment("rerank_calls")
+        self.metrics.increment("pairs_scored", len(passages))
+        return [float(score) for score in scores]
+
+    def rerank(self, query: str, passages: Sequence[str],
+               top_n: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        重排序候選段落
+
+        Args:
+            query: 查詢問題
+            passages: 候選段落（依原檢索順序）
+            top_n: 保留的結果數量（預設使用 self.top_n）
+
+        Returns:
+            依分數排序的 (原索引, 分數) 列表，模型不可用時回傳空列表
+        """
+        top_n = top_n or self.top_n
+        scores = self.score(query, passages)
+        ranked = sorted(enumerate(scores), key=lambda item: item[1], reverse=True)
+        return ranked[:top_n]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取重排序統計資訊"""
+        predict = self.metrics.histogram("predict")
+        stats = {
+            "rerank_calls": self.metrics.get("rerank_calls"),
+            "pairs_scored": self.metrics.get("pairs_scored"),
+            "total_time_ms": predict.sum * 1000
+        }
+        stats["model"] = self.model_name
+        stats["top_n"] = self.top_n
+        stats["avg_time_ms"] = (stats["total_time_ms"] / stats["rerank_calls"]) if stats["rerank_calls"] else 0.0
+        stats["latency"] = predict.summary()
+        return stats
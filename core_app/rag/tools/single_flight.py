@@ -0,0 +1,90 @@
+"""
+請求合併（single-flight）
+相同鍵值的並行請求只執行一次，其餘請求等待並共用同一個結果，
+避免熱門問題同時被大量點擊時對 LLM 配額造成瞬間衝擊
+"""
+
+import copy
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _InFlightCall:
+    """執行中的呼叫"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """相同鍵值的並行呼叫合併為一次執行"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+        self.stats = {
+            "executed": 0,
+            "coalesced": 0
+        }
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        執行 fn，若相同鍵值已有執行中的呼叫則等待其結果
+
+        Args:
+            key: 合併用的鍵值
+            fn: 實際執行的函數
+
+        Returns:
+            (結果, 是否為共用結果)；共用結果為深複製，呼叫端可自由修改
+
+        Raises:
+            執行中的呼叫拋出的例外（所有等待者都會收到）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self.stats["executed"] += 1
+            else:
+                call.followers += 1
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.followers:
+                if call.error is None:
+                    # 先保存快照，避免執行者的呼叫端修改結果影響等待者
+                    call.result = copy.deepcopy(result)
+                logger.info(f"🔗 合併 {call.followers} 個相同的並行請求")
+            call.done.set()
+        return result, False
+
+    def get_stats(self) -> Dict[str, int]:
+        """獲取合併統計資訊"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
@@ -0,0 +1,600 @@
+"""
+結構化表格查詢引擎
+將提取的表格載入為具型別的 DataFrame，直接回答排名、排序、篩選與彙總類問題，
+答案為確定性的表格查詢結果，不需經過向量檢索與 LLM 生成
+"""
+
+import re
+import json
+import math
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from ..processors.table_store import TableStore, DEFAULT_DB_NAME
+from .metrics import MetricsRegistry
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 中文查詢詞對應到報告表格標題使用的英文詞（依長度由長到短比對）
+QUERY_SYNONYMS = {
+    "風險事件": "risky events",
+    "威脅事件": "risky events",
+    "錯誤配置": "misconfigurations",
+    "配置錯誤": "misconfigurations",
+    "風險分數": "risk score",
+    "風險評分": "risk score",
+    "弱認證": "weak authentication",
+    "弱驗證": "weak authentication",
+    "偵測模型": "xdr model hits",
+    "規則": "rule",
+    "漏洞": "cves",
+    "雲端": "cloud",
+    "帳號": "account",
+    "嚴重度": "severity",
+    "歐洲": "europe",
+    "美洲": "americas",
+    "產業": "industry sector",
+    "行業": "industry sector",
+    "風險": "risk",
+    "事件": "event",
+    "分數": "score",
+    "認證": "authentication",
+}
+
+# 中文問句的虛詞與意圖詞（排序、彙總、篩選、數量），去除後剩下的中文才是查詢主題（依長度由長到短去除）
+CJK_STOPWORDS = frozenset({
+    "有哪些", "哪一個", "是什麼", "是多少", "告訴我", "請問", "請列出", "列出", "哪些", "哪個", "哪項",
+    "什麼", "多少", "是否", "排名", "排行", "名單", "所有", "全部", "分別", "數值", "項目", "前幾",
+    "最高", "最多", "最大", "最低", "最少", "最小", "總計", "總和", "合計", "加總", "總數", "平均",
+    "大於", "超過", "高於", "多於", "小於", "低於", "少於", "幾個", "幾項", "多少個",
+    "的", "是", "有", "在", "與", "和", "及", "或", "為", "個", "項", "幾",
+    "嗎", "呢", "吧", "了", "請", "各", "每"
+})
+
+# CJK 字元範圍（假名、中日韓統一表意文字、韓文音節、相容表意文字）
+_CJK_RANGE = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_CJK_RUN_PATTERN = re.compile(r'[' + _CJK_RANGE + r']+')
+# 排名片語（前10大、前五名、前3項）
+_RANK_PHRASE_PATTERN = re.compile(r'前(\s*(?:\d+|[一二兩三四五六七八九十]+)?)\s*[大名項個]?')
+
+# 不具辨識度的詞（幾乎每個排行表格標題都有），不用於挑選表格
+GENERIC_TOKENS = frozenset({
+    "top", "overall", "total", "the", "in", "of", "on", "and", "by", "for",
+    "count", "most", "maximum", "detected", "sorted",
+    # 英文問句的常見虛詞（已轉為單數形式，does -> doe、has -> ha）
+    "what", "which", "who", "are", "is", "was", "were", "do", "doe", "did", "a", "an",
+    "to", "with", "there", "how", "many", "much", "show", "list", "give", "me", "tell",
+    "their", "all", "ha", "have", "value", "average", "mean", "sum", "highest", "lowest"
+})
+
+# 排序意圖（最高級形容詞，未指定數量時取第一名）
+DESC_KEYWORDS = ["最高", "最多", "最大", "highest", "most", "largest", "biggest"]
+ASC_KEYWORDS = ["最低", "最少", "最小", "lowest", "least", "smallest"]
+
+# 彙總意圖（依序比對，先比對到者優先）
+AGGREGATE_KEYWORDS = [
+    ("sum", ["總計", "總和", "合計", "加總", "總數", "total", "sum"]),
+    ("mean", ["平均", "average", "mean"]),
+    ("count", ["多少個", "幾個", "幾項", "how many"]),
+]
+
+_TOP_N_PATTERN = re.compile(r'(?:前|top\s*)(\d+|[一二兩三四五六七八九十]+)', re.IGNORECASE)
+_FILTER_PATTERNS = [
+    (">", re.compile(r'(?:大於|超過|高於|多於|more than|greater than|above|over|>)\s*([\d,]+(?:\.\d+)?)', re.IGNORECASE)),
+    ("<", re.compile(r'(?:小於|低於|少於|less than|below|under|<)\s*([\d,]+(?:\.\d+)?)', re.IGNORECASE)),
+]
+_NUMBER_PATTERN = re.compile(r'[-+]?\d+(?:\.\d+)?')
+_CN_DIGITS = {"一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 可作為結構化查詢的表格條件
+MAX_TITLE_LENGTH = 100
+MAX_COLUMNS = 4
+# 查詢主題詞（IDF 加權）至少需有此比例出現在表格標題中
+MIN_TITLE_COVERAGE = 0.6
+
+
+def _parse_count(text: str) -> Optional[int]:
+    """
+    解析阿拉伯或中文數字（支援到九十九）
+
+    >>> _parse_count("10"), _parse_count("十"), _parse_count("二十五")
+    (10, 10, 25)
+    """
+    if text.isdigit():
+        return int(text)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    return _CN_DIGITS.get(text)
+
+
+def _normalize_token(token: str) -> str:
+    """將詞轉為單數形式（events -> event）"""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    將問題或表格標題轉換為比對用的詞
+
+    中文詞先轉為對應的英文詞；沒有對應詞的中文去除虛詞後以二元組保留（例如「中小企業」），
+    這些詞必須出現在表格標題中，避免略過問題限定的主題而以不相關的表格回答
+
+    >>> tokenize("前10大風險事件")
+    ['10', 'risky', 'event']
+    >>> tokenize("中小企業平均風險多少")
+    ['risk', '中小', '小企', '企業']
+    """
+    text = text.lower()
+    translated = []
+    for zh in sorted(QUERY_SYNONYMS, key=len, reverse=True):
+        if zh in text:
+            translated.extend(QUERY_SYNONYMS[zh].split())
+            text = text.replace(zh, " ")
+    text = _RANK_PHRASE_PATTERN.sub(r" \1 ", text)
+    for word in sorted(CJK_STOPWORDS, key=len, reverse=True):
+        text = text.replace(word, " ")
+    # 去除虛詞後剩下的單一字元多為助詞或量詞，不作為主題詞
+    untranslated = [
+        run[i:i + 2] for run in _CJK_RUN_PATTERN.findall(text) for i in range(len(run) - 1)
+    ]
+    return [_normalize_token(token) for token in re.findall(r'[a-z0-9]+', text) + translated] + untranslated
+
+
+def _clean_cell(cell: Any) -> str:
+    """清理儲存格文字（合併換行與多餘空白）"""
+    if cell is None or (isinstance(cell, float) and math.isnan(cell)):
+        return ""
+    return re.sub(r'\s+', ' ', str(cell)).strip()
+
+
+def _parse_number(cell: str) -> Optional[float]:
+    """解析數值儲存格（允許千分位與百分比），非數值回傳 None"""
+    text = cell.replace(",", "").replace(" ", "").rstrip("%")
+    if _NUMBER_PATTERN.fullmatch(text):
+        return float(text)
+    return None
+
+
+def _format_number(value: Any) -> str:
+    """格式化數值（整數加上千分位）"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return f"{int(value):,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+@dataclass
+class TableIntent:
+    """表格查詢意圖"""
+    top_n: Optional[int] = None
+    order: Optional[str] = None  # 'desc' 或 'asc'
+    aggregate: Optional[str] = None  # 'sum'、'mean' 或 'count'
+    filters: List[Tuple[str, float]] = field(default_factory=list)
+    subject_tokens: FrozenSet[str] = frozenset()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為可序列化的字典"""
+        return {
+            "top_n": self.top_n,
+            "order": self.order,
+            "aggregate": self.aggregate,
+            "filters": [list(condition) for condition in self.filters],
+            "subject": sorted(self.subject_tokens)
+        }
+
+
+@dataclass
+class StructuredTable:
+    """可結構化查詢的表格"""
+    table_id: str
+    title: str
+    source_file: str
+    source_pages: List[int]
+    confidence: float
+    frame: Any  # pandas.DataFrame
+    label_column: str
+    rank_column: Optional[str]
+    value_columns: List[str]
+    tokens: FrozenSet[str]
+
+    @property
+    def page_label(self) -> str:
+        """頁碼說明（例如 13-14）"""
+        if len(self.source_pages) > 1:
+            return f"{self.source_pages[0]}-{self.source_pages[-1]}"
+        return str(self.source_pages[0])
+
+
+@dataclass
+class StructuredTableAnswer:
+    """結構化表格查詢結果"""
+    answer: str
+    content: str
+    table: StructuredTable
+    intent: TableIntent
+    rows: List[Dict[str, Any]]
+
+
+class StructuredTableQueryEngine:
+    """結構化表格查詢引擎"""
+
+    def __init__(self, data_dir: str):
+        """
+        初始化查詢引擎（表格在第一次查詢時才載入）
+
+        Args:
+            data_dir: 表格資料目錄（包含 tables.db 或 extracted_tables.json）
+        """
+        self.data_dir = Path(data_dir)
+        self.tables: List[StructuredTable] = []
+        self.token_idf: Dict[str, float] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # 查詢計數與延遲（answer 由多個請求執行緒並行呼叫）
+        self.metrics = MetricsRegistry()
+
+    def load(self) -> bool:
+        """
+        載入並索引表格（只執行一次）
+
+        Returns:
+            bool: 是否有可查詢的表格
+        """
+        if self._loaded:
+            return bool(self.tables)
+
+        with self._lock:
+            if not self._loaded:
+                try:
+                    self._build_index(self._read_raw_tables())
+                except Exception as e:
+                    logger.error(f"❌ 結構化表格載入失敗: {e}")
+                    self.tables = []
+                self._loaded = True
+
+        return bool(self.tables)
+
+    def _read_raw_tables(self) -> List[Dict[str, Any]]:
+        """讀取提取的表格（優先使用表格儲存庫）"""
+        store = TableStore(self.data_dir / DEFAULT_DB_NAME)
+        if store.exists():
+            tables = list(store.iter_extracted_tables())
+            if tables:
+                return tables
+
+        json_path = self.data_dir / "extracted_tables.json"
+        if not json_path.exists():
+            logger.warning(f"找不到表格資料: {json_path}")
+            return []
+
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("tables", [])
+
+    def _build_index(self, raw_tables: List[Dict[str, Any]]) -> None:
+        """將原始表格轉換為 DataFrame 並建立標題詞索引"""
+        import pandas as pd
+
+        candidates = []
+        for index, raw in enumerate(raw_tables):
+            table = self._normalize_table(raw, index, pd)
+            if table is not None:
+                candidates.append(table)
+
+        self.tables = self._merge_continuations(candidates, pd)
+
+        # 以標題詞的文件頻率計算 IDF，常見詞在挑選表格時權重較低
+        document_frequency: Dict[str, int] = {}
+        for table in self.tables:
+            for token in table.tokens:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        total = len(self.tables)
+        self.token_idf = {
+            token: math.log(1 + total / count) for token, count in document_frequency.items()
+        }
+
+        logger.info(f"✅ 結構化表格索引完成: {len(self.tables)}/{len(raw_tables)} 個表格可查詢")
+
+    def _normalize_table(self, raw: Dict[str, Any], index: int, pd) -> Optional[StructuredTable]:
+        """將原始表格整理為具型別的 DataFrame，不適合結構化查詢時回傳 None"""
+        headers = [_clean_cell(cell) for cell in raw.get("headers", [])]
+        rows = [[_clean_cell(cell) for cell in row] for row in raw.get("rows", [])]
+        rows = [row for row in rows if any(row)]
+        if not rows or not headers:
+            return None
+
+        width = max(len(headers), max(len(row) for row in rows))
+        headers += [""] * (width - len(headers))
+        rows = [row + [""] * (width - len(row)) for row in rows]
+
+        # 移除全空的欄位
+        keep = [i for i in range(width) if any(row[i] for row in rows)]
+        if not 2 <= len(keep) <= MAX_COLUMNS:
+            return None
+
+        # 報告中的排行表格常以第一個標題儲存格作為表格標題；標題為數字時代表是資料列
+        title = " ".join(cell for cell in headers if cell)
+        if not title or len(title) > MAX_TITLE_LENGTH or _parse_number(headers[0]) is not None:
+            return None
+
+        columns = [[row[i] for row in rows] for i in keep]
+        numeric_values = [[_parse_number(cell) if cell else None for cell in column] for column in columns]
+        numeric_ratio = [
+            sum(value is not None for value in values) / max(1, sum(1 for cell in column if cell))
+            for values, column in zip(numeric_values, columns)
+        ]
+
+        # 第一欄為遞增整數時視為排名欄
+        first = numeric_values[0]
+        is_rank = (
+            numeric_ratio[0] == 1.0
+            and all(value is not None and value.is_integer() for value in first)
+            and all(a < b for a, b in zip(first, first[1:]))
+        )
+
+        label_positions = [pos for pos, ratio in enumerate(numeric_ratio) if ratio < 0.5]
+        if not label_positions:
+            return None
+
+        use_headers = all(headers[i] for i in keep) and len({headers[i] for i in keep}) == len(keep)
+        names = []
+        value_count = 0
+        for pos, i in enumerate(keep):
+            if use_headers:
+                names.append(headers[i])
+            elif pos == 0 and is_rank:
+                names.append("排名")
+            elif numeric_ratio[pos] >= 0.8:
+                value_count += 1
+                names.append("數值" if value_count == 1 else f"數值{value_count}")
+            else:
+                names.append("項目" if pos == label_positions[0] else f"項目{pos + 1}")
+
+        data = {}
+        value_columns = []
+        for pos, name in enumerate(names):
+            if numeric_ratio[pos] >= 0.8:
+                data[name] = pd.to_numeric(pd.Series(numeric_values[pos], dtype="float64"))
+                if not (pos == 0 and is_rank):
+                    value_columns.append(name)
+            else:
+                data[name] = pd.Series(columns[pos], dtype="object")
+
+        confidence = float(raw.get("confidence") or 0.0)
+        return StructuredTable(
+            table_id=f"table_{index + 1}_{raw.get('title', 'unknown')}",
+            title=title,
+            source_file=str(raw.get("source_file", "")),
+            source_pages=[int(raw.get("source_page") or 0)],
+            confidence=confidence / 100.0 if confidence > 1.0 else confidence,
+            frame=pd.DataFrame(data),
+            label_column=names[label_positions[0]],
+            rank_column=names[0] if is_rank else None,
+            value_columns=value_columns,
+            tokens=frozenset(tokenize(title))
+        )
+
+    def _merge_continuations(self, tables: List[StructuredTable], pd) -> List[StructuredTable]:
+        """合併跨頁延續的同一表格，並移除不同提取器產生的重複表格"""
+        # 同頁同標題的表格只保留一個：優先保留有排名欄、信心度較高的版本
+        tables = sorted(
+            tables,
+            key=lambda t: (t.source_file, t.source_pages[0], t.rank_column is None, -t.confidence)
+        )
+        merged: List[StructuredTable] = []
+        seen = set()
+        # (來源檔案, 標題, 欄位) -> 最近一個同名表格，用於接續下一頁
+        latest: Dict[Tuple[str, str, Tuple[str, ...]], StructuredTable] = {}
+
+        for table in tables:
+            title_key = table.title.lower()
+            if (table.source_file, title_key, table.source_pages[0]) in seen:
+                continue
+            seen.add((table.source_file, title_key, table.source_pages[0]))
+
+            key = (table.source_file, title_key, tuple(table.frame.columns))
+            previous = latest.get(key)
+            if (previous is not None
+                    and table.source_pages[0] == previous.source_pages[-1] + 1
+                    and self._ranks_continue(previous, table)):
+                previous.frame = pd.concat([previous.frame, table.frame], ignore_index=True)
+                previous.source_pages.append(table.source_pages[0])
+                previous.confidence = min(previous.confidence, table.confidence)
+                continue
+
+            latest[key] = table
+            merged.append(table)
+
+        return merged
+
+    def _ranks_continue(self, previous: StructuredTable, table: StructuredTable) -> bool:
+        """延續頁的排名需接續前一頁"""
+        if previous.rank_column is None or table.rank_column is None:
+            return previous.rank_column == table.rank_column
+        return table.frame[table.rank_column].iloc[0] == previous.frame[previous.rank_column].iloc[-1] + 1
+
+    def parse_intent(self, question: str) -> Optional[TableIntent]:
+        """
+        解析問題中的表格查詢意圖
+
+        Returns:
+            TableIntent，沒有排名、排序、篩選或彙總意圖時回傳 None
+        """
+        question_lower = question.lower()
+        intent = TableIntent()
+
+        match = _TOP_N_PATTERN.search(question_lower)
+        if match:
+            intent.top_n = _parse_count(match.group(1))
+
+        if any(keyword in question_lower for keyword in DESC_KEYWORDS):
+            intent.order = "desc"
+        elif any(keyword in question_lower for keyword in ASC_KEYWORDS):
+            intent.order = "asc"
+
+        for aggregate, keywords in AGGREGATE_KEYWORDS:
+            if any(keyword in question_lower for keyword in keywords):
+                intent.aggregate = aggregate
+                break
+
+        for operator, pattern in _FILTER_PATTERNS:
+            for value in pattern.findall(question_lower):
+                intent.filters.append((operator, float(value.replace(",", ""))))
+
+        if not (intent.top_n or intent.order or intent.aggregate or intent.filters):
+            return None
+
+        intent.subject_tokens = frozenset(
+            token for token in tokenize(question)
+            if token not in GENERIC_TOKENS and not token.isdigit()
+        )
+        return intent
+
+    def _select_table(self, intent: TableIntent) -> Optional[StructuredTable]:
+        """依問題主題詞挑選最相符的表格"""
+        if not intent.subject_tokens:
+            return None
+
+        default_idf = math.log(1 + max(1, len(self.tables)))
+        subject_weight = sum(self.token_idf.get(token, default_idf) for token in intent.subject_tokens)
+
+        best = None
+        best_score = None
+        for table in self.tables:
+            matched = intent.subject_tokens & table.tokens
+            if not matched:
+                continue
+            coverage = sum(self.token_idf[token] for token in matched) / subject_weight
+            # 同分時偏好有排名欄、標題較精確（多餘詞較少）且資料較多的表格
+            specific_tokens = table.tokens - GENERIC_TOKENS
+            precision = len(matched) / max(1, len(specific_tokens))
+            score = (coverage, table.rank_column is not None, precision, len(table.frame))
+            if best_score is None or score > best_score:
+                best, best_score = table, score
+
+        if best is None or best_score[0] < MIN_TITLE_COVERAGE:
+            return None
+
+        # 標題缺少的主題詞比已比對到的詞更具辨識度時（例如問題限定「歐洲」），
+        # 表格回答的不是同一件事，寧可交由 RAG 回答
+        matched_idf = min(self.token_idf[token] for token in intent.subject_tokens & best.tokens)
+        missing = [
+            token for token in intent.subject_tokens - best.tokens
+            if self.token_idf.get(token, default_idf) >= matched_idf
+        ]
+        if missing:
+            logger.info(f"表格「{best.title}」缺少問題主題詞 {missing}，不以結構化查詢回答")
+            return None
+        return best
+
+    def answer(self, question: str) -> Optional[StructuredTableAnswer]:
+        """
+        以結構化表格查詢回答問題
+
+        Args:
+            question: 使用者問題
+
+        Returns:
+            StructuredTableAnswer，無法以表格查詢確定回答時回傳 None
+        """
+        self.metrics.increment("total_queries")
+        with self.metrics.timer("answer"):
+            answer = self._answer(question)
+        if answer is not None:
+            self.metrics.increment("answered_queries")
+        return answer
+
+    def _answer(self, question: str) -> Optional[StructuredTableAnswer]:
+        """解析問題並查詢表格（由 answer 呼叫並計時）"""
+        intent = self.parse_intent(question)
+        if intent is None or not self.load():
+            return None
+
+        table = self._select_table(intent)
+        if table is None:
+            return None
+
+        frame = table.frame
+        value_column = table.value_columns[-1] if table.value_columns else None
+
+        # 篩選與彙總都需要數值欄位
+        if (intent.filters or intent.aggregate in ("sum", "mean")) and value_column is None:
+            return None
+
+        for operator, threshold in intent.filters:
+            mask = frame[value_column] > threshold if operator == ">" else frame[value_column] < threshold
+            frame = frame[mask]
+
+        summary_line = None
+        if intent.aggregate == "count":
+            summary_line = f"**符合條件的項目數**: {len(frame)}"
+        elif intent.aggregate in ("sum", "mean"):
+            result = frame[value_column].sum() if intent.aggregate == "sum" else frame[value_column].mean()
+            label = "總計" if intent.aggregate == "sum" else "平均"
+            summary_line = f"**{value_column}{label}**: {_format_number(float(result))}（共 {len(frame)} 列）"
+
+        if intent.order and value_column is not None:
+            frame = frame.sort_values(value_column, ascending=intent.order == "asc", kind="stable")
+        elif intent.order == "asc" and table.rank_column is not None:
+            frame = frame.sort_values(table.rank_column, ascending=False, kind="stable")
+        elif table.rank_column is not None:
+            frame = frame.sort_values(table.rank_column, kind="stable")
+
+        top_n = intent.top_n or (1 if intent.order and not intent.aggregate else None)
+        total_rows = len(frame)
+        if top_n is not None:
+            frame = frame.head(top_n)
+
+        content = self._format_markdown(frame)
+        lines = [f"📊 **{table.title}**（來源: {table.source_file} 第 {table.page_label} 頁）"]
+        if summary_line:
+            lines.append(summary_line)
+        lines.append(content)
+        if top_n is not None and total_rows < top_n:
+            lines.append(f"（表格僅包含 {total_rows} 列資料）")
+
+        logger.info(f"✅ 結構化表格查詢: {table.title} (第 {table.page_label} 頁) {intent.to_dict()}")
+
+        return StructuredTableAnswer(
+            answer="\n\n".join(lines),
+            content=f"表格標題: {table.title}\n{content}",
+            table=table,
+            intent=intent,
+            rows=[
+                {column: (None if isinstance(value, float) and math.isnan(value) else value)
+                 for column, value in record.items()}
+                for record in frame.to_dict(orient="records")
+            ]
+        )
+
+    def _format_markdown(self, frame) -> str:
+        """將 DataFrame 轉換為 Markdown 表格"""
+        columns = list(frame.columns)
+        lines = [
+            "| " + " | ".join(columns) + " |",
+            "|" + "---|" * len(columns)
+        ]
+        for record in frame.itertuples(index=False):
+            cells = [_format_number(value) if isinstance(value, float) else str(value) for value in record]
+            lines.append("| " + " | ".join(cells) + " |")
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取查詢引擎統計"""
+        return {
+            "loaded": self._loaded,
+            "table_count": len(self.tables),
+            "total_queries": self.metrics.get("total_queries"),
+            "answered_queries": self.metrics.get("answered_queries"),
+            "latency": self.metrics.histogram("answer").summary()
+        }
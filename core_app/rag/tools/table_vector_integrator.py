@@ -12,6 +12,8 @@ from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from ..processors.table_store import TableStore, DEFAULT_DB_NAME
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,7 +61,7 @@ class TableVectorIntegrator:
         將表格文本轉換為 Langchain Document 格式
         
         Args:
-            table_texts_path: 表格文本JSON檔案路徑
+            table_texts_path: 表格文本JSON檔案或 SQLite 表格儲存庫（.db）路徑
             
         Returns:
             Document 列表
@@ -69,15 +71,19 @@ class TableVectorIntegrator:
         """
         logger.info(f"載入表格文本: {table_texts_path}")
         
-        with open(table_texts_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        table_texts = data.get("table_texts", [])
-        self.integration_stats["total_tables"] = len(table_texts)
+        if Path(table_texts_path).suffix == ".db":
+            # 從表格儲存庫逐筆讀取，不需一次載入所有表格文本
+            table_texts = TableStore(table_texts_path).iter_table_texts()
+        else:
+            with open(table_texts_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            table_texts = data.get("table_texts", [])
         
+        self.integration_stats["total_tables"] = 0
         documents = []
         
         for table_text in table_texts:
+            self.integration_stats["total_tables"] += 1
             try:
                 # 建立 Document
                 doc = Document(
@@ -91,7 +97,15 @@ class TableVectorIntegrator:
                         "confidence": table_text["metadata"]["confidence"],
                         "extractor_method": table_text["metadata"]["extractor_method"],
                         "processed_date": table_text["metadata"]["conversion_date"],
-                        "content_type": "structured_table"
+                        "content_type": "structured_table",
+                        "parent_table_id": table_text["metadata"].get("parent_table_id", table_text["table_id"]),
+                        "chunk_kind": table_text["metadata"].get("chunk_kind", "table"),
+                        "part_index": table_text["metadata"].get("part_index", 1),
+                        "part_count": table_text["metadata"].get("part_count", 1),
+                        "row_start": table_text["metadata"].get("row_start"),
+                        "row_end": table_text["metadata"].get("row_end"),
+                        "total_rows": table_text["metadata"].get("total_rows"),
+                        "token_count": table_text["metadata"].get("token_count")
                     }
                 )
                 documents.append(doc)
@@ -109,7 +123,7 @@ class TableVectorIntegrator:
         將表格資料整合到向量資料庫
         
         Args:
-            table_texts_path: 表格文本JSON檔案路徑
+            table_texts_path: 表格文本JSON檔案或 SQLite 表格儲存庫（.db）路徑
             force_rebuild: 是否強制重建向量資料庫
             
         Returns:
@@ -201,8 +215,10 @@ def integrate_tables_demo():
     """Demo函數：整合表格到向量資料庫"""
     integrator = TableVectorIntegrator("vector_store/crem_faiss_index")
     
-    # 表格文本檔案路徑
-    table_texts_path = "data/processed/table_texts.json"
+    # 表格文本路徑（優先使用表格儲存庫）
+    table_texts_path = f"data/processed/{DEFAULT_DB_NAME}"
+    if not Path(table_texts_path).exists():
+        table_texts_path = "data/processed/table_texts.json"
     
     try:
         # 執行整合
@@ -0,0 +1,168 @@
+"""
+OpenTelemetry 追蹤
+在 API、問答流程、檢索與 LLM 呼叫建立 span，慢請求可在追蹤中看出時間花在嵌入、FAISS 還是 Gemini；
+未安裝 opentelemetry-api 時使用不做任何事的 span，呼叫端不需判斷
+
+匯出設定（RAG_TRACING_EXPORTER，需安裝 opentelemetry-sdk）：
+- none：不匯出（預設）
+- console：輸出到標準輸出
+- file：每個 span 一行 JSON 寫入 RAG_TRACING_FILE，供離線分析
+- otlp：送到本地 collector（OTEL_EXPORTER_OTLP_ENDPOINT，需安裝 opentelemetry-exporter-otlp）
+"""
+
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+# 設定日誌
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = "core_app.rag"
+DEFAULT_SERVICE_NAME = "trendmicro-rag-api"
+DEFAULT_TRACE_FILE = "logs/traces.jsonl"
+TRACING_EXPORTERS = ("none", "console", "file", "otlp")
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class _NoOpSpan:
+    """未安裝 OpenTelemetry 時使用的 span（與 opentelemetry.trace.Span 相同的常用方法）"""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException, **kwargs: Any) -> None:
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+
+_NO_OP_SPAN = _NoOpSpan()
+
+
+def _get_tracer():
+    """取得 OpenTelemetry tracer，未安裝時回傳 None（第一次建立 span 時才載入）"""
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+    return trace.get_tracer(TRACER_NAME)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    建立目前執行緒的子 span（None 值的屬性略過）
+
+    Args:
+        name: span 名稱
+        **attributes: span 屬性（點號名稱以底線傳入，例如 rag_k 會記錄為 rag.k）
+
+    >>> with span("retrieval.query", rag_k=5, rag_filter_type=None) as current:
+    ...     current.set_attribute("rag.result_count", 3)
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        yield _NO_OP_SPAN
+        return
+    with tracer.start_as_current_span(name) as current:
+        set_attributes(current, **attributes)
+        yield current
+
+
+def set_attributes(current: Any, **attributes: Any) -> None:
+    """設定 span 屬性（底線轉為點號，None 值略過）"""
+    if not current.is_recording():
+        return
+    current.set_attributes({
+        key.replace("_", ".", 1): value for key, value in attributes.items() if value is not None
+    })
+
+
+def bind_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    將目前的追蹤內容綁定到函數，提交到執行緒池時 span 仍接在原請求之下
+
+    >>> bind_context(len)("CREM")
+    4
+    """
+    import contextvars
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def configure_tracing(exporter: Optional[str] = None) -> bool:
+    """
+    依 RAG_TRACING_EXPORTER 設定 span 匯出（每個行程只設定一次，多 worker 時在 fork 後呼叫）
+
+    Args:
+        exporter: 匯出方式，預設讀取 RAG_TRACING_EXPORTER
+
+    Returns:
+        是否已啟用匯出
+    """
+    global _configured
+    exporter = (exporter or os.getenv("RAG_TRACING_EXPORTER", "none")).strip().lower()
+    if exporter in ("", "none"):
+        return False
+    if exporter not in TRACING_EXPORTERS:
+        logger.warning(f"⚠️ 未知的 RAG_TRACING_EXPORTER: {exporter}，不匯出追蹤")
+        return False
+
+    with _configure_lock:
+        if _configured:
+            return True
+        try:
+            from opentelemetry import trace
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        except ImportError:
+            logger.warning("⚠️ 匯出追蹤需安裝 opentelemetry-sdk: pip install opentelemetry-sdk，追蹤停用")
+            return False
+
+        try:
+            span_exporter = _create_exporter(exporter)
+        except ImportError:
+            logger.warning("⚠️ otlp 匯出需安裝 opentelemetry-exporter-otlp，追蹤停用")
+            return False
+
+        sample_ratio = float(os.getenv("RAG_TRACING_SAMPLE_RATIO", "1.0"))
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", DEFAULT_SERVICE_NAME)}),
+            sampler=ParentBased(TraceIdRatioBased(sample_ratio))
+        )
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+        trace.set_tracer_provider(provider)
+        _configured = True
+
+    logger.info(f"✅ OpenTelemetry 追蹤已啟用 (匯出: {exporter}, 取樣比例: {sample_ratio})")
+    return True
+
+
+def _create_exporter(exporter: str):
+    """建立 span 匯出器"""
+    if exporter == "otlp":
+        # 端點與標頭由 OTEL_EXPORTER_OTLP_* 環境變數設定
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    if exporter == "console":
+        return ConsoleSpanExporter()
+
+    trace_file = os.getenv("RAG_TRACING_FILE", DEFAULT_TRACE_FILE)
+    os.makedirs(os.path.dirname(trace_file) or ".", exist_ok=True)
+    return ConsoleSpanExporter(
+        out=open(trace_file, "a", encoding="utf-8"),
+        formatter=lambda finished: finished.to_json(indent=None) + "\n"
+    )
@@ -3,14 +3,27 @@
 支援文本和表格的混合查詢，提供結構化的搜尋結果
 """
 
+from __future__ import annotations
+
+import os
 import json
 import logging
+import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 from datetime import datetime
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from dataclasses import dataclass
+from .lexical_index import BM25Index, reciprocal_rank_fusion, DEFAULT_RRF_K
+from .reranker import CrossEncoderReranker
+from .metrics import MetricsRegistry
+from .tracing import span, set_attributes
+
+# LangChain、FAISS 與嵌入模型（torch、transformers）在建立引擎時才載入，匯入本模組不需付出啟動成本
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
@@ -25,22 +38,67 @@ class QueryResult:
     source: str
     confidence_score: float
     metadata: Dict[str, Any]
+    full_content: Optional[str] = None  # 未截斷、未格式化的原始內容（組成 LLM 上下文用）
+
+def _load_embeddings(model_name: str) -> HuggingFaceEmbeddings:
+    """載入嵌入模型"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+def vector_store_version(vector_dir: str) -> Optional[str]:
+    """
+    向量資料庫的版本（index.faiss 與 index.pkl 的大小與修改時間），用來偵測重建後的索引
+
+    Args:
+        vector_dir: 向量資料庫目錄
+
+    Returns:
+        版本字串，索引檔不存在時回傳 None
+    """
+    parts = []
+    for name in ("index.faiss", "index.pkl"):
+        try:
+            stat = (Path(vector_dir) / name).stat()
+        except OSError:
+            return None
+        parts.append(f"{stat.st_size}-{stat.st_mtime_ns}")
+    return "_".join(parts)
 
 class UnifiedQueryEngine:
     """統一查詢引擎"""
     
-    def __init__(self, vector_dir: str):
+    # 列群組結果最多顯示的行數（含欄位行）
+    MAX_ROW_GROUP_LINES = 30
+    # 混合檢索時向量與詞彙兩側各自取回的候選倍數（相對於 k）
+    VECTOR_FETCH_FACTOR = 2
+    HYBRID_VECTOR_FETCH_FACTOR = 1
+    # 依內容類型篩選時向量側多取的倍數（篩除的候選不佔融合排名）
+    FILTERED_VECTOR_FETCH_FACTOR = 4
+    LEXICAL_FETCH_FACTOR = 4
+    # 重排序時送入 cross-encoder 的候選倍數（相對於 k）
+    RERANK_CANDIDATE_FACTOR = 2
+    
+    def __init__(self, vector_dir: str, hybrid: Optional[bool] = None,
+                 reranker: Optional[CrossEncoderReranker] = None,
+                 embeddings: Optional[HuggingFaceEmbeddings] = None,
+                 metrics: Optional[MetricsRegistry] = None):
         self.vector_dir = Path(vector_dir)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-        )
+        # 重新載入索引時可沿用已載入的嵌入模型
+        self.embeddings = embeddings or _load_embeddings(DEFAULT_EMBEDDING_MODEL)
         self.vector_db = None
-        self.query_stats = {
-            "total_queries": 0,
-            "text_results": 0,
-            "table_results": 0,
-            "last_query_time": None
-        }
+        self.loaded_version: Optional[str] = None
+        # 混合檢索（BM25 + 向量，以 RRF 融合）
+        if hybrid is None:
+            hybrid = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true"
+        self.hybrid = hybrid
+        self.rrf_k = int(os.getenv("RAG_RRF_K", DEFAULT_RRF_K))
+        self.lexical_index: Optional[BM25Index] = None
+        # 交叉編碼器重排序（選用）
+        if reranker is None and os.getenv("RAG_RERANK_ENABLED", "false").lower() == "true":
+            reranker = CrossEncoderReranker()
+        self.reranker = reranker
+        # 查詢計數與各階段延遲（embed、search、rerank、format、retrieval），請求在執行緒池中並行更新
+        self.metrics = metrics or MetricsRegistry()
     
     def load_vector_db(self) -> bool:
         """載入向量資料庫"""
@@ -49,12 +107,17 @@ class UnifiedQueryEngine:
         
         if faiss_file.exists() and pkl_file.exists():
             try:
+                version = vector_store_version(str(self.vector_dir))
+                from langchain_community.vectorstores import FAISS
                 self.vector_db = FAISS.load_local(
                     str(self.vector_dir), 
                     self.embeddings,
                     allow_dangerous_deserialization=True
                 )
+                self.loaded_version = version
                 logger.info(f"✅ 載入向量資料庫成功 (向量數: {self.vector_db.index.ntotal})")
+                if self.hybrid:
+                    self._build_lexical_index()
                 return True
             except Exception as e:
                 logger.error(f"載入向量資料庫失敗: {e}")
@@ -86,33 +149,43 @@ class UnifiedQueryEngine:
             if not self.load_vector_db():
                 return []
         
-        self.query_stats["total_queries"] += 1
-        self.query_stats["last_query_time"] = datetime.now().isoformat()
+        self.metrics.increment("total_queries")
+        self.metrics.set("last_query_time", datetime.now().isoformat())
         
-        try:
-            # 執行相似性搜尋
-            docs = self.vector_db.similarity_search_with_score(question, k=k*2)  # 多取一些以便篩選
-            
+        with span("retrieval.query", rag_k=k, rag_filter_type=filter_type,
+                  rag_hybrid=self.hybrid and self.lexical_index is not None) as current:
+            try:
+                with self.metrics.timer("retrieval"):
+                    results = self._query(question, k, filter_type)
+            except Exception as e:
+                logger.error(f"查詢執行失敗: {e}")
+                current.record_exception(e)
+                results = []
+            set_attributes(current, rag_result_count=len(results),
+                           rag_table_results=sum(1 for result in results if result.content_type == "table"))
+            return results
+    
+    def _query(self, question: str, k: int, filter_type: str) -> List[QueryResult]:
+        """執行檢索、重排序與結果格式化（各階段分別計時）"""
+        # 執行相似性搜尋（多取一些以便篩選）
+        candidates = self._retrieve_candidates(question, k, filter_type)
+        
+        # 合併同一表格中相鄰的列群組
+        with self.metrics.timer("filter"):
+            candidates = self._merge_table_row_groups(candidates)
+        
+        # 以 cross-encoder 重排序，只保留最相關的 top_n 個結果
+        rerank_scores: List[Optional[float]] = [None] * len(candidates)
+        if self.reranker is not None and candidates:
+            with span("retrieval.rerank"), self.metrics.timer("rerank"):
+                candidates, rerank_scores = self._rerank_candidates(question, candidates, k)
+        
+        with self.metrics.timer("format"):
             results = []
             text_count = 0
             table_count = 0
             
-            for i, (doc, score) in enumerate(docs):
-                # 判斷內容類型
-                content_type = doc.metadata.get("content_type", "text")
-                if content_type == "structured_table":
-                    content_type = "table"
-                else:
-                    content_type = "text"
-                
-                # 篩選類型
-                if filter_type != "all" and content_type != filter_type:
-                    continue
-                
-                # 如果已經有足夠的結果，停止
-                if len(results) >= k:
-                    break
-                
+            for (doc, score, content_type), rerank_score in zip(candidates[:k], rerank_scores):
                 # 處理內容顯示
                 content = doc.page_content
                 if content_type == "table":
@@ -132,23 +205,232 @@ class UnifiedQueryEngine:
                     content=content,
                     source=doc.metadata.get("source", "unknown"),
                     confidence_score=1.0 - score,  # FAISS返回的是距離，轉換為相似度
-                    metadata=doc.metadata
+                    metadata=doc.metadata if rerank_score is None else {**doc.metadata, "rerank_score": rerank_score},
+                    full_content=doc.page_content
                 )
                 
                 results.append(result)
+        
+        # 更新統計
+        self.metrics.increment("text_results", text_count)
+        self.metrics.increment("table_results", table_count)
+        
+        logger.info(f"查詢完成: '{question}' - 找到 {len(results)} 個結果 "
+                   f"(文本: {text_count}, 表格: {table_count})")
+        
+        return results
+    
+    def _build_lexical_index(self) -> None:
+        """以向量資料庫中的相同文檔建立 BM25 索引（以 FAISS 索引位置為文檔鍵）"""
+        try:
+            docstore = self.vector_db.docstore
+            documents = (
+                (position, docstore.search(doc_id).page_content)
+                for position, doc_id in sorted(self.vector_db.index_to_docstore_id.items())
+            )
+            self.lexical_index = BM25Index().build(documents)
+        except Exception as e:
+            logger.warning(f"BM25 索引建立失敗，改用純向量檢索: {e}")
+            self.lexical_index = None
+    
+    def _get_document(self, position: int) -> Document:
+        """依 FAISS 索引位置取得文檔"""
+        return self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[position])
+    
+    def _embed_query(self, question: str) -> np.ndarray:
+        """計算查詢向量（與 FAISS.similarity_search_with_score 相同的處理）"""
+        vector = np.array([self.embeddings.embed_query(question)], dtype=np.float32)
+        if getattr(self.vector_db, "_normalize_L2", False):
+            import faiss
+            faiss.normalize_L2(vector)
+        return vector
+    
+    def _vector_distance(self, query_vector: np.ndarray, position: int) -> Optional[float]:
+        """計算查詢向量與指定位置向量的 L2 平方距離（與 IndexFlatL2 回傳值一致）"""
+        try:
+            stored = self.vector_db.index.reconstruct(int(position))
+        except Exception:
+            # 部分索引類型不支援 reconstruct
+            return None
+        return float(np.sum((query_vector[0] - stored) ** 2))
+    
+    def _retrieve_candidates(self, question: str, k: int, filter_type: str) -> List[Tuple[Document, float, str]]:
+        """
+        取得依相關度排序的候選文檔
+        
+        混合檢索時分別以向量與 BM25 排序，再以倒數排名融合；
+        BM25 能精確命中產品術語與數字，因此向量側只需取回較少的候選，
+        依內容類型篩選時向量側先多取再篩選，避免篩選後候選不足
+        
+        Args:
+            question: 查詢問題
+            k: 返回結果數量
+            filter_type: 篩選類型 ("all", "text", "table")
             
-            # 更新統計
-            self.query_stats["text_results"] += text_count
-            self.query_stats["table_results"] += table_count
+        Returns:
+            (文檔, 距離, 內容類型) 列表
+        """
+        def matches(doc: Document) -> bool:
+            return filter_type == "all" or self._resolve_content_type(doc) == filter_type
+        
+        if not self.hybrid or self.lexical_index is None:
+            # 分開計算查詢向量與搜尋，兩個階段的延遲才能分別記錄
+            with span("retrieval.embed"), self.metrics.timer("embed"):
+                embedding = self.embeddings.embed_query(question)
+            with span("retrieval.search"), self.metrics.timer("search"):
+                docs = self.vector_db.similarity_search_with_score_by_vector(
+                    embedding, k=k * self.VECTOR_FETCH_FACTOR
+                )
+                return [(doc, score, self._resolve_content_type(doc)) for doc, score in docs if matches(doc)]
+        
+        with span("retrieval.embed"), self.metrics.timer("embed"):
+            query_vector = self._embed_query(question)
+        
+        with span("retrieval.search"), self.metrics.timer("search"):
+            fetch_factor = self.HYBRID_VECTOR_FETCH_FACTOR if filter_type == "all" else self.FILTERED_VECTOR_FETCH_FACTOR
+            vector_k = min(k * fetch_factor, self.vector_db.index.ntotal)
+            distances, positions = self.vector_db.index.search(query_vector, vector_k)
+            vector_distances = {
+                int(position): float(distance)
+                for position, distance in zip(positions[0], distances[0])
+                if position != -1 and matches(self._get_document(int(position)))
+            }
             
-            logger.info(f"查詢完成: '{question}' - 找到 {len(results)} 個結果 "
-                       f"(文本: {text_count}, 表格: {table_count})")
+            lexical_hits = self.lexical_index.search(
+                question,
+                k=k * self.LEXICAL_FETCH_FACTOR,
+                predicate=lambda position: matches(self._get_document(position))
+            )
             
-            return results
+            fused = reciprocal_rank_fusion(
+                [list(vector_distances), [position for position, _ in lexical_hits]],
+                k=self.rrf_k
+            )
             
-        except Exception as e:
-            logger.error(f"查詢執行失敗: {e}")
-            return []
+            candidates = []
+            fallback_distance = max(vector_distances.values(), default=1.0)
+            for position, _ in fused:
+                # 兩側的排名都已依內容類型篩選
+                doc = self._get_document(position)
+                distance = vector_distances.get(position)
+                if distance is None:
+                    # 僅由 BM25 命中的文檔，補算向量距離以維持信心分數的意義
+                    self.metrics.increment("lexical_only_hits")
+                    distance = self._vector_distance(query_vector, position)
+                    if distance is None:
+                        distance = fallback_distance
+                candidates.append((doc, distance, self._resolve_content_type(doc)))
+            return candidates
+    
+    def _rerank_candidates(self, question: str, candidates: List[Tuple[Document, float, str]],
+                           k: int) -> Tuple[List[Tuple[Document, float, str]], List[Optional[float]]]:
+        """
+        以 cross-encoder 重排序候選（以完整內容評分，而非截斷後的顯示內容）
+        
+        Args:
+            question: 查詢問題
+            candidates: (文檔, 距離, 內容類型) 列表，依檢索相關度排序
+            k: 最多返回的結果數量
+            
+        Returns:
+            (重排序後的候選列表, 對應的重排序分數)；模型不可用時為原候選列表
+        """
+        pool = candidates[:k * self.RERANK_CANDIDATE_FACTOR]
+        ranked = self.reranker.rerank(
+            question,
+            [doc.page_content for doc, _, _ in pool],
+            top_n=min(k, self.reranker.top_n)
+        )
+        if not ranked:
+            # 模型不可用時保留原檢索結果
+            return candidates, [None] * len(candidates)
+        
+        self.metrics.increment("reranked_queries")
+        return [pool[index] for index, _ in ranked], [score for _, score in ranked]
+    
+    def _resolve_content_type(self, doc: Document) -> str:
+        """判斷文檔內容類型 ('text' 或 'table')"""
+        if doc.metadata.get("content_type", "text") == "structured_table":
+            return "table"
+        return "text"
+    
+    def _merge_table_row_groups(self, candidates: List[Tuple[Document, float, str]]) -> List[Tuple[Document, float, str]]:
+        """
+        將同一表格中列範圍相鄰的列群組合併為單一結果
+        
+        合併後的結果位於組內最相關的位置，距離取組內最小值
+        
+        Args:
+            candidates: (文檔, 距離, 內容類型) 列表，依相關度排序
+            
+        Returns:
+            合併後的候選列表
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, (doc, _, _) in enumerate(candidates):
+            if doc.metadata.get("chunk_kind") == "table_rows" and doc.metadata.get("row_start"):
+                parent_id = doc.metadata.get("parent_table_id") or doc.metadata.get("table_id")
+                groups.setdefault(parent_id, []).append(index)
+        
+        replacements: Dict[int, Tuple[Document, float, str]] = {}
+        removed = set()
+        
+        for indexes in groups.values():
+            if len(indexes) < 2:
+                continue
+            
+            # 依列範圍排序後切出連續區段
+            ordered = sorted(indexes, key=lambda i: candidates[i][0].metadata["row_start"])
+            runs = [[ordered[0]]]
+            for index in ordered[1:]:
+                previous = candidates[runs[-1][-1]][0].metadata
+                current = candidates[index][0].metadata
+                if current["row_start"] <= previous["row_end"] + 1:
+                    runs[-1].append(index)
+                else:
+                    runs.append([index])
+            
+            for run in runs:
+                if len(run) < 2:
+                    continue
+                best_index = min(run)  # 候選列表已依相關度排序
+                replacements[best_index] = (
+                    self._combine_row_group_docs([candidates[i][0] for i in run]),
+                    min(candidates[i][1] for i in run),
+                    "table"
+                )
+                removed.update(i for i in run if i != best_index)
+        
+        if not replacements:
+            return candidates
+        
+        merged = []
+        for index, candidate in enumerate(candidates):
+            if index in removed:
+                continue
+            merged.append(replacements.get(index, candidate))
+        return merged
+    
+    def _combine_row_group_docs(self, docs: List[Document]) -> Document:
+        """將依列順序排列的列群組文檔合併為一份文檔"""
+        first = docs[0]
+        header_lines = [line for line in first.page_content.split('\n') if not line.startswith("  ")]
+        
+        row_lines = []
+        last_row_end = 0
+        for doc in docs:
+            # 只加入尚未涵蓋的列，避免重複
+            if doc.metadata["row_end"] <= last_row_end:
+                continue
+            row_lines.extend(line for line in doc.page_content.split('\n') if line.startswith("  "))
+            last_row_end = doc.metadata["row_end"]
+        
+        metadata = dict(first.metadata)
+        metadata["row_end"] = last_row_end
+        metadata["merged_chunks"] = [doc.metadata.get("table_id") for doc in docs]
+        
+        from langchain_core.documents import Document
+        return Document(page_content='\n'.join(header_lines + row_lines), metadata=metadata)
     
     def _format_table_content(self, content: str, metadata: Dict[str, Any]) -> str:
         """格式化表格內容顯示"""
@@ -167,6 +449,22 @@ class UnifiedQueryEngine:
             f"   類型: {table_type} | 頁面: {source_page} | 信心度: {confidence:.1f}%"
         ]
         
+        # 列群組（含合併後的相鄰群組）完整列出涵蓋的列
+        if metadata.get("chunk_kind") == "table_rows":
+            summary_parts[0] = f"📊 {title.split('（')[0]}"
+            summary_parts.append(
+                f"   列範圍: 第{metadata.get('row_start')}-{metadata.get('row_end')}列 "
+                f"/ 共{metadata.get('total_rows')}列"
+            )
+            
+            content_lines = [line.strip() for line in lines[1:] if line.strip()]
+            summary_parts.append("   內容:")
+            for line in content_lines[:self.MAX_ROW_GROUP_LINES]:
+                summary_parts.append(f"     {line}")
+            if len(content_lines) > self.MAX_ROW_GROUP_LINES:
+                summary_parts.append("     ...")
+            return '\n'.join(summary_parts)
+        
         # 添加部分內容
         content_lines = [line.strip() for line in lines[1:8] if line.strip()]  # 取前7行
         if content_lines:
@@ -218,8 +516,22 @@ class UnifiedQueryEngine:
     
     def get_query_stats(self) -> Dict[str, Any]:
         """獲取查詢統計資訊"""
-        stats = self.query_stats.copy()
+        stats = {
+            "total_queries": 0,
+            "text_results": 0,
+            "table_results": 0,
+            "lexical_only_hits": 0,
+            "reranked_queries": 0,
+            "last_query_time": None,
+            **self.metrics.counters()
+        }
+        stats["latency"] = self.metrics.latency_summary()
         stats["vector_count"] = self.vector_db.index.ntotal if self.vector_db else 0
+        stats["vector_store_version"] = self.loaded_version
+        stats["hybrid_search"] = self.hybrid and self.lexical_index is not None
+        stats["lexical_index_size"] = len(self.lexical_index) if self.lexical_index else 0
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.get_stats()
         return stats
 
 
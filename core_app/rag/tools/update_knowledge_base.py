@@ -8,13 +8,13 @@ import logging
 import sys
 from pathlib import Path
 
-# 解決導入問題：添加RAG根目錄到Python路徑
+# 直接以腳本執行時加入專案根目錄，以套件路徑導入（建議使用 python -m core_app.rag.tools.update_knowledge_base）
 current_file = Path(__file__).resolve()
 rag_root = current_file.parent.parent  # 從tools/回到rag/根目錄
-sys.path.insert(0, str(rag_root))
+if __package__ in (None, ""):
+    sys.path.insert(0, str(rag_root.parent.parent))
 
-# 現在可以正常導入
-from tools.incremental_updater import IncrementalRAGUpdater
+from core_app.rag.tools.incremental_updater import IncrementalRAGUpdater
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
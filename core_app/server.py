@@ -0,0 +1,143 @@
+"""
+多 worker 正式環境伺服器
+以 gunicorn 啟動多個 Uvicorn worker：master 在 fork 前載入向量資料庫與嵌入模型（copy-on-write 共用），
+每個 worker 依核心數分配推論執行緒，避免多個 worker 搶用同一組核心
+
+使用方式: python -m core_app.server
+"""
+
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+# 設定日誌
+logging.basicConfig(
+    level=getattr(logging, os.getenv("LOG_LEVEL", "INFO")),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 多 worker 共用熱門問題答案的目錄（需所有 worker 可讀寫）
+DEFAULT_SHARED_HOT_ANSWERS_DIR = "logs/hot_answers"
+# 多 worker 彙總 /metrics 的目錄（每次部署建立子目錄）
+DEFAULT_METRICS_DIR = "logs/metrics"
+
+
+def default_workers(cpu_count: Optional[int] = None) -> int:
+    """
+    worker 數量：WEB_WORKERS，未設定時每個核心一個 worker（嵌入計算為 CPU 密集）
+
+    >>> _ = os.environ.pop("WEB_WORKERS", None)
+    >>> default_workers(cpu_count=8)
+    8
+    """
+    configured = os.getenv("WEB_WORKERS", "").strip()
+    if configured:
+        return max(1, int(configured))
+    return max(1, cpu_count or os.cpu_count() or 1)
+
+
+def threads_per_worker(workers: int, cpu_count: Optional[int] = None) -> int:
+    """
+    每個 worker 的推論執行緒數：TORCH_THREADS_PER_WORKER，未設定時平分核心數
+
+    >>> _ = os.environ.pop("TORCH_THREADS_PER_WORKER", None)
+    >>> threads_per_worker(3, cpu_count=8)
+    2
+    >>> threads_per_worker(16, cpu_count=8)
+    1
+    """
+    configured = os.getenv("TORCH_THREADS_PER_WORKER", "").strip()
+    if configured:
+        return max(1, int(configured))
+    return max(1, (cpu_count or os.cpu_count() or 1) // workers)
+
+
+def post_fork(server, worker) -> None:
+    """gunicorn hook：在每個 worker fork 後設定執行緒數並重建不可跨 fork 共用的資源"""
+    from core_app import app as api
+
+    threads = threads_per_worker(server.cfg.workers)
+    if api.qa_system is not None:
+        api.qa_system.prepare_worker(threads)
+    logger.info(f"✅ Worker {worker.pid} 已就緒 (推論執行緒: {threads})")
+
+
+def configure_shared_hot_answers() -> None:
+    """
+    熱門問題答案只由一個 worker 計算，其他 worker 載入共用目錄中的結果
+
+    startup 事件在每個 worker 各自執行；未共用時每次部署會有 worker 數 × 熱門問題數次 LLM 呼叫。
+    部署編號讓 worker 不會載入上一次部署留下的答案
+    """
+    if not os.getenv("RAG_HOT_ANSWERS_SHARED_DIR", "").strip():
+        os.environ["RAG_HOT_ANSWERS_SHARED_DIR"] = DEFAULT_SHARED_HOT_ANSWERS_DIR
+    os.environ["RAG_HOT_ANSWERS_RUN_ID"] = f"{os.getpid()}-{int(time.time())}"
+
+
+def configure_shared_metrics() -> None:
+    """
+    /metrics 彙總所有 worker 的指標：每個 worker 寫入 RAG_METRICS_DIR，被抓取的 worker 讀取並相加
+
+    每次部署使用新的子目錄，計數從零開始，不會沿用上次部署已結束 worker 的數值
+    """
+    base_dir = os.getenv("RAG_METRICS_DIR", "").strip() or DEFAULT_METRICS_DIR
+    os.environ["RAG_METRICS_DIR"] = os.path.join(base_dir, f"{os.getpid()}-{int(time.time())}")
+
+
+def build_options() -> Dict[str, Any]:
+    """gunicorn 設定（讀取環境變數）"""
+    host = os.getenv("API_HOST", "0.0.0.0")
+    port = int(os.getenv("API_PORT", "8000"))
+    return {
+        "bind": f"{host}:{port}",
+        "workers": default_workers(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        # master 先載入應用程式與問答系統，worker fork 後共用記憶體中的索引與模型權重
+        "preload_app": True,
+        "timeout": int(os.getenv("WEB_WORKER_TIMEOUT", "120")),
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", "5")),
+        "loglevel": os.getenv("LOG_LEVEL", "INFO").lower(),
+        "post_fork": post_fork
+    }
+
+
+def run() -> None:
+    """以 gunicorn 啟動多 worker 服務"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as e:
+        raise ImportError("多 worker 模式需安裝 gunicorn: pip install gunicorn") from e
+
+    options = build_options()
+    threads = threads_per_worker(options["workers"])
+    # 在 master 載入 torch 之前設定，fork 後每個 worker 的 OpenMP 執行緒池大小一致
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("MKL_NUM_THREADS", str(threads))
+    # tokenizers 的平行處理在 fork 後不可用，改為每個 worker 單執行緒斷詞
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    configure_shared_hot_answers()
+    configure_shared_metrics()
+
+    class PreloadedApplication(BaseApplication):
+        """在 master 預先載入問答系統的 gunicorn 應用程式"""
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from core_app import app as api
+            # 只載入索引與模型，不在 master 執行推論（torch 執行緒池在 fork 後不可用）
+            api.get_qa_system()
+            return api.app
+
+    logger.info(f"啟動多 worker 服務於 {options['bind']} "
+                f"({options['workers']} 個 worker，每個 {threads} 個推論執行緒)")
+    PreloadedApplication().run()
+
+
+if __name__ == "__main__":
+    run()
@@ -14,11 +14,11 @@ import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
-# 添加路徑
+# 添加專案根目錄（以套件路徑導入）
 current_dir = Path(__file__).parent
-sys.path.append(str(current_dir))
+sys.path.append(str(current_dir.parent))
 
-from main import TrendMicroQASystem
+from core_app.main import TrendMicroQASystem
 
 class IntegrationTestSuite:
     """完整整合測試套件"""
@@ -0,0 +1,371 @@
+"""
+啟動後的預熱工作
+- 檢索路徑預熱：嵌入模型與 FAISS 在第一個請求前完成初始化，完成前 /health 回報 warming
+- 熱門問題（/examples 與 Gradio 建議問題）的答案預先計算並寫入答案快取，
+  之後定期檢查向量資料庫版本，索引重建後重新載入並重算
+- 多 worker 部署時只由取得檔案鎖的一個 worker 計算熱門問題答案（LLM 呼叫只有一份），
+  寫入共用目錄後其他 worker 載入到各自的答案快取
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 設定日誌
+logger = logging.getLogger(__name__)
+
+# /examples 端點提供的範例問題
+EXAMPLE_QUESTIONS = [
+    "前10大風險事件有哪些？",
+    "最常見的安全威脅是什麼？",
+    "雲端應用程式的風險",
+    "risky cloud app access",
+    "統計資料和數據分析",
+    "安全政策建議",
+    "企業面臨的主要挑戰",
+    "如何防範網路攻擊？",
+    "Microsoft Entra ID 安全問題",
+    "spam protection policy"
+]
+
+# Gradio 介面的建議問題
+SUGGESTED_QUESTIONS = [
+    "Trend Vision One CREM 解決方案的主要目標是什麼？",
+    "CREM 如何幫助安全團隊獲得更全面的風險視圖？",
+    "CREM 如何整合不同的安全領域？",
+    "CREM 如何利用「威脅情報」和「AI」來提供其宣稱的「無與倫比的風險情報優勢」？"
+]
+
+
+# 檢索路徑預熱的預設編碼長度（詞數）與檢索問題
+DEFAULT_WARMUP_TEXT_LENGTHS = (8, 64, 256)
+DEFAULT_WARMUP_QUERIES = ("CREM", "前10大風險事件有哪些？")
+
+# 預熱狀態
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+def _split_env_list(name: str, separator: str) -> List[str]:
+    """
+    讀取以分隔符號分隔的環境變數，未設定時回傳空列表
+
+    >>> os.environ["WARMUP_TEST_LIST"] = " 8, 64 ,,256"
+    >>> _split_env_list("WARMUP_TEST_LIST", ",")
+    ['8', '64', '256']
+    >>> del os.environ["WARMUP_TEST_LIST"]
+    """
+    return [item.strip() for item in os.getenv(name, "").split(separator) if item.strip()]
+
+
+def load_hot_questions() -> List[str]:
+    """
+    取得需要預先計算答案的熱門問題
+
+    RAG_HOT_QUESTIONS 以「|」分隔自訂問題；未設定時使用範例問題與建議問題
+
+    >>> os.environ["RAG_HOT_QUESTIONS"] = "CREM 是什麼？| CRI 是什麼？"
+    >>> load_hot_questions()
+    ['CREM 是什麼？', 'CRI 是什麼？']
+    >>> del os.environ["RAG_HOT_QUESTIONS"]
+    """
+    return _split_env_list("RAG_HOT_QUESTIONS", "|") or EXAMPLE_QUESTIONS + SUGGESTED_QUESTIONS
+
+
+class StartupWarmer:
+    """在背景預熱檢索路徑；完成（或失敗）前服務回報 warming，讓負載平衡器只將流量導向已預熱的實例"""
+
+    def __init__(self, qa_system, text_lengths: Optional[Tuple[int, ...]] = None,
+                 queries: Optional[Tuple[str, ...]] = None, on_ready: Optional[Callable[[], None]] = None):
+        """
+        初始化檢索路徑預熱
+
+        Args:
+            qa_system: TrendMicroQASystem 實例
+            text_lengths: 預熱編碼的文字長度，預設讀取 RAG_WARMUP_TEXT_LENGTHS（以「,」分隔）
+            queries: 預熱檢索的問題，預設讀取 RAG_WARMUP_QUERIES（以「|」分隔）
+            on_ready: 預熱結束後呼叫（例如啟動熱門問題預熱工作）
+        """
+        self.qa_system = qa_system
+        self.text_lengths = text_lengths or tuple(int(length) for length in _split_env_list("RAG_WARMUP_TEXT_LENGTHS", ",")) \
+            or DEFAULT_WARMUP_TEXT_LENGTHS
+        self.queries = queries or tuple(_split_env_list("RAG_WARMUP_QUERIES", "|")) or DEFAULT_WARMUP_QUERIES
+        self.on_ready = on_ready
+        self.status = WARMING
+        self.error: Optional[str] = None
+        self.stats: Dict[str, Any] = {}
+        self._started_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_ready(self) -> bool:
+        """預熱是否已結束（失敗時仍視為可服務，只是第一個請求較慢）"""
+        return self.status != WARMING
+
+    def run(self) -> None:
+        """執行預熱（在呼叫端執行緒）"""
+        self._started_at = time.monotonic()
+        try:
+            self.stats = self.qa_system.warm_up(text_lengths=self.text_lengths, queries=self.queries)
+            self.status = READY
+        except Exception as e:
+            logger.error(f"❌ 檢索路徑預熱失敗，服務仍可使用: {e}")
+            self.error = str(e)
+            self.status = FAILED
+
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def start(self) -> None:
+        """在背景執行緒預熱（服務先開始接受連線，/health 回報 warming）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, name="startup-warmer", daemon=True)
+        self._thread.start()
+        logger.info("🔥 檢索路徑預熱已啟動")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取預熱狀態"""
+        stats = {"status": self.status, **self.stats}
+        if self.status == WARMING and self._started_at is not None:
+            stats["elapsed_seconds"] = round(time.monotonic() - self._started_at, 3)
+        if self.error:
+            stats["error"] = self.error
+        return stats
+
+
+class SharedHotAnswerStore:
+    """
+    多 worker 共用的熱門問題答案
+
+    取得 hot_answers.lock 檔案鎖的 worker 為計算者（鎖在行程結束時自動釋放，其他 worker 下次同步時接手），
+    計算結果連同部署編號與向量資料庫版本寫入 hot_answers.json；
+    其他 worker 只載入同一次部署、同一索引版本的答案，不會拿到舊部署或舊索引的結果
+    """
+
+    def __init__(self, directory: str, run_id: str = ""):
+        """
+        初始化共用答案
+
+        Args:
+            directory: 所有 worker 都能讀寫的目錄
+            run_id: 部署編號（同一個 master fork 出的 worker 相同）
+        """
+        self.directory = Path(directory)
+        self.path = self.directory / "hot_answers.json"
+        self.run_id = run_id
+        self._lock_file = None
+        self._loaded_mtime: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """此 worker 是否負責計算"""
+        return self._lock_file is not None
+
+    def acquire_leadership(self) -> bool:
+        """
+        嘗試成為計算者（不阻塞）
+
+        Returns:
+            此 worker 是否負責計算
+        """
+        if self._lock_file is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            # 不支援檔案鎖的平台每個 worker 各自計算
+            return True
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.directory / "hot_answers.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"✅ Worker {os.getpid()} 負責計算熱門問題答案")
+        return True
+
+    def release(self) -> None:
+        """釋放計算者的檔案鎖，由其他 worker 接手"""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def publish(self, version: Optional[str], answers: Dict[tuple, Dict[str, Any]]) -> None:
+        """寫入計算結果（先寫入暫存檔再替換，其他 worker 不會讀到寫到一半的檔案）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "run_id": self.run_id,
+            "version": version,
+            "answers": [[list(key), response] for key, response in answers.items()]
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, version: Optional[str]) -> Optional[Dict[tuple, Dict[str, Any]]]:
+        """
+        讀取計算者寫入的答案
+
+        Returns:
+            快取鍵值 -> 回答；檔案未更新，或不屬於此部署與索引版本時回傳 None
+        """
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self._loaded_mtime:
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取共用熱門問題答案失敗: {e}")
+            return None
+        if payload.get("run_id") != self.run_id or payload.get("version") != version:
+            return None
+        self._loaded_mtime = mtime
+        return {tuple(key): response for key, response in payload.get("answers", [])}
+
+
+def create_hot_answer_store() -> Optional[SharedHotAnswerStore]:
+    """
+    依 RAG_HOT_ANSWERS_SHARED_DIR 建立共用答案（未設定時每個行程各自計算）
+
+    >>> _ = os.environ.pop("RAG_HOT_ANSWERS_SHARED_DIR", None)
+    >>> create_hot_answer_store() is None
+    True
+    """
+    directory = os.getenv("RAG_HOT_ANSWERS_SHARED_DIR", "").strip()
+    if not directory:
+        return None
+    return SharedHotAnswerStore(directory, run_id=os.getenv("RAG_HOT_ANSWERS_RUN_ID", ""))
+
+
+class HotAnswerRefresher:
+    """在背景執行緒預先計算熱門問題答案，並在向量資料庫版本變更時重算"""
+
+    def __init__(self, qa_system, questions: Optional[List[str]] = None, k: Optional[int] = None,
+                 include_llm: Optional[bool] = None, refresh_interval: Optional[float] = None,
+                 store: Optional[SharedHotAnswerStore] = None, sync_interval: Optional[float] = None):
+        """
+        初始化預熱工作
+
+        Args:
+            qa_system: TrendMicroQASystem 實例
+            questions: 熱門問題，預設讀取 load_hot_questions()
+            k: 返回結果數量（需與 API 請求的 k 相同才會命中快取），預設讀取 RAG_HOT_ANSWERS_K
+            include_llm: 是否以 LLM 生成答案，預設讀取 RAG_HOT_ANSWERS_LLM
+            refresh_interval: 檢查向量資料庫版本的間隔（秒，0 表示不檢查），預設讀取 RAG_HOT_ANSWERS_REFRESH_SECONDS
+            store: 多 worker 共用的答案，None 表示此行程自行計算
+            sync_interval: 非計算者載入共用答案的間隔（秒），預設讀取 RAG_HOT_ANSWERS_SYNC_SECONDS
+        """
+        self.qa_system = qa_system
+        self.questions = questions if questions is not None else load_hot_questions()
+        self.k = k if k is not None else int(os.getenv("RAG_HOT_ANSWERS_K", "3"))
+        if include_llm is None:
+            include_llm = os.getenv("RAG_HOT_ANSWERS_LLM", "true").lower() == "true"
+        self.include_llm = include_llm
+        self.refresh_interval = refresh_interval if refresh_interval is not None \
+            else float(os.getenv("RAG_HOT_ANSWERS_REFRESH_SECONDS", "60"))
+        self.store = store
+        self.sync_interval = sync_interval if sync_interval is not None \
+            else float(os.getenv("RAG_HOT_ANSWERS_SYNC_SECONDS", "5"))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _vector_version(self) -> Optional[str]:
+        """目前載入的向量資料庫版本（共用答案需與索引版本一致）"""
+        return getattr(getattr(self.qa_system, "rag_engine", None), "loaded_version", None)
+
+    def warm(self) -> int:
+        """
+        預先計算所有熱門問題的答案
+
+        使用共用答案時只有計算者呼叫 LLM 並寫入共用目錄，其他 worker 載入計算者的結果
+        """
+        if self.store is None:
+            return self.qa_system.warm_hot_answers(self.questions, k=self.k, include_llm=self.include_llm)
+
+        if self.store.acquire_leadership():
+            answers = self.qa_system.compute_hot_answers(self.questions, k=self.k, include_llm=self.include_llm)
+            self.qa_system.load_hot_answers(answers)
+            self.store.publish(self._vector_version(), answers)
+            logger.info(f"✅ 熱門問題預先計算完成並分享給其他 worker: {len(answers)}/{len(self.questions)}")
+            return len(answers)
+
+        answers = self.store.load(self._vector_version())
+        if not answers:
+            return 0
+        loaded = self.qa_system.load_hot_answers(answers)
+        logger.info(f"✅ 已載入共用的熱門問題答案: {loaded}")
+        return loaded
+
+    def refresh_once(self) -> bool:
+        """向量資料庫版本變更時重新載入並重算，回傳是否已重算"""
+        if not self.qa_system.reload_if_vector_store_changed():
+            return False
+        self.warm()
+        return True
+
+    def _wait_interval(self) -> float:
+        """背景執行緒的喚醒間隔（非計算者以較短的間隔同步共用答案）"""
+        if self.store is not None and not self.store.is_leader and self.sync_interval > 0:
+            if self.refresh_interval <= 0:
+                return self.sync_interval
+            return min(self.refresh_interval, self.sync_interval)
+        return self.refresh_interval
+
+    def _run(self) -> None:
+        """背景執行緒：先預先計算，再定期檢查版本（非計算者另外定期同步共用答案）"""
+        try:
+            self.warm()
+        except Exception as e:
+            logger.error(f"❌ 熱門問題預先計算失敗: {e}")
+
+        last_check = time.monotonic()
+        while True:
+            interval = self._wait_interval()
+            if interval <= 0 or self._stop.wait(interval):
+                return
+            try:
+                if self.refresh_interval > 0 and time.monotonic() - last_check >= self.refresh_interval:
+                    last_check = time.monotonic()
+                    self.refresh_once()
+                elif self.store is not None and not self.store.is_leader:
+                    # 載入計算者的新結果；計算者結束（鎖已釋放）時在此接手計算
+                    self.warm()
+            except Exception as e:
+                logger.error(f"❌ 熱門問題更新失敗: {e}")
+
+    def start(self) -> None:
+        """啟動背景預熱工作（不阻塞服務啟動）"""
+        if self._thread is not None or not self.questions:
+            return
+        self._thread = threading.Thread(target=self._run, name="hot-answer-refresher", daemon=True)
+        self._thread.start()
+        logger.info(f"🔥 熱門問題預熱工作已啟動 ({len(self.questions)} 個問題)")
+
+    def stop(self) -> None:
+        """停止背景預熱工作"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.store is not None:
+            self.store.release()
@@ -0,0 +1,77 @@
+"""
+啟動匯入時間測試
+
+以 python -X importtime 量測匯入 API 模組的時間，確保冷啟動（自動擴展新實例）不會載入
+LangChain、torch、transformers 等重量級套件；這些套件應在建立對應元件時才載入
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+# 匯入 core_app.app 的時間預算（秒），可依機器效能以環境變數調整
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "2.0"))
+
+# 匯入時不應載入的重量級套件
+DEFERRED_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain",
+    "langchain_community",
+    "langchain_huggingface",
+    "langchain_google_genai",
+    "faiss",
+    "pandas",
+    "pdfplumber"
+]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def profile_import(module: str) -> Dict[str, int]:
+    """
+    在新的直譯器中匯入模組並解析 -X importtime 輸出
+
+    Returns:
+        模組名稱 -> 累計匯入時間（微秒）
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative
+
+@pytest.fixture(scope="module")
+def app_import_profile():
+    """core_app.app 的匯入時間剖析"""
+    return profile_import("core_app.app")
+
+class TestImportTime:
+    """啟動匯入時間測試類別"""
+
+    def test_heavy_dependencies_are_deferred(self, app_import_profile):
+        """測試匯入 API 模組時不載入重量級套件"""
+        loaded = sorted(
+            module for module in DEFERRED_MODULES
+            if any(name == module or name.startswith(module + ".") for name in app_import_profile)
+        )
+        assert loaded == []
+
+    def test_app_import_within_budget(self, app_import_profile):
+        """測試匯入 API 模組的累計時間在預算內"""
+        seconds = app_import_profile["core_app.app"] / 1_000_000
+        assert seconds < IMPORT_TIME_BUDGET_SECONDS, f"匯入 core_app.app 花費 {seconds:.2f}s"
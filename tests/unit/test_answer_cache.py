@@ -0,0 +1,138 @@
+"""
+答案快取與延遲預算降級的單元測試
+"""
+
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from core_app.main import TrendMicroQASystem, LLMGateway
+from core_app.rag.tools import answer_cache
+from core_app.rag.tools.answer_cache import AnswerCache
+from core_app.rag.tools.context_builder import ContextBuilder
+from core_app.rag.tools.metrics import MetricsRegistry
+from core_app.rag.tools.prompt_builder import CompiledPromptTemplate
+from core_app.rag.tools.single_flight import SingleFlight
+
+class TestAnswerCache:
+    """測試答案快取"""
+
+    def test_entries_expire_after_ttl(self, monkeypatch):
+        """測試超過有效時間的回答視為未命中並移除"""
+        now = [100.0]
+        monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+        cache = AnswerCache(ttl_seconds=10)
+        cache.set("q", {"answer": "CREM"})
+
+        now[0] = 109.0
+        assert cache.get("q") == {"answer": "CREM"}
+        now[0] = 110.0
+        assert cache.get("q") is None
+        assert cache.get_stats()["expired"] == 1
+        assert cache.get_stats()["size"] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        """測試超過容量時淘汰最久未使用的回答"""
+        cache = AnswerCache(max_entries=2)
+        cache.set("a", {"answer": 1})
+        cache.set("b", {"answer": 2})
+        cache.get("a")
+        cache.set("c", {"answer": 3})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"answer": 1}
+        assert cache.get_stats()["evicted"] == 1
+
+    def test_returns_copies(self):
+        """測試寫入與讀出都是複製，呼叫端修改不影響快取"""
+        cache = AnswerCache()
+        value = {"answer": "CREM", "citations": [{"rank": 1}]}
+        cache.set("q", value)
+        value["citations"].append({"rank": 2})
+
+        cached = cache.get("q")
+        cached["citations"][0]["rank"] = 99
+
+        assert cache.get("q") == {"answer": "CREM", "citations": [{"rank": 1}]}
+
+@dataclass
+class FakeResult:
+    """模擬 QueryResult"""
+    content: str
+    content_type: str = "text"
+    source: str = "report.pdf"
+    confidence_score: float = 0.9
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    full_content: Optional[str] = None
+
+class FakeRagEngine:
+    """固定回傳一個檢索結果的模擬查詢引擎"""
+
+    def query(self, question, k, filter_type):
+        return [FakeResult("CREM 提供攻擊面探索與風險評估。")]
+
+class BlockingLLM:
+    """等到測試放行才回答的模擬 LLM"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, prompt, **kwargs):
+        self.release.wait(5)
+        return "LLM 完整回答"
+
+@pytest.fixture
+def qa_system():
+    """建立不載入向量庫與 Gemini 的問答系統（只測試生成流程）"""
+    system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+    system.llm = BlockingLLM()
+    system.llm_available = True
+    system.llm_gateway = LLMGateway(system.llm, base_delay=0, max_delay=0)
+    system.rag_engine = FakeRagEngine()
+    system.table_engine = None
+    system.context_builder = ContextBuilder(max_tokens=500)
+    system.prompt_template = CompiledPromptTemplate("你是資安專家。\n", "{context}\n{question}\n{result_count}")
+    system.prompt_prefix_cache = None
+    system.vector_count = 1
+    system.single_flight = SingleFlight()
+    system.answer_cache = AnswerCache()
+    system.default_latency_budget = None
+    system._generation_pool = ThreadPoolExecutor(max_workers=2)
+    system._speculative_lock = threading.Lock()
+    system.speculative_stats = {"deadline_fallbacks": 0, "background_upgrades": 0, "background_failures": 0}
+    system.metrics = MetricsRegistry()
+    yield system
+    system.llm.release.set()
+    system._generation_pool.shutdown(wait=True)
+
+class TestLatencyBudget:
+    """測試延遲預算內未完成生成時的降級與背景升級"""
+
+    def test_deadline_returns_retrieval_answer_then_caches_llm_answer(self, qa_system):
+        """測試逾時先回傳檢索答案，背景生成完成後下一次提問命中 LLM 回答"""
+        first = qa_system.ask_question("CREM 是什麼？", latency_budget=0.05)
+
+        assert first["generation_method"] == "structured_deadline"
+        assert first["llm_pending"] is True
+        assert "CREM 提供攻擊面探索" in first["answer"]
+
+        qa_system.llm.release.set()
+        qa_system._generation_pool.shutdown(wait=True)
+
+        second = qa_system.ask_question("CREM 是什麼？", latency_budget=0.05)
+        assert second["cache_hit"] is True
+        assert second["generation_method"] == "llm_generated"
+        assert second["answer"] == "LLM 完整回答"
+        assert second["llm_pending"] is False
+        assert qa_system.speculative_stats["background_upgrades"] == 1
+
+    def test_answer_within_budget_is_cached(self, qa_system):
+        """測試在預算內完成的 LLM 回答直接回傳並寫入快取"""
+        qa_system.llm.release.set()
+
+        first = qa_system.ask_question("CREM 是什麼？", latency_budget=5)
+
+        assert first["generation_method"] == "llm_generated"
+        assert "cache_hit" not in first
+        assert qa_system.ask_question("  crem  是什麼？")["cache_hit"] is True
@@ -0,0 +1,67 @@
+"""
+Prompt 上下文建構器的單元測試
+"""
+
+import pytest
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from core_app.rag.tools.context_builder import ContextBuilder
+
+@dataclass
+class FakeResult:
+    """模擬 QueryResult"""
+    content_type: str
+    content: str
+    source: str = "report.pdf"
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    full_content: Optional[str] = None
+
+TABLE_ROWS = "\n".join(f"  {i}. Risky event {i}: {i * 10}" for i in range(1, 8))
+
+class TestContextBuilder:
+    """測試上下文建構"""
+
+    def test_strips_adjacent_chunk_overlap(self):
+        """測試去除相鄰分塊重疊的文字"""
+        results = [
+            FakeResult("text", "CREM 提供攻擊面探索。攻擊面探索可找出未受管理的資產與暴露的服務。"),
+            FakeResult("text", "攻擊面探索可找出未受管理的資產與暴露的服務。風險評估會依嚴重程度排序。")
+        ]
+
+        built = ContextBuilder(max_tokens=500).build(results)
+
+        assert built.passages[1].content == "風險評估會依嚴重程度排序。"
+        assert built.overlap_chars_removed > 0
+
+    def test_drops_duplicate_table_from_other_extractor(self):
+        """測試同頁面內容相同的表格只保留最相關的一個"""
+        results = [
+            FakeResult("table", "📊 表格標題: Camelot_Table_13_1\n" + TABLE_ROWS, metadata={"source_page": 13}),
+            FakeResult("table", "📊 表格標題: PDFPlumber_Table_13_1\n" + TABLE_ROWS, metadata={"source_page": 13}),
+            FakeResult("table", "📊 表格標題: Camelot_Table_14_1\n" + TABLE_ROWS, metadata={"source_page": 14})
+        ]
+
+        built = ContextBuilder(max_tokens=1000).build(results)
+
+        assert [passage.rank for passage in built.passages] == [1, 3]
+        assert built.dropped == {"duplicate_table": 1}
+
+    def test_trims_to_budget_by_relevance(self):
+        """測試超出預算時截斷最相關的段落並捨棄其餘段落"""
+        results = [FakeResult("text", "風險" * 200), FakeResult("text", "弱認證" * 50)]
+
+        built = ContextBuilder(max_tokens=100).build(results)
+
+        assert len(built.passages) == 1
+        assert built.tokens <= 100
+        assert built.passages[0].content.endswith("...")
+        assert built.dropped == {"over_budget": 1}
+
+    def test_uses_full_content_instead_of_display_text(self):
+        """測試以完整內容組成上下文，而非截斷至 300 字元的顯示內容"""
+        full_text = "CREM 風險評估說明。" * 60
+        results = [FakeResult("text", full_text[:300] + "...", full_content=full_text)]
+
+        built = ContextBuilder(max_tokens=2000).build(results)
+
+        assert built.passages[0].content == full_text.strip()
@@ -0,0 +1,65 @@
+"""
+本地答案生成後端的單元測試
+"""
+
+import pytest
+from core_app.main import TrendMicroQASystem
+from core_app.rag.tools.generator_backends import LocalStandInLLM, LlamaCppLLM
+
+PROMPT = (
+    "你是資安專家。\n"
+    "=== 檢索結果 (2個結果) ===\n"
+    "CREM 提供攻擊面探索。\n"
+    "風險評估會依嚴重程度排序。\n"
+    "=== 用戶問題 ===\n"
+    "CREM 是什麼？\n"
+)
+
+class TestLocalStandInLLM:
+    """測試決定性模擬生成器"""
+
+    def test_same_prompt_gives_same_answer_and_latency(self):
+        """測試相同 prompt 得到相同答案與延遲，且延遲包含輸出 token 的生成時間"""
+        sleeps = []
+        llm = LocalStandInLLM(latency_median=0.5, latency_sigma=0.3, tokens_per_second=20, sleep=sleeps.append)
+
+        first = llm.invoke(PROMPT, cached_content="ignored")
+        second = llm.invoke(PROMPT)
+
+        assert first.content == second.content
+        assert first.content.startswith("**📋 摘要**\nCREM 提供攻擊面探索。")
+        assert "你是資安專家" not in first.content
+        assert sleeps[0] == sleeps[1] > 0
+        assert llm.get_stats()["calls"] == 2
+
+    def test_latency_follows_token_rate(self):
+        """測試固定首個 token 延遲時，延遲隨輸出 token 數與速率線性增加"""
+        llm = LocalStandInLLM(latency_median=0.2, latency_sigma=0, tokens_per_second=10)
+
+        assert llm.simulated_latency(PROMPT, 30) == pytest.approx(3.2)
+
+    def test_answer_respects_max_tokens(self):
+        """測試答案不超過最大輸出 token 數"""
+        llm = LocalStandInLLM(max_tokens=20, sleep=lambda seconds: None)
+
+        assert llm.invoke(PROMPT).content == "**📋 摘要**\nCREM 提供攻擊面探索。"
+
+class TestBackendSelection:
+    """測試依 LLM_BACKEND 建立生成器"""
+
+    def test_local_stand_in_backend(self, monkeypatch):
+        """測試 local_stub 後端不需 API Key 並讀取延遲設定"""
+        monkeypatch.setenv("LOCAL_LLM_TOKENS_PER_SECOND", "25")
+        system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+        system.llm_backend = "local_stub"
+
+        llm, model_name = system._create_llm()
+
+        assert isinstance(llm, LocalStandInLLM)
+        assert llm.tokens_per_second == 25
+        assert model_name == "local_stub"
+
+    def test_llama_cpp_backend_requires_model_file(self, tmp_path):
+        """測試 llama_cpp 後端在套件或模型檔缺少時明確失敗"""
+        with pytest.raises((ImportError, FileNotFoundError)):
+            LlamaCppLLM(str(tmp_path / "missing.gguf"))
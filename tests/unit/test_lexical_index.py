@@ -0,0 +1,52 @@
+"""
+詞彙倒排索引的單元測試
+"""
+
+import pytest
+from core_app.rag.tools.lexical_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+@pytest.fixture
+def index():
+    """建立含中英文混合文檔的索引"""
+    return BM25Index().build([
+        (0, "CREM 提供網路風險曝險管理功能"),
+        (1, "XDR 偵測與回應整合多個安全層"),
+        (2, "風險分數 CRI 為 66 分，高於產業平均"),
+        (3, "表格標題: 前10大風險事件 CVE-2024-21357")
+    ])
+
+class TestTokenize:
+    """測試分詞"""
+
+    def test_mixed_text(self):
+        """測試拉丁詞轉小寫、CJK 以二元組切分"""
+        assert tokenize("XDR 偵測") == ["xdr", "偵測"]
+        assert tokenize("單") == ["單"]
+
+    def test_numbers_keep_compound(self):
+        """測試含分隔符號的數字保留完整詞並加入組成部分"""
+        assert tokenize("1,011,628") == ["1,011,628", "1", "011", "628"]
+
+class TestBM25Index:
+    """測試 BM25 搜尋"""
+
+    def test_exact_product_term(self, index):
+        """測試產品術語精確命中"""
+        assert index.search("什麼是 XDR？", k=1)[0][0] == 1
+        assert index.search("CRI 分數", k=1)[0][0] == 2
+
+    def test_cve_number(self, index):
+        """測試 CVE 編號可以部分比對"""
+        assert index.search("21357", k=1)[0][0] == 3
+
+    def test_predicate_and_no_match(self, index):
+        """測試篩選條件與無命中的查詢"""
+        hits = index.search("風險", k=5, predicate=lambda doc_id: doc_id != 2)
+        assert 2 not in [doc_id for doc_id, _ in hits]
+        assert index.search("zzz", k=5) == []
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    """測試兩側都排名靠前的文檔排在最前"""
+    fused = reciprocal_rank_fusion([[1, 2, 3], [4, 2, 3]])
+    assert [key for key, _ in fused][0] == 2
+    assert {key for key, _ in fused} == {1, 2, 3, 4}
@@ -0,0 +1,92 @@
+"""
+LLM 閘道的單元測試
+"""
+
+import pytest
+from core_app.main import LLMGateway, LLMGatewayError
+
+class RateLimited(Exception):
+    """模擬 google.api_core 的 ResourceExhausted"""
+    code = 429
+
+class FakeLLM:
+    """依序拋出指定錯誤後回傳答案的模擬 LLM"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+        self.kwargs = []
+
+    def invoke(self, prompt, **kwargs):
+        self.calls += 1
+        self.kwargs.append(kwargs)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "答案"
+
+def make_gateway(llm, **kwargs):
+    """建立不等待退避的閘道"""
+    options = {"base_delay": 0, "max_delay": 0, "reset_timeout": 60}
+    options.update(kwargs)
+    return LLMGateway(llm, **options)
+
+class TestLLMGateway:
+    """測試 LLM 閘道"""
+
+    def test_retries_rate_limit_and_halves_limit(self):
+        """測試 429 會重試並降低並行上限"""
+        llm = FakeLLM([RateLimited("quota"), RateLimited("quota")])
+        gateway = make_gateway(llm, max_concurrency=4, max_retries=2)
+
+        assert gateway.invoke("問題") == "答案"
+
+        stats = gateway.get_stats()
+        assert llm.calls == 3
+        assert stats["retries"] == 2
+        assert stats["rate_limited"] == 2
+        # 4 -> 2 -> 1，成功後再緩慢提高
+        assert stats["concurrency_limit"] == 2
+
+    def test_non_retryable_error_is_raised_immediately(self):
+        """測試不可重試的錯誤不會重試"""
+        llm = FakeLLM([ValueError("invalid argument")])
+        gateway = make_gateway(llm)
+
+        with pytest.raises(ValueError):
+            gateway.invoke("問題")
+        assert llm.calls == 1
+
+    def test_breaker_opens_and_short_circuits(self):
+        """測試連續失敗後斷路器開啟，期間不再呼叫 LLM"""
+        llm = FakeLLM([RateLimited("quota")] * 2)
+        gateway = make_gateway(llm, max_retries=0, failure_threshold=2)
+
+        for _ in range(2):
+            with pytest.raises(RateLimited):
+                gateway.invoke("問題")
+        with pytest.raises(LLMGatewayError):
+            gateway.invoke("問題")
+
+        assert llm.calls == 2
+        assert gateway.get_stats()["breaker_state"] == "open"
+        assert gateway.get_stats()["short_circuited"] == 1
+
+    def test_half_open_probe_closes_breaker(self):
+        """測試冷卻後的試探請求成功時關閉斷路器"""
+        llm = FakeLLM([RateLimited("quota")])
+        gateway = make_gateway(llm, max_retries=0, failure_threshold=1, reset_timeout=0)
+
+        with pytest.raises(RateLimited):
+            gateway.invoke("問題")
+        assert gateway.invoke("問題") == "答案"
+        assert gateway.get_stats()["breaker_state"] == "closed"
+
+    def test_forwards_per_call_arguments(self):
+        """測試每次呼叫的參數（例如 cached_content）直接傳給 LLM"""
+        llm = FakeLLM()
+        gateway = make_gateway(llm)
+
+        gateway.invoke("問題", cached_content="cachedContents/abc")
+        gateway.invoke("問題")
+
+        assert llm.kwargs == [{"cached_content": "cachedContents/abc"}, {}]
@@ -0,0 +1,216 @@
+"""
+查詢指標登錄的單元測試
+"""
+
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from core_app.main import TrendMicroQASystem
+from core_app.rag.tools.answer_cache import AnswerCache
+from core_app.rag.tools.metrics import LatencyHistogram, MetricsRegistry, MultiprocessMetrics, PrometheusExposition
+from core_app.rag.tools.single_flight import SingleFlight
+from core_app.rag.tools.table_query_engine import StructuredTableQueryEngine
+
+class TestMetricsRegistry:
+    """測試計數器與延遲直方圖"""
+
+    def test_concurrent_increments_are_not_lost(self):
+        """測試多個執行緒同時累加時計數不會遺失"""
+        metrics = MetricsRegistry()
+
+        def work(_):
+            for _ in range(1000):
+                metrics.increment("total_queries")
+                metrics.observe("search", 0.001)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(work, range(8)))
+
+        assert metrics.get("total_queries") == 8000
+        assert metrics.histogram("search").count == 8000
+
+    def test_timer_records_stage_and_request_timings(self):
+        """測試計時區塊拋出例外時仍記錄延遲，並寫入單次請求的耗時字典"""
+        metrics = MetricsRegistry()
+        timings = {}
+
+        with pytest.raises(ValueError):
+            with metrics.timer("embed", timings):
+                raise ValueError("嵌入失敗")
+
+        assert metrics.histogram("embed").count == 1
+        assert timings["embed"] >= 0
+
+    def test_latency_summary_reports_percentiles(self):
+        """測試延遲摘要以毫秒回報分位數"""
+        metrics = MetricsRegistry()
+        for _ in range(99):
+            metrics.observe("llm", 0.2)
+        metrics.observe("llm", 8.0)
+
+        summary = metrics.latency_summary()["llm"]
+
+        assert summary["count"] == 100
+        assert 100 <= summary["p50_ms"] <= 250
+        assert summary["max_ms"] == pytest.approx(8000)
+        assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"] <= summary["max_ms"]
+
+    def test_histogram_copy_is_independent(self):
+        """測試取得的直方圖為複本，之後的觀測值不影響已取得的結果"""
+        metrics = MetricsRegistry()
+        metrics.observe("format", 0.01)
+        snapshot = metrics.histogram("format")
+
+        metrics.observe("format", 0.02)
+
+        assert snapshot.count == 1
+        assert metrics.histogram("format").count == 2
+
+    def test_overflow_bucket_uses_observed_max(self):
+        """測試超過最大桶上限的觀測值以實際最大值估計分位數"""
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        histogram.observe(5.0)
+
+        assert histogram.counts == [0, 0, 1]
+        assert histogram.quantile(0.99) <= 5.0
+
+class TestStructuredTableQueryStats:
+    """測試結構化表格查詢的並行統計"""
+
+    def test_concurrent_answers_are_counted(self, tmp_path):
+        """測試並行查詢時查詢次數完整記錄"""
+        engine = StructuredTableQueryEngine(str(tmp_path))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(engine.answer, ["CREM 是什麼？"] * 200))
+
+        stats = engine.get_stats()
+        assert stats["total_queries"] == 200
+        assert stats["answered_queries"] == 0
+        assert stats["latency"]["count"] == 200
+
+class TestPrometheusExposition:
+    """測試 Prometheus 文字格式輸出"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """測試直方圖桶為累計計數並包含 +Inf、sum 與 count"""
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 2.0):
+            histogram.observe(seconds)
+        exposition = PrometheusExposition()
+
+        exposition.histogram("rag_stage_duration_seconds", "階段延遲", {"embed": histogram}, label="stage")
+        lines = exposition.render().splitlines()
+
+        assert "# TYPE rag_stage_duration_seconds histogram" in lines
+        assert 'rag_stage_duration_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+        assert 'rag_stage_duration_seconds_bucket{stage="embed",le="1"} 2' in lines
+        assert 'rag_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+        assert 'rag_stage_duration_seconds_count{stage="embed"} 3' in lines
+
+    def test_label_values_are_escaped(self):
+        """測試標籤值中的引號與換行會跳脫"""
+        exposition = PrometheusExposition()
+
+        exposition.gauge("rag_info", "資訊", 1, labels={"model": 'gemini "flash"\n'})
+
+        assert 'rag_info{model="gemini \\"flash\\"\\n"} 1' in exposition.render()
+
+    def test_merge_sums_counters_and_histograms_and_labels_gauges(self):
+        """測試多 worker 彙總時計數器與直方圖相加，量測值只保留存活 worker 並加上 worker 標籤"""
+        def worker_exposition(requests, seconds, in_flight):
+            histogram = LatencyHistogram(buckets=(0.1, 1.0))
+            histogram.observe(seconds)
+            exposition = PrometheusExposition()
+            exposition.counter("rag_requests_total", "請求數", requests)
+            exposition.histogram("rag_stage_duration_seconds", "階段延遲", {"llm": histogram}, label="stage")
+            exposition.gauge("rag_requests_in_flight", "執行中", in_flight)
+            return exposition.snapshot()
+
+        merged = PrometheusExposition.merge(
+            {"101": worker_exposition(3, 0.05, 1), "102": worker_exposition(4, 0.5, 2), "103": worker_exposition(5, 2.0, 7)},
+            live_workers=["101", "102"]
+        )
+        lines = merged.render().splitlines()
+
+        # 已結束的 worker 103 的計數仍計入，總數不會倒退
+        assert "rag_requests_total 12" in lines
+        assert 'rag_stage_duration_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+        assert 'rag_stage_duration_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+        assert 'rag_stage_duration_seconds_count{stage="llm"} 3' in lines
+        assert 'rag_requests_in_flight{worker="101"} 1' in lines
+        assert 'rag_requests_in_flight{worker="102"} 2' in lines
+        assert not any('worker="103"' in line for line in lines)
+        assert lines.count("# TYPE rag_requests_total counter") == 1
+
+@pytest.fixture
+def metrics_system():
+    """建立只含指標相關元件的問答系統"""
+    system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+    system.metrics = MetricsRegistry()
+    system.rag_engine = SimpleNamespace(metrics=MetricsRegistry())
+    system.table_engine = None
+    system.vector_count = 42
+    system.table_count = 2
+    system.answer_cache = AnswerCache()
+    system.single_flight = SingleFlight()
+    system.default_latency_budget = None
+    system._speculative_lock = threading.Lock()
+    system.speculative_stats = {"deadline_fallbacks": 0, "background_upgrades": 0, "background_failures": 0}
+    return system
+
+class TestMetricsEndpoint:
+    """測試 /metrics 端點"""
+
+    def test_metrics_include_http_stage_and_cache_metrics(self, metrics_system, monkeypatch):
+        """測試輸出各端點請求數、管線階段延遲、快取命中與索引大小"""
+        from fastapi.testclient import TestClient
+        from core_app import app as api
+
+        metrics_system.metrics.observe("detect_query_type", 0.001)
+        metrics_system.rag_engine.metrics.observe("search", 0.004)
+        metrics_system.answer_cache.set("q", {"answer": "CREM"})
+        metrics_system.answer_cache.get("q")
+        monkeypatch.setattr(api, "qa_system", metrics_system)
+        monkeypatch.setattr(api, "startup_warmer", None)
+        monkeypatch.setattr(api, "http_metrics", MetricsRegistry())
+        client = TestClient(api.app)
+
+        client.get("/examples")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'rag_http_requests_total{endpoint="/examples",status="200"} 1' in body
+        assert 'rag_http_request_duration_seconds_count{endpoint="/examples"} 1' in body
+        assert 'rag_request_stage_duration_seconds_count{stage="detect_query_type"} 1' in body
+        assert 'rag_retrieval_stage_duration_seconds_count{stage="search"} 1' in body
+        assert "rag_answer_cache_hit_ratio 1" in body
+        assert "rag_vector_count 42" in body
+        assert "rag_ready 1" in body
+
+    def test_metrics_are_aggregated_across_workers(self, metrics_system, monkeypatch, tmp_path):
+        """測試多 worker 時任一 worker 回傳所有 worker 的彙總"""
+        from fastapi.testclient import TestClient
+        from core_app import app as api
+
+        other_worker = PrometheusExposition()
+        other_worker.add("rag_http_requests_total", "counter", "HTTP 請求數（依端點與狀態碼）",
+                         [({"endpoint": "/examples", "status": "200"}, 5)])
+        other_worker.counter("rag_requests_total", "ask_question 請求數", 7)
+        MultiprocessMetrics(str(tmp_path), worker_id="other").write(other_worker)
+        monkeypatch.setattr(api, "qa_system", metrics_system)
+        monkeypatch.setattr(api, "startup_warmer", None)
+        monkeypatch.setattr(api, "http_metrics", MetricsRegistry())
+        monkeypatch.setattr(api, "multiprocess_metrics", MultiprocessMetrics(str(tmp_path), worker_id="self"))
+        client = TestClient(api.app)
+
+        client.get("/examples")
+        body = client.get("/metrics").text
+
+        assert 'rag_http_requests_total{endpoint="/examples",status="200"} 6' in body
+        assert "rag_requests_total 7" in body
+        assert 'rag_vector_count{worker="self"} 42' in body
+        assert (tmp_path / "self.json").exists()
@@ -0,0 +1,92 @@
+"""
+頁面快取的單元測試
+"""
+
+import pytest
+from core_app.rag.processors.page_cache import PageCache, compute_page_hashes, page_content_hash
+
+def write_form_pdf(path, form_content):
+    """寫入單頁 PDF，頁面內容只以 /Fm0 Do 繪製 Form XObject"""
+    page_content = b"q /Fm0 Do Q"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] /Contents 4 0 R"
+        b" /Resources << /XObject << /Fm0 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(page_content), page_content),
+        b"<< /Type /XObject /Subtype /Form /BBox [0 0 200 200]"
+        b" /Resources << /Font << /F1 6 0 R >> >> /Length %d >>\nstream\n%s\nendstream"
+        % (len(form_content), form_content),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(data)
+    return path
+
+class FakePage:
+    """模擬無法讀取內容串流的 pdfplumber 頁面"""
+
+    def __init__(self, text, bbox=(0, 0, 612, 792)):
+        self.text = text
+        self.bbox = bbox
+        self.page_obj = None
+
+    def extract_text(self):
+        return self.text
+
+class TestPageCache:
+    """測試頁面快取"""
+
+    def test_set_and_get(self, tmp_path):
+        """測試寫入後可讀回並統計命中率"""
+        cache = PageCache(tmp_path)
+
+        assert cache.get("text", "ab" * 32) is None
+        cache.set("text", "ab" * 32, {"text": "CREM 風險總覽"})
+
+        assert cache.get("text", "ab" * 32) == {"text": "CREM 風險總覽"}
+        assert cache.get_stats()["hits"] == 1
+        assert cache.get_stats()["misses"] == 1
+
+    def test_namespaces_are_separate(self, tmp_path):
+        """測試不同命名空間的項目互不影響"""
+        cache = PageCache(tmp_path)
+        cache.set("tables", "cd" * 32, [])
+
+        assert cache.get("text", "cd" * 32) is None
+        assert cache.get("tables", "cd" * 32) == []
+
+    def test_corrupted_entry_is_a_miss(self, tmp_path):
+        """測試損毀的快取項目視為未命中"""
+        cache = PageCache(tmp_path)
+        cache.set("text", "ef" * 32, {"text": "ok"})
+        cache._entry_path("text", "ef" * 32).write_text("{broken", encoding="utf-8")
+
+        assert cache.get("text", "ef" * 32) is None
+
+class TestPageContentHash:
+    """測試頁面雜湊"""
+
+    def test_hash_falls_back_to_text(self):
+        """測試無法讀取內容串流時以文本計算雜湊"""
+        assert page_content_hash(FakePage("第 1 頁")) == page_content_hash(FakePage("第 1 頁"))
+        assert page_content_hash(FakePage("第 1 頁")) != page_content_hash(FakePage("第 2 頁"))
+        assert page_content_hash(FakePage("A", bbox=(0, 0, 100, 100))) != page_content_hash(FakePage("A"))
+
+    def test_form_xobject_change_changes_hash(self, tmp_path):
+        """測試頁面內容串流相同、只有 Form XObject 改變時雜湊不同"""
+        pytest.importorskip("pdfplumber")
+        original = write_form_pdf(tmp_path / "v1.pdf", b"BT /F1 12 Tf 20 100 Td (Risk 64) Tj ET")
+        same = write_form_pdf(tmp_path / "v1-copy.pdf", b"BT /F1 12 Tf 20 100 Td (Risk 64) Tj ET")
+        edited = write_form_pdf(tmp_path / "v2.pdf", b"BT /F1 12 Tf 20 100 Td (Risk 71) Tj ET")
+
+        assert compute_page_hashes(original) == compute_page_hashes(same)
+        assert compute_page_hashes(original) != compute_page_hashes(edited)
@@ -0,0 +1,160 @@
+"""
+取樣剖析的單元測試
+"""
+
+import threading
+import time
+import pytest
+from core_app import profiling
+from core_app.profiling import HotPathSampler, ProfileCoordinator, SamplingProfiler
+
+def clean_text(stop):
+    """與 TextProcessor.clean_text 同名的忙碌迴圈"""
+    while not stop.is_set():
+        sum(range(1000))
+
+def busy_loop(stop):
+    """不屬於任何熱路徑的忙碌迴圈"""
+    while not stop.is_set():
+        sum(range(1000))
+
+@pytest.fixture
+def busy_thread():
+    """在背景執行指定函數的執行緒，測試結束時停止"""
+    stop = threading.Event()
+    threads = []
+
+    def start(target):
+        thread = threading.Thread(target=target, args=(stop,), name="busy-worker", daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    yield start
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+class TestSamplingProfiler:
+    """測試堆疊取樣"""
+
+    def test_collapsed_stack_contains_busy_function(self, busy_thread):
+        """測試忙碌執行緒的堆疊以執行緒名稱為根、由外而內輸出"""
+        busy_thread(busy_loop)
+        profiler = SamplingProfiler(interval=0.001)
+
+        for _ in range(20):
+            profiler.sample_once()
+
+        collapsed = profiler.collapsed(prefix="worker-1;")
+        busy_lines = [line for line in collapsed.splitlines() if "busy_loop" in line]
+        assert busy_lines
+        stack, count = busy_lines[0].rsplit(" ", 1)
+        assert stack.startswith("worker-1;busy-worker;")
+        assert stack.endswith(f"{__name__}:busy_loop")
+        assert int(count) >= 1
+        assert profiler.samples == 20
+
+    def test_idle_threads_are_skipped(self):
+        """測試等待事件的執行緒不計入取樣"""
+        event = threading.Event()
+        waiter = threading.Thread(target=event.wait, name="idle-waiter", daemon=True)
+        waiter.start()
+        profiler = SamplingProfiler()
+
+        try:
+            profiler.sample_once()
+        finally:
+            event.set()
+            waiter.join()
+
+        assert "idle-waiter" not in profiler.collapsed()
+
+class TestHotPathSampler:
+    """測試熱路徑歸屬"""
+
+    def test_samples_are_attributed_to_clean_text(self, busy_thread):
+        """測試執行 clean_text 的執行緒歸屬到 clean_text 分類，其餘歸屬到 other"""
+        busy_thread(clean_text)
+        busy_thread(busy_loop)
+        sampler = HotPathSampler(interval=0.1)
+
+        for _ in range(10):
+            sampler.sample_once()
+
+        stats = sampler.get_stats()
+        assert stats["categories"]["clean_text"]["samples"] == 10
+        assert stats["categories"]["clean_text"]["estimated_seconds"] == pytest.approx(1.0)
+        assert stats["categories"]["other"]["samples"] >= 10
+        assert stats["categories"]["faiss_search"]["samples"] == 0
+
+    def test_module_prefix_classification(self, monkeypatch):
+        """測試以模組前綴歸屬（例如 faiss.class_wrappers 的 replacement_search）"""
+        frame = type("Frame", (), {
+            "f_globals": {"__name__": "faiss.class_wrappers"},
+            "f_code": type("Code", (), {"co_name": "replacement_search"})(),
+            "f_back": None
+        })()
+
+        assert profiling._classify(frame) == "faiss_search"
+
+class TestProfileCoordinator:
+    """測試多 worker 剖析協調"""
+
+    def test_request_poll_and_collect(self, tmp_path, busy_thread):
+        """測試請求檔被輪詢取樣後寫入結果，合併後清除檔案"""
+        busy_thread(busy_loop)
+        coordinator = ProfileCoordinator(str(tmp_path), poll_interval=0.01)
+
+        run_id = coordinator.request(seconds=0.1, interval=0.005)
+        threads = coordinator.poll_once()
+        # 已處理的請求不會重複取樣
+        assert coordinator.poll_once() == []
+        for thread in threads:
+            thread.join()
+
+        collapsed, workers = coordinator.collect(run_id)
+        assert workers == 1
+        assert "busy_loop" in collapsed
+        assert list(tmp_path.iterdir()) == []
+
+    def test_expired_request_is_ignored(self, tmp_path):
+        """測試已過截止時間的請求不再取樣"""
+        coordinator = ProfileCoordinator(str(tmp_path))
+        coordinator.request(seconds=0.01)
+        time.sleep(0.02)
+
+        assert coordinator.poll_once() == []
+
+class TestProfileEndpoint:
+    """測試 /admin/profile 端點"""
+
+    @pytest.fixture
+    def client(self, monkeypatch, tmp_path):
+        from fastapi.testclient import TestClient
+        from core_app import app as api
+
+        coordinator = ProfileCoordinator(str(tmp_path), poll_interval=0.01)
+        coordinator.start()
+        monkeypatch.setenv("RAG_ADMIN_TOKEN", "secret-token")
+        monkeypatch.setattr(api, "profile_coordinator", coordinator)
+        yield TestClient(api.app)
+        coordinator.stop()
+
+    def test_requires_admin_token(self, client, monkeypatch):
+        """測試缺少或錯誤的 token 被拒絕，未設定 token 時端點停用"""
+        assert client.get("/admin/profile?seconds=0.1").status_code == 403
+        assert client.get("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+        monkeypatch.delenv("RAG_ADMIN_TOKEN")
+        assert client.get("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "secret-token"}).status_code == 404
+
+    def test_returns_collapsed_stacks(self, client, busy_thread):
+        """測試回傳合併的 collapsed stack 檔案"""
+        busy_thread(busy_loop)
+
+        response = client.get("/admin/profile?seconds=0.2&interval=0.005", headers={"X-Admin-Token": "secret-token"})
+
+        assert response.status_code == 200
+        assert response.headers["x-profile-workers"] == "1"
+        assert "attachment" in response.headers["content-disposition"]
+        assert "busy_loop" in response.text
@@ -0,0 +1,59 @@
+"""
+預先編譯 Prompt 模板與前綴快取的單元測試
+"""
+
+import sys
+import time
+import pytest
+from core_app.rag.tools.prompt_builder import CompiledPromptTemplate, GeminiPrefixCache
+
+class TestCompiledPromptTemplate:
+    """測試預先編譯的 Prompt 模板"""
+
+    def test_prefix_with_fields_is_rejected(self):
+        """測試前綴包含欄位時拒絕建立"""
+        with pytest.raises(ValueError):
+            CompiledPromptTemplate("你是資安專家，問題: {question}\n", "{context}")
+
+    def test_escaped_braces_are_restored_in_prefix(self):
+        """測試前綴中的 {{ }} 還原為單一大括號，本體欄位正常填入"""
+        template = CompiledPromptTemplate('輸出格式: {{"answer": "..."}}\n', "問題: {question}")
+
+        assert template.input_variables == ["question"]
+        assert template.format(question="CRI 是什麼？") == '輸出格式: {"answer": "..."}\n問題: CRI 是什麼？'
+        assert template.format_body(question="CRI 是什麼？") == "問題: CRI 是什麼？"
+
+class CountingPrefixCache(GeminiPrefixCache):
+    """以計數器模擬建立伺服器端快取"""
+
+    def __init__(self):
+        super().__init__("gemini-test", "你是資安專家。", ttl_minutes=60)
+        self.created = 0
+
+    def _create(self):
+        self.created += 1
+        self.name = f"cachedContents/{self.created}"
+        self.expires_at = time.time() + self.ttl_minutes * 60
+
+class TestGeminiPrefixCache:
+    """測試 Prompt 前綴快取"""
+
+    def test_reuses_and_refreshes_before_expiry(self):
+        """測試有效期間內重複使用快取，即將到期時重新建立"""
+        cache = CountingPrefixCache()
+
+        assert cache.get() == "cachedContents/1"
+        assert cache.get() == "cachedContents/1"
+
+        cache.expires_at = time.time() + 30  # 進入重新建立的安全範圍
+        assert cache.get() == "cachedContents/2"
+        assert cache.created == 2
+
+    def test_disables_itself_when_creation_fails(self, monkeypatch):
+        """測試建立失敗（例如套件缺少）後停用，不再重試"""
+        monkeypatch.setitem(sys.modules, "google.generativeai", None)
+        cache = GeminiPrefixCache("gemini-test", "你是資安專家。")
+
+        assert cache.get() is None
+        assert cache.disabled
+        assert cache.get() is None
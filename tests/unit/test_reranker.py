@@ -0,0 +1,43 @@
+"""
+交叉編碼器重排序的單元測試
+"""
+
+import pytest
+from core_app.rag.tools.reranker import CrossEncoderReranker
+
+class FakeCrossEncoder:
+    """以查詢字詞出現次數評分的模擬模型，並記錄每次推論的批次"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(pairs))
+        return [float(sum(passage.count(term) for term in query.split())) for query, passage in pairs]
+
+@pytest.fixture
+def reranker():
+    """建立使用模擬模型的重排序器"""
+    reranker = CrossEncoderReranker(model_name="fake", top_n=2)
+    reranker._model = FakeCrossEncoder()
+    return reranker
+
+class TestCrossEncoderReranker:
+    """測試重排序器"""
+
+    def test_rerank_orders_by_score_in_one_batch(self, reranker):
+        """測試單次批次評分後依分數排序並截取 top_n"""
+        passages = ["CREM 概述", "XDR XDR 偵測", "XDR 整合"]
+
+        ranked = reranker.rerank("XDR", passages)
+
+        assert [index for index, _ in ranked] == [1, 2]
+        assert len(reranker._model.calls) == 1
+        assert reranker.get_stats()["pairs_scored"] == 3
+
+    def test_unavailable_model_returns_empty(self):
+        """測試模型無法載入時回傳空列表（由呼叫端保留原順序）"""
+        reranker = CrossEncoderReranker(model_name="fake")
+        reranker._load_failed = True
+
+        assert reranker.rerank("XDR", ["XDR"]) == []
@@ -0,0 +1,64 @@
+"""
+句子感知分塊器的單元測試
+"""
+
+import pytest
+from core_app.rag.processors.sentence_chunker import SentenceChunker, estimate_tokens
+
+class TestSentenceChunker:
+    """測試句子感知分塊器"""
+
+    def test_split_sentences_mixed_punctuation(self):
+        """測試中英文標點斷句"""
+        chunker = SentenceChunker()
+        text = "CREM 提供風險視圖。It predicts risk 3.5 times faster! 為什麼？"
+
+        sentences = [text[start:end] for start, end in chunker.split_sentences(text)]
+
+        assert sentences == ["CREM 提供風險視圖。", "It predicts risk 3.5 times faster!", "為什麼？"]
+
+    def test_chunks_respect_token_budget(self):
+        """測試每個分塊都不超過 token 上限"""
+        chunker = SentenceChunker(max_tokens=20, overlap_tokens=5)
+        text = " ".join(f"Sentence number {i} talks about exposure." for i in range(50))
+
+        chunks = chunker.chunk(text)
+
+        assert len(chunks) > 1
+        assert all(chunk.token_count <= 20 for chunk in chunks)
+        assert all(estimate_tokens(chunk.content) <= 20 for chunk in chunks)
+
+    def test_long_sentence_is_split(self):
+        """測試沒有標點的超長句子會被切開"""
+        chunker = SentenceChunker(max_tokens=10, overlap_tokens=0)
+        text = "風險" * 30
+
+        chunks = chunker.chunk(text)
+
+        assert "".join(chunk.content for chunk in chunks) == text
+        assert all(chunk.token_count <= 10 for chunk in chunks)
+
+    def test_long_run_without_whitespace_is_split(self):
+        """測試沒有空白的超長字串以固定字元視窗切開"""
+        chunker = SentenceChunker(max_tokens=10, overlap_tokens=0)
+        text = "a" * 2000
+
+        chunks = chunker.chunk(text)
+
+        assert "".join(chunk.content for chunk in chunks) == text
+        assert all(chunk.token_count <= 10 for chunk in chunks)
+        assert all(estimate_tokens(chunk.content) <= 10 for chunk in chunks)
+
+    def test_overlap_carries_trailing_sentence(self):
+        """測試重疊內容以完整句子延續到下一個分塊"""
+        chunker = SentenceChunker(max_tokens=12, overlap_tokens=5)
+        text = "第一句話。第二句話。第三句話。"
+
+        chunks = chunker.split_text(text)
+
+        assert chunks == ["第一句話。第二句話。", "第二句話。第三句話。"]
+
+    def test_invalid_overlap(self):
+        """測試重疊設定不合法時拋出錯誤"""
+        with pytest.raises(ValueError):
+            SentenceChunker(max_tokens=10, overlap_tokens=10)
@@ -0,0 +1,87 @@
+"""
+多 worker 伺服器設定的單元測試
+"""
+
+import pytest
+from types import SimpleNamespace
+from core_app import server
+from core_app.main import TrendMicroQASystem
+
+class TestWorkerSizing:
+    """測試 worker 數量與推論執行緒分配"""
+
+    def test_threads_split_cores_between_workers(self, monkeypatch):
+        """測試未設定時依 worker 數平分核心，至少一個執行緒"""
+        monkeypatch.delenv("TORCH_THREADS_PER_WORKER", raising=False)
+
+        assert server.threads_per_worker(4, cpu_count=16) == 4
+        assert server.threads_per_worker(3, cpu_count=2) == 1
+
+    def test_environment_overrides(self, monkeypatch):
+        """測試環境變數覆寫 worker 數與執行緒數"""
+        monkeypatch.setenv("WEB_WORKERS", "3")
+        monkeypatch.setenv("TORCH_THREADS_PER_WORKER", "2")
+
+        assert server.default_workers(cpu_count=16) == 3
+        assert server.threads_per_worker(3, cpu_count=16) == 2
+
+    def test_options_preload_app(self, monkeypatch):
+        """測試 gunicorn 設定在 master 預先載入並註冊 post_fork"""
+        monkeypatch.setenv("WEB_WORKERS", "2")
+        monkeypatch.setenv("API_PORT", "9000")
+
+        options = server.build_options()
+
+        assert options["preload_app"] is True
+        assert options["workers"] == 2
+        assert options["bind"].endswith(":9000")
+        assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+        assert options["post_fork"] is server.post_fork
+
+    def test_hot_answers_are_shared_between_workers(self, monkeypatch):
+        """測試多 worker 時預設使用共用目錄，並為每次部署產生新的部署編號"""
+        monkeypatch.setenv("RAG_HOT_ANSWERS_SHARED_DIR", "")
+        monkeypatch.setenv("RAG_HOT_ANSWERS_RUN_ID", "previous-deploy")
+
+        server.configure_shared_hot_answers()
+
+        assert server.os.environ["RAG_HOT_ANSWERS_SHARED_DIR"] == server.DEFAULT_SHARED_HOT_ANSWERS_DIR
+        assert server.os.environ["RAG_HOT_ANSWERS_RUN_ID"] != "previous-deploy"
+
+    def test_metrics_directory_is_new_for_each_deploy(self, monkeypatch):
+        """測試多 worker 時 /metrics 彙總使用每次部署新建的子目錄"""
+        monkeypatch.setenv("RAG_METRICS_DIR", "")
+
+        server.configure_shared_metrics()
+
+        directory = server.os.environ["RAG_METRICS_DIR"]
+        assert server.os.path.dirname(directory) == server.DEFAULT_METRICS_DIR
+
+class TestPrepareWorker:
+    """測試 fork 後的 worker 初始化"""
+
+    def test_post_fork_sets_threads_and_rebuilds_resources(self, monkeypatch):
+        """測試 post_fork 設定推論執行緒、重建生成執行緒池並重新建立 LLM 連線"""
+        torch = pytest.importorskip("torch")
+        from core_app import app as api
+
+        monkeypatch.delenv("TORCH_THREADS_PER_WORKER", raising=False)
+        monkeypatch.setattr(server.os, "cpu_count", lambda: 4)
+        system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+        system.llm_available = True
+        system._generation_pool = None
+        llm_inits = []
+        monkeypatch.setattr(system, "_initialize_llm", lambda: llm_inits.append(True))
+        monkeypatch.setattr(api, "qa_system", system)
+        original_threads = torch.get_num_threads()
+
+        try:
+            server.post_fork(SimpleNamespace(cfg=SimpleNamespace(workers=2)), SimpleNamespace(pid=123))
+
+            assert torch.get_num_threads() == 2
+            assert system._generation_pool is not None
+            assert llm_inits == [True]
+        finally:
+            torch.set_num_threads(original_threads)
+            if system._generation_pool is not None:
+                system._generation_pool.shutdown()
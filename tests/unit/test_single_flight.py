@@ -0,0 +1,68 @@
+"""
+請求合併（single-flight）的單元測試
+"""
+
+import threading
+import pytest
+from core_app.rag.tools.single_flight import SingleFlight
+
+def run_concurrently(single_flight, key, fn, count):
+    """以多個執行緒同時呼叫 do，回傳各執行緒的 (結果, 是否共用) 或例外"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            outcome = single_flight.do(key, fn)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return outcomes
+
+class TestSingleFlight:
+    """測試請求合併"""
+
+    def test_concurrent_calls_execute_once(self):
+        """測試相同鍵值的並行呼叫只執行一次並共用結果"""
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def generate():
+            calls.append(1)
+            release.wait(timeout=5)
+            return {"answer": "CREM", "citations": []}
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        outcomes = run_concurrently(single_flight, ("crem", "all", 5), generate, 4)
+
+        assert len(calls) == 1
+        assert all(result == {"answer": "CREM", "citations": []} for result, _ in outcomes)
+        assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+        # 共用結果為各自的複本
+        assert len({id(result) for result, _ in outcomes}) == 4
+        assert single_flight.get_stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+
+    def test_error_is_shared_and_key_released(self):
+        """測試例外會傳給所有等待者，且之後的呼叫會重新執行"""
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(timeout=5)
+            raise RuntimeError("quota exceeded")
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        outcomes = run_concurrently(single_flight, "key", failing, 3)
+
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+        assert single_flight.do("key", lambda: "ok") == ("ok", False)
@@ -0,0 +1,227 @@
+"""
+表格提取器的單元測試
+"""
+
+import os
+import time
+import multiprocessing
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+from core_app.rag.processors.table_extractor import AdvancedTableExtractor, TableData, DEFAULT_STRATEGY_TIMEOUTS
+from core_app.rag.processors.page_cache import PageCache
+
+SAMPLE_PDF = Path(__file__).parents[2] / "core_app" / "rag" / "data" / "source" / "sb-crem.pdf"
+
+def make_table(title, method, confidence, page=1, headers=None, rows=None):
+    """建立測試用表格"""
+    return TableData(
+        title=title,
+        headers=headers or ["風險事件", "次數"],
+        rows=rows or [["Risky login", "120"], ["Stale account", "80"]],
+        source_page=page,
+        source_file="report.pdf",
+        table_type="general",
+        confidence=confidence,
+        extractor_method=method,
+        metadata={}
+    )
+
+class StubStrategyExtractor(AdvancedTableExtractor):
+    """以固定行為取代實際提取的策略（需定義在模組層級才能傳入子程序）"""
+
+    def _run_strategy(self, strategy, pdf_path, pages=None):
+        if strategy == "hang":
+            time.sleep(60)
+        elif strategy == "slow":
+            time.sleep(0.5)
+        elif strategy == "crash" and multiprocessing.parent_process() is not None:
+            # 只在子程序中異常結束，讓程序池損毀
+            os._exit(1)
+        return [make_table(f"{strategy}_table", strategy, 90.0)], 0.01
+
+def make_stub_extractor(**timeouts):
+    """建立不檢查提取器、使用程序池的測試提取器"""
+    extractor = StubStrategyExtractor.__new__(StubStrategyExtractor)
+    extractor.parallel = True
+    extractor.max_workers = None
+    extractor.strategy_timeouts = {**DEFAULT_STRATEGY_TIMEOUTS, **timeouts}
+    extractor.strategy_timings = {}
+    return extractor
+
+@pytest.fixture
+def extractor():
+    """建立不檢查提取器的表格提取器"""
+    return AdvancedTableExtractor.__new__(AdvancedTableExtractor)
+
+class TestDeduplication:
+    """測試表格去重"""
+
+    def test_keeps_highest_confidence_variant(self, extractor):
+        """測試重複時保留正規化後信心度最高的版本並記錄合併來源"""
+        tables = [
+            make_table("PDFPlumber_Table_1_1", "pdfplumber", 0.8),
+            make_table("Camelot_Table_1_1", "camelot", 97.5),
+            make_table("PyMuPDF_Table_1_1", "pymupdf", 0.9)
+        ]
+
+        unique = extractor._deduplicate_tables(tables)
+
+        assert [table.title for table in unique] == ["Camelot_Table_1_1"]
+        merged = {item["extractor_method"] for item in unique[0].metadata["merged_from"]}
+        assert merged == {"pdfplumber", "pymupdf"}
+
+    def test_different_pages_or_shapes_are_kept(self, extractor):
+        """測試不同頁面或形狀的表格不會被視為重複"""
+        tables = [
+            make_table("A", "camelot", 95.0, page=1),
+            make_table("B", "camelot", 95.0, page=2),
+            make_table("C", "pdfplumber", 0.8, page=1, rows=[["Risky login", "120"]])
+        ]
+
+        unique = extractor._deduplicate_tables(tables)
+
+        assert [table.title for table in unique] == ["A", "B", "C"]
+
+    def test_dissimilar_content_is_kept(self, extractor):
+        """測試同頁同形狀但內容不同的表格都會保留"""
+        tables = [
+            make_table("A", "camelot", 95.0),
+            make_table("B", "pdfplumber", 0.8, headers=["裝置", "數量"], rows=[["Laptop", "5"], ["Phone", "3"]])
+        ]
+
+        unique = extractor._deduplicate_tables(tables)
+
+        assert len(unique) == 2
+
+class TestParallelStrategies:
+    """測試平行執行提取策略"""
+
+    def test_results_follow_strategy_order(self):
+        """測試結果依傳入順序回傳，與完成順序無關"""
+        extractor = make_stub_extractor()
+
+        results = extractor._run_strategies(["slow", "fast"], "report.pdf")
+
+        assert list(results) == ["slow", "fast"]
+        assert [tables[0].title for tables in results.values()] == ["slow_table", "fast_table"]
+        assert {timing["status"] for timing in extractor.strategy_timings.values()} == {"success"}
+
+    def test_timeout_is_recorded_and_worker_terminated(self):
+        """測試逾時的策略被放棄，其子程序被終止"""
+        extractor = make_stub_extractor(hang=0.5)
+
+        start = time.perf_counter()
+        results = extractor._run_strategies(["hang", "fast"], "report.pdf")
+
+        assert time.perf_counter() - start < 10
+        assert results["hang"] == []
+        assert len(results["fast"]) == 1
+        assert extractor.strategy_timings["hang"]["status"] == "timeout"
+        assert extractor.strategy_timings["fast"]["status"] == "success"
+        deadline = time.time() + 5
+        while multiprocessing.active_children() and time.time() < deadline:
+            time.sleep(0.05)
+        assert not multiprocessing.active_children()
+
+    def test_broken_pool_retries_in_fresh_pools(self):
+        """測試子程序異常結束時，尚未完成的策略在新的程序池重試，不在目前程序中執行"""
+        extractor = make_stub_extractor()
+
+        results = extractor._run_strategies(["crash", "fast"], "report.pdf")
+
+        assert list(results) == ["crash", "fast"]
+        # crash 只在子程序中崩潰，若退回目前程序執行會得到表格
+        assert results["crash"] == []
+        assert extractor.strategy_timings["crash"]["status"] == "failed"
+        assert len(results["fast"]) == 1
+        assert extractor.strategy_timings["fast"]["status"] == "success"
+
+class StubRect:
+    """模擬 PyMuPDF 的矩形"""
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.width = x1 - x0
+        self.height = y1 - y0
+
+class StubPage:
+    """模擬 PyMuPDF 頁面，只提供預篩用到的介面"""
+
+    def __init__(self, items, text):
+        self.rect = StubRect(0, 0, 612, 792)
+        self._items = items
+        self._text = text
+
+    def get_drawings(self):
+        return [{"items": self._items}]
+
+    def get_text(self):
+        return self._text
+
+def line(x0, y0, x1, y1):
+    """建立直線繪圖項目"""
+    return ("l", SimpleNamespace(x=x0, y=y0), SimpleNamespace(x=x1, y=y1))
+
+NARRATIVE_TEXT = "Security teams need a complete picture to effectively control risk across the attack surface. " * 5
+
+class TestPrescreen:
+    """測試頁面預篩"""
+
+    def test_narrative_page_with_decorative_box_is_skipped(self, extractor):
+        """測試只有裝飾框與短線圖示的敘述頁面不視為表格頁"""
+        items = [
+            ("re", StubRect(36, 72, 576, 200)),
+            ("re", StubRect(0, 0, 612, 792)),  # 背景
+            line(300, 300, 310, 300), line(300, 305, 310, 305), line(300, 310, 310, 310),
+            line(36, 400, 576, 400)
+        ]
+
+        assert not extractor._is_table_candidate_page(StubPage(items, NARRATIVE_TEXT))
+
+    def test_striped_table_page_is_candidate(self, extractor):
+        """測試由多列儲存格矩形組成的表格頁視為候選頁"""
+        items = [("re", StubRect(x0, y, x1, y + 30)) for y in range(100, 400, 30)
+                 for x0, x1 in ((36, 250), (250, 576))]
+
+        assert extractor._ruling_positions(StubPage(items, "")) == (10 + 1, 3)
+        assert extractor._is_table_candidate_page(StubPage(items, NARRATIVE_TEXT))
+
+@pytest.mark.skipif(not SAMPLE_PDF.exists(), reason="缺少範例 PDF")
+class TestPageCacheWrites:
+    """測試表格提取結果寫入頁面快取的條件"""
+
+    def make_extractor(self, tmp_path, failing=None):
+        """建立循序執行、以固定結果取代提取策略的提取器"""
+        extractor = AdvancedTableExtractor.__new__(AdvancedTableExtractor)
+        extractor.parallel = False
+        extractor.strategy_timeouts = dict(DEFAULT_STRATEGY_TIMEOUTS)
+        extractor.prescreen = False
+        extractor.page_cache = PageCache(tmp_path)
+        extractor.available_extractors = {"camelot": False, "pdfplumber": True, "pymupdf": True, "tabula": False}
+
+        def run_strategy(strategy, pdf_path, pages=None):
+            if strategy == failing:
+                raise RuntimeError("提取失敗")
+            return [make_table(f"{strategy}_{i}", strategy, 90.0, page=1) for i in range(2)], 0.01
+
+        extractor._run_strategy = run_strategy
+        return extractor
+
+    def test_successful_run_is_cached_per_extractor_set(self, tmp_path):
+        """測試所有策略成功時寫入以可用提取器區分的命名空間"""
+        extractor = self.make_extractor(tmp_path)
+
+        extractor.extract_tables(str(SAMPLE_PDF))
+
+        assert extractor._cache_namespace() == "tables_pdfplumber-pymupdf"
+        assert len(list((tmp_path / "tables_pdfplumber-pymupdf").rglob("*.json"))) == 3
+
+    def test_failed_strategy_skips_cache(self, tmp_path):
+        """測試有策略失敗時不寫入快取，下次會重新提取"""
+        extractor = self.make_extractor(tmp_path, failing="pymupdf")
+
+        extractor.extract_tables(str(SAMPLE_PDF))
+
+        assert extractor.strategy_timings["pymupdf"]["status"] == "failed"
+        assert not list(tmp_path.rglob("*.json"))
@@ -0,0 +1,78 @@
+"""
+結構化表格查詢引擎的單元測試
+"""
+
+import json
+import pytest
+from core_app.rag.tools.table_query_engine import StructuredTableQueryEngine
+
+@pytest.fixture
+def engine(tmp_path):
+    """建立含跨頁排行表格與數值表格的查詢引擎"""
+    tables = [
+        {
+            "title": "Camelot_Table_13_1", "headers": ["Overall Top 10 Risky Events", ""],
+            "rows": [[str(i), f"Event {i}"] for i in range(1, 6)],
+            "source_page": 13, "source_file": "report.pdf", "table_type": "general",
+            "confidence": 100.0, "extractor_method": "camelot", "metadata": {}
+        },
+        {
+            "title": "Camelot_Table_14_2", "headers": ["Overall Top 10 Risky Events", ""],
+            "rows": [[str(i), f"Event {i}"] for i in range(6, 11)],
+            "source_page": 14, "source_file": "report.pdf", "table_type": "general",
+            "confidence": 100.0, "extractor_method": "camelot", "metadata": {}
+        },
+        {
+            "title": "Camelot_Table_17_6", "headers": ["Overall Top Vision One Misconfigurations Risk Score", "", ""],
+            "rows": [["1", "Web Reputation", "69"], ["2", "Device Control", "65"], ["3", "Firewall", "71"]],
+            "source_page": 17, "source_file": "report.pdf", "table_type": "general",
+            "confidence": 100.0, "extractor_method": "camelot", "metadata": {}
+        }
+    ]
+    (tmp_path / "extracted_tables.json").write_text(json.dumps({"tables": tables}), encoding="utf-8")
+    return StructuredTableQueryEngine(str(tmp_path))
+
+class TestStructuredTableQueryEngine:
+    """測試結構化表格查詢"""
+
+    def test_top_n_merges_continuation_pages(self, engine):
+        """測試前 N 名查詢會合併跨頁的同一表格"""
+        result = engine.answer("前10大風險事件有哪些？")
+
+        assert result is not None
+        assert result.table.source_pages == [13, 14]
+        assert [row["項目"] for row in result.rows] == [f"Event {i}" for i in range(1, 11)]
+
+    def test_superlative_sorts_by_value(self, engine):
+        """測試最高級問題依數值欄排序並取第一名"""
+        result = engine.answer("哪個錯誤配置的風險分數最高？")
+
+        assert [row["項目"] for row in result.rows] == ["Firewall"]
+
+    def test_filter_and_aggregate(self, engine):
+        """測試數值篩選與彙總"""
+        result = engine.answer("風險分數超過 66 的錯誤配置平均是多少")
+
+        assert {row["項目"] for row in result.rows} == {"Web Reputation", "Firewall"}
+        assert "70" in result.answer
+
+    def test_non_structured_question_returns_none(self, engine):
+        """測試沒有表格查詢意圖或找不到相符表格時回傳 None"""
+        assert engine.answer("什麼是CREM？") is None
+        assert engine.answer("前5大漏洞") is None
+
+    def test_unmatched_specific_subject_returns_none(self, engine):
+        """測試問題限定的主題詞不在標題中時不以其他表格回答"""
+        assert engine.answer("歐洲的平均風險分數") is None
+
+    def test_english_question_words_are_ignored(self, engine):
+        """測試英文問句的虛詞不影響表格挑選"""
+        result = engine.answer("What are the top 5 misconfigurations?")
+
+        assert result is not None
+        assert result.table.source_pages == [17]
+
+    def test_untranslated_chinese_subject_returns_none(self, engine):
+        """測試沒有對應英文詞的中文主題（中小企業、月份）不被略過，交由 RAG 回答"""
+        assert engine.answer("中小企業平均風險多少") is None
+        assert engine.answer("各月份平均風險") is None
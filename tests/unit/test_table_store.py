@@ -0,0 +1,97 @@
+"""
+表格儲存庫的單元測試
+"""
+
+import os
+import json
+import pytest
+from core_app.rag.processors.table_store import (
+    TableStore, read_manifest, read_table_count, table_texts_signature, MANIFEST_NAME
+)
+
+@pytest.fixture
+def table_texts():
+    """建立兩個表格（其中一個拆成兩段）的表格文本"""
+    return [
+        {"table_id": "table_1_A", "content": "表格標題: A", "metadata": {"parent_table_id": "table_1_A"}},
+        {"table_id": "table_2_B_part1", "content": "表格標題: B", "metadata": {"parent_table_id": "table_2_B"}},
+        {"table_id": "table_2_B_part2", "content": "表格標題: B (續)", "metadata": {"parent_table_id": "table_2_B"}}
+    ]
+
+class TestTableStore:
+    """測試表格儲存庫"""
+
+    def test_table_texts_round_trip(self, tmp_path, table_texts):
+        """測試寫入後可逐筆讀回並更新 manifest"""
+        store = TableStore(tmp_path / "tables.db")
+
+        assert store.replace_table_texts(table_texts) == 3
+
+        assert list(store.iter_table_texts(batch_size=2)) == table_texts
+        assert store.get_table_text("table_2_B_part2")["content"] == "表格標題: B (續)"
+        manifest = read_manifest(tmp_path)
+        assert manifest["total_tables"] == 2
+        assert manifest["total_documents"] == 3
+
+    def test_replace_overwrites_previous_rows(self, tmp_path, table_texts):
+        """測試重新寫入會取代舊資料"""
+        store = TableStore(tmp_path / "tables.db")
+        store.replace_table_texts(table_texts)
+        store.replace_table_texts(table_texts[:1])
+
+        assert store.count_table_texts() == 1
+        assert read_table_count(tmp_path) == 1
+
+    def test_extracted_tables_round_trip(self, tmp_path):
+        """測試提取表格的寫入與讀取"""
+        table = {
+            "title": "Camelot_Table_3_1", "headers": ["排名", "事件"], "rows": [["1", "Risky login"]],
+            "source_page": 3, "source_file": "report.pdf", "table_type": "statistical",
+            "confidence": 97.5, "extractor_method": "camelot", "metadata": {"flavor": "lattice"}
+        }
+        store = TableStore(tmp_path / "tables.db")
+
+        store.replace_extracted_tables([table])
+
+        assert list(store.iter_extracted_tables()) == [table]
+        assert read_manifest(tmp_path)["total_extracted_tables"] == 1
+
+class TestReadTableCount:
+    """測試表格數量讀取"""
+
+    def test_falls_back_to_legacy_json_without_writing(self, tmp_path):
+        """測試沒有 manifest 時讀取舊版 JSON，且讀取路徑不寫入 manifest"""
+        legacy = {"total_tables": 7, "table_texts": [{}] * 9}
+        (tmp_path / "table_texts.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+        assert read_table_count(tmp_path) == 7
+        assert not (tmp_path / MANIFEST_NAME).exists()
+
+    def test_stale_manifest_is_ignored(self, tmp_path, table_texts):
+        """測試表格文本 JSON 在 manifest 之後被改寫時改讀 JSON"""
+        json_path = tmp_path / "table_texts.json"
+        json_path.write_text(json.dumps({"total_tables": 2}), encoding="utf-8")
+        TableStore(tmp_path / "tables.db").replace_table_texts(
+            table_texts, manifest_fields=table_texts_signature(json_path)
+        )
+        assert read_table_count(tmp_path) == 2
+
+        json_path.write_text(json.dumps({"total_tables": 5, "table_texts": []}), encoding="utf-8")
+
+        assert read_table_count(tmp_path) == 5
+
+    def test_manifest_survives_checkout_mtime_change(self, tmp_path, table_texts):
+        """測試內容未變、只有修改時間改變（例如 git checkout）時仍使用 manifest"""
+        json_path = tmp_path / "table_texts.json"
+        json_path.write_text(json.dumps({"total_tables": 99}), encoding="utf-8")
+        TableStore(tmp_path / "tables.db").replace_table_texts(
+            table_texts, manifest_fields=table_texts_signature(json_path)
+        )
+
+        os.utime(json_path, ns=(0, 0))
+
+        assert read_table_count(tmp_path) == 2
+
+    def test_missing_data(self, tmp_path):
+        """測試沒有任何表格資料時回傳 0"""
+        assert read_table_count(tmp_path) == 0
@@ -0,0 +1,103 @@
+"""
+表格文本轉換器的單元測試
+"""
+
+import json
+import pytest
+from core_app.rag.processors.table_text_converter import TableTextConverter
+from core_app.rag.processors.table_store import TableStore, read_table_count
+from core_app.rag.processors.token_budget import ChunkBudgetPlanner
+
+@pytest.fixture
+def large_table():
+    """建立多列的測試表格"""
+    return {
+        "title": "Top_Risk_Events",
+        "headers": ["排名", "風險事件", "次數"],
+        "rows": [[str(i), f"risky event {i}", str(1000 - i)] for i in range(1, 26)],
+        "table_type": "statistical",
+        "source_page": 3,
+        "source_file": "report.pdf",
+        "confidence": 92.5,
+        "extractor_method": "camelot"
+    }
+
+class TestRowChunking:
+    """測試列群組分塊模式"""
+
+    def test_summary_and_row_groups(self, large_table):
+        """測試輸出一份摘要與固定列數的列群組"""
+        converter = TableTextConverter(chunk_mode="rows", rows_per_chunk=10)
+
+        chunks = converter.convert_table_to_row_chunks(large_table, "table_1")
+
+        kinds = [metadata["chunk_kind"] for _, _, metadata in chunks]
+        assert kinds == ["table_summary", "table_rows", "table_rows", "table_rows"]
+        ranges = [(m["row_start"], m["row_end"]) for _, _, m in chunks[1:]]
+        assert ranges == [(1, 10), (11, 20), (21, 25)]
+        assert "資料列數: 25" in chunks[0][1]
+        # 每個列群組都帶有欄位行，可獨立理解
+        assert all("表格欄位: 排名, 風險事件, 次數" in text for _, text, _ in chunks[1:])
+
+    def test_row_groups_fit_token_budget(self, large_table):
+        """測試依 token 預算分組時每組都不超出預算"""
+        planner = ChunkBudgetPlanner(use_tokenizer=False, max_seq_length=64)
+        converter = TableTextConverter(budget_planner=planner, chunk_mode="rows")
+
+        chunks = converter.convert_table_to_row_chunks(large_table, "table_1")
+
+        assert len(chunks) > 2
+        assert all(planner.fits(text) for _, text, _ in chunks[1:])
+
+    def test_convert_json_in_rows_mode(self, large_table, tmp_path):
+        """測試 JSON 轉換輸出列群組元資料並以來源表格計數"""
+        json_path = tmp_path / "extracted_tables.json"
+        json_path.write_text(json.dumps({"tables": [large_table]}), encoding="utf-8")
+        output_path = tmp_path / "table_texts.json"
+
+        converter = TableTextConverter(chunk_mode="rows", rows_per_chunk=10)
+        converted = converter.convert_tables_json_to_text(str(json_path), str(output_path))
+
+        assert len(converted) == 4
+        assert {table.metadata["parent_table_id"] for table in converted} == {"table_1_Top_Risk_Events"}
+        saved = json.loads(output_path.read_text(encoding="utf-8"))
+        assert saved["total_tables"] == 1
+        assert saved["total_documents"] == 4
+        # 原始表格只保留在第一個區段
+        carries_table = ["original_table_data" in item["metadata"] for item in saved["table_texts"]]
+        assert carries_table == [True, False, False, False]
+
+    def test_convert_from_store(self, large_table, tmp_path):
+        """測試從表格儲存庫轉換並寫入精簡 JSON 與 manifest"""
+        TableStore(tmp_path / "tables.db").replace_extracted_tables([large_table])
+        output_path = tmp_path / "table_texts.json"
+
+        converter = TableTextConverter(chunk_mode="rows", rows_per_chunk=10)
+        converted = converter.convert_tables_json_to_text(str(tmp_path / "tables.db"), str(output_path))
+
+        assert len(converted) == 4
+        assert converter.get_conversion_stats()["total_tables"] == 1
+        assert "\n" not in output_path.read_text(encoding="utf-8")
+        assert read_table_count(tmp_path) == 1
+
+    def test_invalid_chunk_mode(self):
+        """測試不支援的分塊模式"""
+        with pytest.raises(ValueError):
+            TableTextConverter(chunk_mode="cells")
+
+    def test_summary_fits_token_budget(self):
+        """測試摘要超出預算時移除關鍵字，讓摘要仍可完整嵌入"""
+        table = {
+            "title": "Keywords",
+            "headers": ["欄位A", "欄位B"],
+            "rows": [[f"long keyword value {i}", f"another keyword {i}"] for i in range(5)]
+        }
+        planner = ChunkBudgetPlanner(use_tokenizer=False, max_seq_length=80)
+        converter = TableTextConverter(budget_planner=planner, chunk_mode="rows")
+
+        summary = converter.convert_table_to_row_chunks(table, "table_1")[0][1]
+        unbounded = TableTextConverter(chunk_mode="rows", rows_per_chunk=10).convert_table_to_row_chunks(table, "table_1")[0][1]
+
+        assert not planner.fits(unbounded)
+        assert planner.fits(summary)
+        assert "資料列數: 5" in summary
@@ -0,0 +1,78 @@
+"""
+分塊預算規劃器的單元測試
+"""
+
+import pytest
+from core_app.rag.processors.token_budget import ChunkBudgetPlanner
+from core_app.rag.processors.sentence_chunker import estimate_tokens
+from core_app.rag.processors.table_text_converter import TableTextConverter
+
+@pytest.fixture
+def planner():
+    """建立使用估算方式計算 token 的小預算規劃器"""
+    return ChunkBudgetPlanner(use_tokenizer=False, max_seq_length=64)
+
+class TestChunkBudgetPlanner:
+    """測試分塊預算規劃器"""
+
+    def test_count_tokens_falls_back_to_estimate(self, planner):
+        """測試未載入 tokenizer 時以估算方式計算 token"""
+        text = "CREM 風險評估 Cyber Risk Index"
+
+        assert planner.tokenizer is None
+        assert planner.count_tokens(text) == estimate_tokens(text)
+        assert planner.count_tokens("") == 0
+        assert planner.budget == 62
+
+    def test_pack_lines_fits_budget_and_carries_header(self, planner):
+        """測試打包後每個區塊都符合預算，後續區塊帶有延續標頭"""
+        lines = [f"第{i}列: risky event {i} 次數 {1000 - i}" for i in range(30)]
+
+        parts = planner.pack_lines(lines, first_header=["表格: 風險事件", "表格欄位: 排名, 次數"],
+                                   continuation_header=["表格: 風險事件 (續)"])
+
+        assert len(parts) > 1
+        assert all(planner.fits(part) for part in parts)
+        assert parts[0].startswith("表格: 風險事件\n表格欄位")
+        assert all(part.startswith("表格: 風險事件 (續)\n") for part in parts[1:])
+        # 每一列都完整出現在某個區塊中
+        assert all(any(line in part for part in parts) for line in lines)
+
+    def test_plan_reuses_known_token_counts(self, planner):
+        """測試已知的 token 數直接沿用，缺少時才重新計算"""
+        report = planner.plan(["短文本", "x" * 1000], [100, None])
+
+        assert report.total_texts == 2
+        assert report.over_budget_texts == 2
+        assert report.truncated_tokens == (100 - 62) + (estimate_tokens("x" * 1000) - 62)
+
+class TestSplitTableText:
+    """測試表格文本依預算拆分"""
+
+    @pytest.fixture
+    def planner(self):
+        """表格標頭約 60 tokens，需較大的預算才能容納內容列"""
+        return ChunkBudgetPlanner(use_tokenizer=False, max_seq_length=128)
+
+    def test_large_table_is_split_within_budget(self, planner):
+        """測試大型表格被拆成多段且每段都符合預算"""
+        table = {
+            "title": "Top_Risk_Events",
+            "headers": ["排名", "風險事件", "次數"],
+            "rows": [[str(i), f"risky event {i}", str(1000 - i)] for i in range(1, 26)],
+            "table_type": "statistical"
+        }
+        converter = TableTextConverter(budget_planner=planner)
+
+        parts = converter.split_table_text(table)
+
+        assert len(parts) > 1
+        assert all(planner.fits(part) for part in parts)
+        assert all("Top_Risk_Events" in part for part in parts)
+
+    def test_small_table_is_not_split(self, planner):
+        """測試預算內的表格維持單一文本"""
+        table = {"title": "CRI", "headers": ["項目", "值"], "rows": [["CRI", "42"]]}
+        converter = TableTextConverter(budget_planner=planner)
+
+        assert converter.split_table_text(table) == [converter.convert_table_to_text(table)]
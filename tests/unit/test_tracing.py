@@ -0,0 +1,191 @@
+"""
+OpenTelemetry 追蹤的單元測試
+"""
+
+import contextvars
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from core_app.main import TrendMicroQASystem, LLMGateway
+from core_app.rag.tools import tracing
+from core_app.rag.tools.answer_cache import AnswerCache
+from core_app.rag.tools.context_builder import ContextBuilder
+from core_app.rag.tools.metrics import MetricsRegistry
+from core_app.rag.tools.prompt_builder import CompiledPromptTemplate
+from core_app.rag.tools.single_flight import SingleFlight
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+@dataclass
+class RecordedSpan:
+    """記錄名稱、屬性與父 span 的模擬 span"""
+    name: str
+    parent: Optional["RecordedSpan"]
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exception, **kwargs):
+        self.attributes["exception"] = repr(exception)
+
+    def is_recording(self):
+        return True
+
+class RecordingTracer:
+    """以 contextvars 追蹤目前 span 的模擬 tracer（與 OpenTelemetry 相同的內容傳遞方式）"""
+
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name):
+        span = RecordedSpan(name, _current_span.get())
+        self.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def find(self, name):
+        return next(span for span in self.spans if span.name == name)
+
+@pytest.fixture
+def tracer(monkeypatch):
+    """以模擬 tracer 取代 OpenTelemetry"""
+    recording = RecordingTracer()
+    monkeypatch.setattr(tracing, "_get_tracer", lambda: recording)
+    return recording
+
+@dataclass
+class FakeResult:
+    """模擬 QueryResult"""
+    content: str
+    content_type: str = "text"
+    source: str = "report.pdf"
+    confidence_score: float = 0.9
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    full_content: Optional[str] = None
+
+class FakeRagEngine:
+    """在 retrieval.query span 內回傳一個檢索結果的模擬查詢引擎"""
+
+    def query(self, question, k, filter_type):
+        with tracing.span("retrieval.query", rag_k=k):
+            return [FakeResult("CREM 提供攻擊面探索與風險評估。")]
+
+class EchoLLM:
+    """立即回答的模擬 LLM"""
+
+    def invoke(self, prompt, **kwargs):
+        return "CREM 是趨勢科技的網路風險暴露管理平台"
+
+@pytest.fixture
+def qa_system():
+    """建立不載入向量庫與 Gemini 的問答系統"""
+    system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+    system.llm = EchoLLM()
+    system.llm_available = True
+    system.llm_backend = "gemini"
+    system.llm_model_name = "gemini-2.0-flash"
+    system.llm_gateway = LLMGateway(system.llm, base_delay=0, max_delay=0)
+    system.rag_engine = FakeRagEngine()
+    system.table_engine = None
+    system.context_builder = ContextBuilder(max_tokens=500)
+    system.prompt_template = CompiledPromptTemplate("你是資安專家。\n", "{context}\n{question}\n{result_count}")
+    system.prompt_prefix_cache = None
+    system.vector_count = 1
+    system.single_flight = SingleFlight()
+    system.answer_cache = AnswerCache()
+    system.default_latency_budget = None
+    system._generation_pool = ThreadPoolExecutor(max_workers=2)
+    system._speculative_lock = threading.Lock()
+    system.speculative_stats = {"deadline_fallbacks": 0, "background_upgrades": 0, "background_failures": 0}
+    system.metrics = MetricsRegistry()
+    yield system
+    system._generation_pool.shutdown(wait=True)
+
+class TestSpanHelpers:
+    """測試 span 輔助函數"""
+
+    def test_no_op_span_without_opentelemetry(self, monkeypatch):
+        """測試未安裝 OpenTelemetry 時 span 不做任何事"""
+        monkeypatch.setattr(tracing, "_get_tracer", lambda: None)
+
+        with tracing.span("retrieval.query", rag_k=5) as current:
+            current.set_attribute("rag.result_count", 3)
+            tracing.set_attributes(current, rag_result_count=3)
+
+        assert current.is_recording() is False
+
+    def test_attribute_names_and_none_values(self, tracer):
+        """測試屬性名稱第一個底線轉為點號，None 值略過"""
+        with tracing.span("api.ask", rag_filter_type="table", rag_latency_budget=None):
+            pass
+
+        assert tracer.find("api.ask").attributes == {"rag.filter_type": "table"}
+
+    def test_bind_context_carries_span_to_pool_thread(self, tracer):
+        """測試提交到執行緒池的函數仍接在目前 span 之下"""
+        def child():
+            with tracing.span("llm.generate") as current:
+                return current
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with tracing.span("qa.ask_question") as parent:
+                bound = pool.submit(tracing.bind_context(child)).result()
+                unbound = pool.submit(child).result()
+
+        assert bound.parent is parent
+        assert unbound.parent is None
+
+    def test_exporter_disabled_by_default(self, monkeypatch):
+        """測試未設定匯出方式時不啟用匯出"""
+        monkeypatch.delenv("RAG_TRACING_EXPORTER", raising=False)
+
+        assert tracing.configure_tracing() is False
+        assert tracing.configure_tracing("unknown") is False
+
+class TestQuestionSpans:
+    """測試問答流程的 span 結構與屬性"""
+
+    def test_question_llm_and_retrieval_spans(self, qa_system, tracer):
+        """測試 LLM 在執行緒池生成時 span 仍接在問答 span 之下，並記錄 k、類型、結果數與 prompt token"""
+        response = qa_system.ask_question("CREM 是什麼？", filter_type="text", k=3, latency_budget=5)
+
+        assert response["generation_method"] == "llm_generated"
+        question_span = tracer.find("qa.ask_question")
+        retrieval_span = tracer.find("retrieval.query")
+        llm_span = tracer.find("llm.generate")
+        assert retrieval_span.parent is question_span
+        assert llm_span.parent is question_span
+        assert question_span.attributes["rag.k"] == 3
+        assert question_span.attributes["rag.filter_type"] == "text"
+        assert question_span.attributes["rag.result_count"] == 1
+        assert question_span.attributes["rag.cache_hit"] is False
+        assert llm_span.attributes["llm.model"] == "gemini-2.0-flash"
+        assert llm_span.attributes["llm.prompt_tokens"] == response["prompt_tokens"]
+        assert llm_span.attributes["llm.output_tokens"] > 0
+
+    def test_api_span_is_parent_of_question_span(self, qa_system, tracer, monkeypatch):
+        """測試 /ask 在執行緒池執行問答時，問答 span 接在 API span 之下"""
+        from fastapi.testclient import TestClient
+        from core_app import app as api
+
+        monkeypatch.setattr(api, "qa_system", qa_system)
+        monkeypatch.setattr(qa_system, "get_system_stats", lambda: {"llm_available": True})
+        client = TestClient(api.app)
+
+        response = client.post("/ask", json={"question": "CREM 是什麼？", "k": 3})
+
+        assert response.status_code == 200
+        api_span = tracer.find("api.ask")
+        assert tracer.find("qa.ask_question").parent is api_span
+        assert api_span.attributes["rag.status"] == "success"
@@ -0,0 +1,159 @@
+"""
+統一查詢引擎的單元測試
+"""
+
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from langchain.schema import Document
+from core_app.rag.tools import unified_query_engine
+from core_app.rag.tools.unified_query_engine import UnifiedQueryEngine
+
+def row_group(parent_id, start, end):
+    """建立列群組文檔"""
+    rows = "\n".join(f"  排名: {i}, 事件: Event {i}" for i in range(start, end + 1))
+    return Document(
+        page_content=f"表格標題: Top Events（第{start}-{end}列，共30列）\n表格欄位: 排名, 事件\n{rows}",
+        metadata={
+            "table_id": f"{parent_id}_rows{start}-{end}",
+            "parent_table_id": parent_id,
+            "chunk_kind": "table_rows",
+            "row_start": start,
+            "row_end": end,
+            "total_rows": 30,
+            "content_type": "structured_table"
+        }
+    )
+
+@pytest.fixture
+def engine():
+    """建立不載入嵌入模型的查詢引擎（只測試候選處理邏輯）"""
+    return UnifiedQueryEngine.__new__(UnifiedQueryEngine)
+
+class TestMergeTableRowGroups:
+    """測試相鄰列群組合併"""
+
+    def test_adjacent_groups_are_merged_at_best_rank(self, engine):
+        """測試相鄰列群組合併為一筆，位於最相關的位置並取最小距離"""
+        text = Document(page_content="CREM 概述", metadata={})
+        candidates = [
+            (row_group("table_1", 11, 20), 0.2, "table"),
+            (text, 0.3, "text"),
+            (row_group("table_1", 1, 10), 0.4, "table"),
+            (row_group("table_1", 25, 30), 0.5, "table")
+        ]
+
+        merged = engine._merge_table_row_groups(candidates)
+
+        assert len(merged) == 3
+        doc, distance, content_type = merged[0]
+        assert (doc.metadata["row_start"], doc.metadata["row_end"]) == (1, 20)
+        assert distance == 0.2 and content_type == "table"
+        assert doc.metadata["merged_chunks"] == ["table_1_rows1-10", "table_1_rows11-20"]
+        # 合併後的文本只保留一次標頭且列依序排列
+        assert doc.page_content.count("表格欄位") == 1
+        assert doc.page_content.index("排名: 10,") < doc.page_content.index("排名: 11,")
+        # 不相鄰的列群組維持獨立
+        assert merged[1][0] is text
+        assert merged[2][0].metadata["row_start"] == 25
+
+    def test_groups_from_different_tables_are_kept(self, engine):
+        """測試不同表格的列群組不會合併"""
+        candidates = [
+            (row_group("table_1", 1, 10), 0.2, "table"),
+            (row_group("table_2", 11, 20), 0.3, "table")
+        ]
+
+        assert engine._merge_table_row_groups(candidates) == candidates
+
+    def test_combine_skips_covered_rows(self, engine):
+        """測試合併時略過已涵蓋的列"""
+        combined = engine._combine_row_group_docs([row_group("table_1", 1, 10), row_group("table_1", 5, 8)])
+
+        assert combined.metadata["row_end"] == 10
+        assert combined.page_content.count("排名: 5,") == 1
+
+class StubIndex:
+    """模擬 FAISS IndexFlatL2（以 L2 平方距離排序）"""
+
+    def __init__(self, vectors):
+        self.vectors = np.array(vectors, dtype=np.float32)
+        self.ntotal = len(vectors)
+
+    def search(self, query_vector, k):
+        distances = np.sum((self.vectors - query_vector[0]) ** 2, axis=1)
+        order = np.argsort(distances)[:k]
+        return distances[order][None, :], order[None, :]
+
+    def reconstruct(self, position):
+        return self.vectors[position]
+
+class StubVectorStore:
+    """模擬 langchain FAISS 向量庫，只提供查詢引擎用到的介面"""
+
+    def __init__(self, docs, vectors):
+        self.index = StubIndex(vectors)
+        self.index_to_docstore_id = {i: f"doc{i}" for i in range(len(docs))}
+        self.docstore = SimpleNamespace(search=lambda doc_id: docs[int(doc_id[3:])])
+
+class StubEmbeddings:
+    """查詢向量固定在原點的模擬嵌入模型"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def embed_query(self, text):
+        return [0.0, 0.0]
+
+@pytest.fixture
+def hybrid_engine(monkeypatch):
+    """建立使用模擬向量庫的混合檢索引擎"""
+    monkeypatch.setattr(unified_query_engine, "_load_embeddings", StubEmbeddings)
+    docs = [
+        Document(page_content="CREM 提供風險總覽", metadata={"source": "a.txt"}),
+        Document(page_content="攻擊面管理概述", metadata={"source": "b.txt"}),
+        Document(page_content="雲端安全建議", metadata={"source": "c.txt"}),
+        Document(page_content="表格標題: XDR 偵測模型命中次數",
+                 metadata={"source": "report.pdf", "content_type": "structured_table", "table_id": "t1"}),
+        Document(page_content="表格標題: 前10大風險事件",
+                 metadata={"source": "report.pdf", "content_type": "structured_table", "table_id": "t2"}),
+        Document(page_content="CVE-2024-21357 修補說明", metadata={"source": "d.txt"})
+    ]
+    # 向量距離依文檔順序遞增
+    vectors = [[0.1 * (i + 1), 0.0] for i in range(len(docs))]
+    engine = UnifiedQueryEngine("unused", hybrid=True)
+    engine.vector_db = StubVectorStore(docs, vectors)
+    engine._build_lexical_index()
+    return engine
+
+class TestHybridQuery:
+    """測試混合檢索在 query 中的串接"""
+
+    def test_lexical_hit_outside_vector_top_k(self, hybrid_engine):
+        """測試只有 BM25 命中的文檔會經由 RRF 進入結果，並補算向量距離"""
+        results = hybrid_engine.query("CVE-2024-21357", k=2)
+
+        sources = [result.source for result in results]
+        assert "d.txt" in sources
+        assert hybrid_engine.get_query_stats()["lexical_only_hits"] == 1
+        lexical = results[sources.index("d.txt")]
+        assert lexical.confidence_score == pytest.approx(1.0 - 0.36)
+
+    def test_stage_latencies_are_recorded(self, hybrid_engine):
+        """測試查詢記錄各階段延遲並在統計中回報"""
+        hybrid_engine.query("CREM", k=2)
+        hybrid_engine.query("雲端安全", k=2)
+
+        stats = hybrid_engine.get_query_stats()
+
+        assert stats["total_queries"] == 2
+        for stage in ("embed", "search", "filter", "format", "retrieval"):
+            assert stats["latency"][stage]["count"] == 2
+        assert "rerank" not in stats["latency"]
+
+    def test_filtered_query_over_fetches_vector_side(self, hybrid_engine):
+        """測試依類型篩選時向量側多取候選，排名較後的表格仍能回傳"""
+        results = hybrid_engine.query("沒有詞彙命中的問題", k=2, filter_type="table")
+
+        assert [result.content_type for result in results] == ["table", "table"]
+        assert [result.metadata["table_id"] for result in results] == ["t1", "t2"]
@@ -0,0 +1,296 @@
+"""
+啟動預熱（檢索路徑與熱門問題）的單元測試
+"""
+
+import math
+import pytest
+from pathlib import Path
+from core_app import main
+from core_app.main import TrendMicroQASystem
+from core_app.rag.tools.answer_cache import AnswerCache
+from core_app.warmup import HotAnswerRefresher, SharedHotAnswerStore, StartupWarmer
+
+class StubEngine:
+    """記錄建立參數與載入版本的模擬查詢引擎"""
+
+    def __init__(self, vector_dir, hybrid=None, reranker=None, embeddings=None, metrics=None, version="v1"):
+        self.vector_dir = Path(vector_dir)
+        self.hybrid = hybrid
+        self.reranker = reranker
+        self.embeddings = embeddings
+        self.metrics = metrics if metrics is not None else object()
+        self.loaded_version = version
+
+    def load_vector_db(self):
+        self.loaded_version = "v2"
+        return True
+
+    def get_query_stats(self):
+        return {"vector_count": 42}
+
+@pytest.fixture
+def qa_system(monkeypatch):
+    """建立只含答案快取與模擬引擎的問答系統"""
+    system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+    system.answer_cache = AnswerCache(ttl_seconds=1)
+    system.rag_engine = StubEngine("index", hybrid=True, embeddings="loaded-model")
+    system.table_count = 2
+    monkeypatch.setattr(system, "_get_table_count", lambda: 2)
+    return system
+
+class TestWarmHotAnswers:
+    """測試熱門問題預先計算"""
+
+    def test_answers_are_pinned_and_fallbacks_skipped(self, qa_system, monkeypatch):
+        """測試成功的答案以不過期的方式寫入快取，LLM 降級的答案不寫入"""
+        methods = {"CREM 是什麼？": "llm_generated", "CRI 是什麼？": "fallback_structured"}
+        calls = []
+
+        def answer(question, filter_type, k, use_llm=True):
+            calls.append((question, filter_type, k, use_llm))
+            return {"status": "success", "generation_method": methods[question], "answer": question}
+        monkeypatch.setattr(qa_system, "_answer_question", answer)
+
+        warmed = qa_system.warm_hot_answers(list(methods), k=3, include_llm=False)
+
+        assert warmed == 1
+        assert calls[0] == ("CREM 是什麼？", "all", 3, False)
+        key = TrendMicroQASystem._request_key("CREM 是什麼？", "all", 3)
+        assert qa_system.answer_cache._entries[key][0] == math.inf
+        assert qa_system.answer_cache.get(TrendMicroQASystem._request_key("CRI 是什麼？", "all", 3)) is None
+
+class TestReloadIfVectorStoreChanged:
+    """測試向量資料庫版本變更時重新載入"""
+
+    def test_unchanged_version_keeps_engine(self, qa_system, monkeypatch):
+        """測試版本未變更時不重新載入"""
+        monkeypatch.setattr(main, "vector_store_version", lambda vector_dir: "v1")
+        engine = qa_system.rag_engine
+
+        assert qa_system.reload_if_vector_store_changed() is False
+        assert qa_system.rag_engine is engine
+
+    def test_changed_version_swaps_engine_and_clears_cache(self, qa_system, monkeypatch):
+        """測試版本變更時以新引擎替換（沿用嵌入模型、設定與查詢指標）並清除答案快取"""
+        monkeypatch.setattr(main, "vector_store_version", lambda vector_dir: "v2")
+        monkeypatch.setattr(main, "UnifiedQueryEngine", StubEngine)
+        qa_system.answer_cache.set("stale", {"answer": "old"})
+        old_engine = qa_system.rag_engine
+
+        assert qa_system.reload_if_vector_store_changed() is True
+
+        assert qa_system.rag_engine is not old_engine
+        assert qa_system.rag_engine.embeddings == "loaded-model"
+        # 查詢指標跨重新載入延續
+        assert qa_system.rag_engine.metrics is old_engine.metrics
+        assert qa_system.rag_engine.hybrid is True
+        assert qa_system.vector_count == 42
+        assert qa_system.answer_cache.get("stale") is None
+
+class StubQASystem:
+    """記錄預熱呼叫的模擬問答系統"""
+
+    def __init__(self, changed):
+        self.changed = changed
+        self.warm_calls = []
+
+    def warm_hot_answers(self, questions, k, include_llm):
+        self.warm_calls.append((list(questions), k, include_llm))
+        return len(questions)
+
+    def reload_if_vector_store_changed(self):
+        return self.changed
+
+class TestHotAnswerRefresher:
+    """測試預熱工作"""
+
+    def test_rewarms_only_after_version_change(self):
+        """測試只有在向量資料庫重新載入後才重算"""
+        unchanged = StubQASystem(changed=False)
+        changed = StubQASystem(changed=True)
+
+        assert HotAnswerRefresher(unchanged, ["CREM 是什麼？"], k=3, include_llm=True).refresh_once() is False
+        assert HotAnswerRefresher(changed, ["CREM 是什麼？"], k=3, include_llm=True).refresh_once() is True
+        assert unchanged.warm_calls == []
+        assert changed.warm_calls == [(["CREM 是什麼？"], 3, True)]
+
+    def test_background_thread_warms_on_start(self):
+        """測試啟動後在背景執行緒完成預先計算"""
+        system = StubQASystem(changed=False)
+        refresher = HotAnswerRefresher(system, ["CREM 是什麼？"], k=3, include_llm=False, refresh_interval=0)
+
+        refresher.start()
+        refresher.stop()
+
+        assert system.warm_calls == [(["CREM 是什麼？"], 3, False)]
+
+class RecordingEmbeddings:
+    """記錄編碼文字的模擬嵌入模型"""
+
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [0.0]
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [[0.0] for _ in texts]
+
+class RecordingEngine:
+    """記錄檢索呼叫的模擬查詢引擎"""
+
+    def __init__(self):
+        self.embeddings = RecordingEmbeddings()
+        self.calls = []
+
+    def query(self, question, k, filter_type):
+        self.calls.append((question, filter_type))
+        return []
+
+class SharingQASystem:
+    """記錄 LLM 計算次數與載入答案的模擬問答系統"""
+
+    def __init__(self, version="v1"):
+        self.rag_engine = StubEngine("index", version=version)
+        self.compute_calls = 0
+        self.loaded = {}
+
+    def compute_hot_answers(self, questions, k, include_llm):
+        self.compute_calls += 1
+        return {TrendMicroQASystem._request_key(question, "all", k): {"answer": f"{question} 的答案"}
+                for question in questions}
+
+    def load_hot_answers(self, answers):
+        self.loaded.update(answers)
+        return len(answers)
+
+class TestSharedHotAnswers:
+    """測試多 worker 共用熱門問題答案"""
+
+    def make_refresher(self, tmp_path, system, run_id="run-1"):
+        """建立使用共用目錄的預熱工作（每個實例各自開啟鎖檔，如同不同 worker）"""
+        store = SharedHotAnswerStore(str(tmp_path), run_id=run_id)
+        return HotAnswerRefresher(system, ["CREM 是什麼？", "CRI 是什麼？"], k=3, include_llm=True, store=store)
+
+    def test_only_leader_calls_llm_and_followers_load_its_answers(self, tmp_path):
+        """測試只有取得鎖的 worker 計算答案，其他 worker 載入相同答案"""
+        leader_system, follower_system = SharingQASystem(), SharingQASystem()
+        leader = self.make_refresher(tmp_path, leader_system)
+        follower = self.make_refresher(tmp_path, follower_system)
+
+        assert leader.warm() == 2
+        assert follower.warm() == 2
+
+        assert leader_system.compute_calls == 1
+        assert follower_system.compute_calls == 0
+        assert follower_system.loaded == leader_system.loaded
+        # 檔案未更新時不重複載入
+        assert follower.warm() == 0
+        leader.stop()
+
+    def test_followers_ignore_other_deploys_and_index_versions(self, tmp_path):
+        """測試不載入其他部署或其他索引版本的答案"""
+        leader = self.make_refresher(tmp_path, SharingQASystem(), run_id="old-deploy")
+        leader.warm()
+
+        other_deploy = self.make_refresher(tmp_path, SharingQASystem(), run_id="new-deploy")
+        other_version = self.make_refresher(tmp_path, SharingQASystem(version="v2"), run_id="old-deploy")
+
+        assert other_deploy.warm() == 0
+        assert other_version.warm() == 0
+        leader.stop()
+
+    def test_follower_takes_over_after_leader_stops(self, tmp_path):
+        """測試計算者停止（釋放鎖）後由其他 worker 接手計算"""
+        follower_system = SharingQASystem()
+        leader = self.make_refresher(tmp_path, SharingQASystem())
+        follower = self.make_refresher(tmp_path, follower_system)
+        leader.warm()
+        follower.warm()
+
+        leader.stop()
+        follower.warm()
+
+        assert follower.store.is_leader
+        assert follower_system.compute_calls == 1
+        follower.stop()
+
+class TestStartupWarmer:
+    """測試檢索路徑預熱"""
+
+    def test_warm_up_encodes_lengths_and_searches_each_type(self):
+        """測試以不同長度的文字編碼並對每種類型各檢索一次"""
+        system = TrendMicroQASystem.__new__(TrendMicroQASystem)
+        system.rag_engine = RecordingEngine()
+        system.table_engine = None
+
+        stats = system.warm_up(text_lengths=(2, 40), queries=("CREM",))
+
+        lengths = [len(text.split()) for text in system.rag_engine.embeddings.queries]
+        assert lengths[0] < lengths[1]
+        assert system.rag_engine.calls == [("CREM", "all"), ("CREM", "text"), ("CREM", "table")]
+        assert stats["searches"] == 3
+
+    def test_ready_after_run_and_callback_invoked(self):
+        """測試預熱結束後狀態為 ready 並呼叫 on_ready"""
+        calls = []
+
+        class System:
+            def warm_up(self, text_lengths, queries):
+                calls.append((text_lengths, queries))
+                return {"searches": 3}
+
+        warmer = StartupWarmer(System(), text_lengths=(8,), queries=("CREM",), on_ready=lambda: calls.append("ready"))
+        assert warmer.is_ready is False
+
+        warmer.run()
+
+        assert warmer.is_ready is True
+        assert warmer.get_stats() == {"status": "ready", "searches": 3}
+        assert calls == [((8,), ("CREM",)), "ready"]
+
+    def test_failure_still_marks_ready(self):
+        """測試預熱失敗時記錄錯誤但不阻擋流量"""
+        class System:
+            def warm_up(self, text_lengths, queries):
+                raise RuntimeError("model download failed")
+
+        warmer = StartupWarmer(System())
+        warmer.run()
+
+        assert warmer.is_ready is True
+        assert warmer.get_stats()["status"] == "failed"
+
+class TestHealthWhileWarming:
+    """測試預熱期間的健康檢查"""
+
+    def test_health_returns_503_until_warm(self, monkeypatch):
+        """測試預熱完成前 /health 回報 warming（503），完成後回報 200"""
+        from fastapi.testclient import TestClient
+        from core_app import app as api
+
+        class System:
+            rag_engine = None
+
+            def get_system_stats(self):
+                return {"system_type": "TrendMicroQASystem", "vector_count": 10}
+
+            def warm_up(self, text_lengths, queries):
+                return {}
+
+        warmer = StartupWarmer(System())
+        monkeypatch.setattr(api, "qa_system", System())
+        monkeypatch.setattr(api, "startup_warmer", warmer)
+        client = TestClient(api.app)
+
+        response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["status"] == "warming"
+
+        warmer.run()
+        response = client.get("/health")
+        assert response.status_code == 200
+        assert response.json()["status"] != "warming"